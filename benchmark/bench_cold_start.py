@@ -0,0 +1,123 @@
+"""
+量測容器冷啟動: 巡邏路徑的 import 時間 (與一次 import 全部模組比較), 以及啟動 main.py 後到第一輪巡邏送出 request
+與 /health 可以回應的時間. 超過門檻時 exit code 為 1, 可以放進 CI
+
+Usage:
+    python -m benchmark.bench_cold_start --runs 5 --max-first-patrol-ms 1500
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+from tools.mock_exchange import MockExchangeServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 冷啟動時巡邏需要的模組, 與改版前在第一輪巡邏前就全部 import 的模組
+LAZY_IMPORTS: str = "import strategy.binance_liquidation_shield"
+EAGER_IMPORTS: str = "import flask, aiohttp, numpy, strategy.binance_liquidation_shield, strategy.user_stream, strategy.position_table"
+
+
+def import_ms(statement: str) -> float:
+    """ 在新的 interpreter 內量 import 的耗時 """
+    code = f"import time; start = time.perf_counter(); {statement}; print((time.perf_counter() - start) * 1000)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def is_healthy(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def start_main(server: MockExchangeServer, timeout: float) -> dict:
+    """
+    啟動 main.py, 直到第一輪巡邏送出 request 且 /health 可以回應
+
+    Return:
+        first_patrol_ms (float): 啟動到第一個非對時的 request 抵達 mock server
+        healthy_ms (float): 啟動到 /health 回應 200
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "BINANCE_FUTURES_BASE_URL": server.base_url,
+        "BINANCE_SPOT_BASE_URL": server.base_url,
+        "BINANCE_API_KEY": "mock-api-key",
+        "BINANCE_SECRET_KEY": "mock-secret-key",
+        "LOG_LEVEL": "ERROR",
+        "PYTHONPATH": ROOT,
+    }
+    server.reset_counts()
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    result = {"first_patrol_ms": None, "healthy_ms": None}
+    try:
+        while None in result.values() and time.perf_counter() - start_time < timeout:
+            elapsed = (time.perf_counter() - start_time) * 1000
+            if result["first_patrol_ms"] is None and any(not path.endswith("/time") for path in list(server.call_counts)):
+                result["first_patrol_ms"] = elapsed
+            if result["healthy_ms"] is None and is_healthy(port):
+                result["healthy_ms"] = elapsed
+            time.sleep(0.005)
+    finally:
+        process.kill()
+        process.wait()
+
+    if None in result.values():
+        raise TimeoutError(f"main.py 在 {timeout} 秒內沒有完成啟動: {result}")
+    return result
+
+
+def run(args) -> dict:
+    lazy = statistics.median(import_ms(LAZY_IMPORTS) for _ in range(args.runs))
+    eager = statistics.median(import_ms(EAGER_IMPORTS) for _ in range(args.runs))
+
+    server = MockExchangeServer(port=free_port(), position_count=args.positions)
+    server.start()
+    try:
+        starts = [start_main(server, args.timeout) for _ in range(args.runs)]
+    finally:
+        server.stop()
+
+    return {
+        "lazy_import_ms": lazy,
+        "eager_import_ms": eager,
+        "first_patrol_ms": statistics.median(start["first_patrol_ms"] for start in starts),
+        "healthy_ms": statistics.median(start["healthy_ms"] for start in starts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the container entry point")
+    parser.add_argument("--runs", type=int, default=5, help="取中位數的次數")
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-first-patrol-ms", type=float, default=1500.0, help="啟動到第一輪巡邏超過此值視為退步")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(f"patrol path import: {result['lazy_import_ms']:.1f} ms  (eager import of all modules: {result['eager_import_ms']:.1f} ms)")
+    print(f"main.py start -> first patrol request: {result['first_patrol_ms']:.1f} ms")
+    print(f"main.py start -> /health ready: {result['healthy_ms']:.1f} ms")
+    sys.exit(1 if result["first_patrol_ms"] > args.max_first_patrol_ms else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+對本機 MockExchangeServer 跑 LiquidationShield._start_patrol, 量測每輪巡邏的 p50 / p99, 每輪 API 呼叫數,
+以及每輪 response 的大小與 JSON 解析耗時
+
+Usage:
+    python -m benchmark.bench_patrol --positions 50 --cycles 200 --latency-ms 20
+    python -m benchmark.bench_patrol --positions 50 --position-source position_risk --json-backend json
+    python -m benchmark.bench_patrol --spot-balance 0 --liquidity-reserve
+"""
+import os
+import time
+import argparse
+
+from decimal import Decimal
+from collections import Counter
+
+from tools.mock_exchange import MockExchangeServer
+
+
+def percentile(values: list, ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def metric_total(metric) -> float:
+    return sum(metric._merged().values())
+
+
+def build_shield(server: MockExchangeServer, no_rate_limit: bool):
+    """ 指向 mock server 後才建立 LiquidationShield, 讓 gateway 讀到覆寫的 base URL """
+
+    os.environ["BINANCE_FUTURES_BASE_URL"] = server.base_url
+    os.environ["BINANCE_SPOT_BASE_URL"] = server.base_url
+    os.environ.setdefault("BINANCE_API_KEY", "mock-api-key")
+    os.environ.setdefault("BINANCE_SECRET_KEY", "mock-secret-key")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    from gateway.rate_limiter import RateLimiter
+    from strategy.binance_liquidation_shield import LiquidationShield
+
+    shield = LiquidationShield()
+    if no_rate_limit:
+        limiter = RateLimiter({name: 10 ** 12 for name in shield.feature_http_client.rate_limiter.buckets})
+        for client in (shield.feature_http_client, shield.spot_http_client, shield.async_spot_http_client):
+            client.rate_limiter = limiter
+    return shield
+
+
+def run(args) -> dict:
+    server = MockExchangeServer(
+        port=args.port,
+        position_count=args.positions,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        volatility=args.volatility,
+        spot_balance=Decimal(str(args.spot_balance)),
+    )
+    server.start()
+
+    try:
+        os.environ["POSITION_SOURCE"] = args.position_source
+        os.environ["JSON_BACKEND"] = args.json_backend
+        os.environ["LIQUIDITY_RESERVE"] = "true" if args.liquidity_reserve else "false"
+        shield = build_shield(server, args.no_rate_limit)
+        if shield.liquidity_reserve is not None:
+            # 先補足一次浮存, 量測的是浮存已就緒之後的巡邏
+            shield.liquidity_reserve.observe_positions(shield._fetch_positions())
+            shield.liquidity_reserve.rebalance()
+
+        from utils import fast_json
+        from utils.metrics import GATEWAY_RESPONSE_BYTES, GATEWAY_DECODE_SECONDS
+        start_bytes, start_decode = metric_total(GATEWAY_RESPONSE_BYTES), metric_total(GATEWAY_DECODE_SECONDS)
+
+        durations, errors = [], 0
+        calls = Counter()
+        for _ in range(args.cycles):
+            server.reset_counts()
+            start_time = time.perf_counter()
+            try:
+                shield._start_patrol()
+            except Exception:
+                errors += 1
+            durations.append(time.perf_counter() - start_time)
+            calls.update(server.call_counts)
+
+        shield.async_runner.run(shield.async_spot_http_client.close())
+        return {
+            "cycles": args.cycles,
+            "errors": errors,
+            "p50_ms": percentile(durations, 0.50) * 1000,
+            "p99_ms": percentile(durations, 0.99) * 1000,
+            "calls_per_cycle": sum(calls.values()) / args.cycles,
+            "calls_by_path": {path: count / args.cycles for path, count in sorted(calls.items())},
+            "connections": shield.feature_http_client.connection_stats(),
+            "json_backend": fast_json.BACKEND,
+            "bytes_per_cycle": (metric_total(GATEWAY_RESPONSE_BYTES) - start_bytes) / args.cycles,
+            "decode_ms_per_cycle": (metric_total(GATEWAY_DECODE_SECONDS) - start_decode) / args.cycles * 1000,
+        }
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end patrol benchmark against the local mock exchange")
+    parser.add_argument("--port", type=int, default=9800)
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--volatility", type=float, default=0.01)
+    parser.add_argument("--position-source", choices=("account", "position_risk"), default="account")
+    parser.add_argument("--json-backend", choices=("auto", "json"), default="auto", help="json: 不使用 orjson")
+    parser.add_argument("--spot-balance", type=float, default=100000, help="現貨帳戶初始 USDT, 0 代表每次增加保證金都要贖回活存")
+    parser.add_argument("--liquidity-reserve", action="store_true", help="啟用背景浮存, 增加保證金時不需要查詢三道防線")
+    parser.add_argument("--no-rate-limit", action="store_true", help="不受 client 端限流影響, 只量測程式本身")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(f"cycles: {result['cycles']}  errors: {result['errors']}")
+    print(f"cycle p50: {result['p50_ms']:.2f} ms  p99: {result['p99_ms']:.2f} ms")
+    print(f"calls per cycle: {result['calls_per_cycle']:.2f}")
+    for path, count in result["calls_by_path"].items():
+        print(f"  {path:<45} {count:.2f}")
+    print(f"response bytes per cycle: {result['bytes_per_cycle']:.0f}  decode ({result['json_backend']}): {result['decode_ms_per_cycle']:.3f} ms / cycle")
+    print(f"futures connections: {result['connections']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+比較每輪重建所有 Position 與 IncrementalPositionBook 只重算變動倉位, 在不同倉位數與變動比例下的每輪計算時間
+
+Usage:
+    python -m benchmark.bench_position_book
+"""
+import random
+import timeit
+
+from benchmark.bench_position_table import BUFFER_AMOUNT, ADJUSTMENT_THRESHOLD, make_positions, select_with_list
+from strategy.position_book import IncrementalPositionBook
+
+POSITION_COUNTS = (100, 1_000, 10_000)
+CHURN_RATIOS = (0.0, 0.01, 0.1, 1.0)
+
+
+def make_snapshots(positions: list, churn: float, count: int, seed: int=0) -> list:
+    """ 產生連續的快照, 每個快照有 churn 比例的倉位 unrealizedProfit 變動 """
+
+    rng = random.Random(seed)
+    snapshots, current = [], [dict(position) for position in positions]
+    changes = int(len(positions) * churn)
+    for _ in range(count):
+        current = list(current)
+        for index in rng.sample(range(len(current)), changes):
+            current[index] = {**current[index], "unrealizedProfit": f"{rng.uniform(-500, 500):.8f}"}
+        snapshots.append(current)
+    return snapshots
+
+
+def main():
+    print(f"{'positions':>10} {'churn':>7} {'rebuild (ms)':>13} {'incremental (ms)':>17} {'speedup':>8}")
+
+    for count in POSITION_COUNTS:
+        positions = make_positions(count)
+        number = max(5, 20_000 // count)
+        for churn in CHURN_RATIOS:
+            snapshots = make_snapshots(positions, churn, number)
+
+            # 確認結果與每輪重建相同
+            book = IncrementalPositionBook(BUFFER_AMOUNT, ADJUSTMENT_THRESHOLD)
+            for snapshot in snapshots[:3]:
+                book.update(snapshot)
+                key = lambda position: position.symbol
+                assert sorted(book.positions_for_adjustment(), key=key) == sorted(select_with_list(snapshot), key=key)
+
+            rebuild_ms = timeit.timeit(lambda: [select_with_list(snapshot) for snapshot in snapshots], number=1) / number * 1000
+
+            book = IncrementalPositionBook(BUFFER_AMOUNT, ADJUSTMENT_THRESHOLD)
+            book.update(positions)
+            incremental_ms = timeit.timeit(
+                lambda: [(book.update(snapshot), book.positions_for_adjustment()) for snapshot in snapshots], number=1) / number * 1000
+
+            print(f"{count:>10} {churn:>7.0%} {rebuild_ms:>13.3f} {incremental_ms:>17.3f} {rebuild_ms / incremental_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
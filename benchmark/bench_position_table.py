@@ -0,0 +1,72 @@
+"""
+比較 Position list 與 NumPy PositionTable 在不同倉位數量下的每輪計算時間
+
+Usage:
+    python -m benchmark.bench_position_table
+"""
+import random
+import timeit
+
+from decimal import Decimal
+
+from strategy.position import Position
+from strategy.position_table import PositionTable
+
+BUFFER_AMOUNT = Decimal("1.0")
+ADJUSTMENT_THRESHOLD = Decimal("3.0")
+POSITION_COUNTS = (10, 100, 1_000, 10_000)
+
+
+def make_positions(count: int, seed: int=0) -> list:
+    """ 產生 get_account_information_v2 格式的假倉位 """
+
+    rng = random.Random(seed)
+    positions = []
+    for index in range(count):
+        positions.append({
+            "symbol": f"COIN{index}USDT",
+            "positionAmt": f"{rng.uniform(-50, 50):.3f}",
+            "isolatedWallet": f"{rng.uniform(0, 5000):.8f}",
+            "initialMargin": f"{rng.uniform(0, 5000):.8f}",
+            "unrealizedProfit": f"{rng.uniform(-500, 500):.8f}",
+            "markPrice": f"{rng.uniform(0.01, 70000):.8f}",
+        })
+    return positions
+
+
+def select_with_list(positions: list) -> list:
+    my_positions = [
+        Position.from_account_position(position, BUFFER_AMOUNT)
+        for position in positions if Decimal(position["positionAmt"]) != 0]
+    return [position for position in my_positions if position.adjustment_limit > ADJUSTMENT_THRESHOLD]
+
+
+def select_with_table(positions: list) -> list:
+    table = PositionTable.from_account_positions(positions)
+    evaluation = table.evaluate(BUFFER_AMOUNT, ADJUSTMENT_THRESHOLD)
+    return table.to_positions(evaluation, evaluation["above_threshold"])
+
+
+def select_with_table_compute_only(table: PositionTable):
+    """ 只量整欄運算, 不含解析與 Decimal 轉換 """
+    return table.evaluate(BUFFER_AMOUNT, ADJUSTMENT_THRESHOLD)
+
+
+def main():
+    print(f"{'positions':>10} {'list (ms)':>12} {'table (ms)':>12} {'compute (ms)':>14}")
+
+    for count in POSITION_COUNTS:
+        positions = make_positions(count)
+        assert select_with_list(positions) == select_with_table(positions)
+
+        table = PositionTable.from_account_positions(positions)
+        number = max(1, 10_000 // count)
+        list_ms = timeit.timeit(lambda: select_with_list(positions), number=number) / number * 1000
+        table_ms = timeit.timeit(lambda: select_with_table(positions), number=number) / number * 1000
+        compute_ms = timeit.timeit(lambda: select_with_table_compute_only(table), number=number) / number * 1000
+
+        print(f"{count:>10} {list_ms:>12.3f} {table_ms:>12.3f} {compute_ms:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+量測每個 request 都會經過的簽名路徑: BinanceHttp._sign / _build_request 與 BybitHttp._gen_signature,
+並與改版前的寫法 (每次 hmac.new, 修改 params, 重建 headers) 比較. 目前的寫法比舊寫法慢時 exit code 為 1, 可以放進 CI
+
+Usage:
+    python -m benchmark.bench_signing --number 20000
+"""
+import os
+import sys
+import hmac
+import timeit
+import hashlib
+import argparse
+import urllib.parse
+
+from decimal import Decimal
+
+
+def legacy_sign(secret_key: str, query_str: str) -> str:
+    return str(hmac.new(secret_key.encode('utf8'), query_str.encode("utf-8"), hashlib.sha256).hexdigest())
+
+
+def legacy_build_request(client, path: str, params: dict):
+    url = client.BASE_URL + path
+    for param in list(params.keys()):
+        if params[param] == True:
+            params[param] = "true"
+        elif params[param] == False:
+            params[param] = "false"
+    query_str = urllib.parse.urlencode(params)
+    if params:
+        url += f'?{query_str}&signature={legacy_sign(client.SECRET_KEY, query_str)}'
+    return url, {"X-MBX-APIKEY": client.API_KEY}
+
+
+def legacy_gen_signature(client, payload: str, time_stamp: str) -> str:
+    param_str = f"{time_stamp}{client.API_KEY}{client.recv_window}{payload}"
+    return hmac.new(bytes(client.API_SECRET, "utf-8"), param_str.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def measure(function, number: int, repeat: int) -> float:
+    """ 回傳每次呼叫的最佳耗時 (µs) """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+
+def run(args) -> list:
+    os.environ.setdefault("BINANCE_API_KEY", "bench-api-key")
+    os.environ.setdefault("BINANCE_SECRET_KEY", "bench-secret-key-" + "x" * 48)
+    os.environ.setdefault("BYBIT_API_KEY", "bench-api-key")
+    os.environ.setdefault("BYBIT_API_SECRET", "bench-secret-key-" + "x" * 48)
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    from gateway.binance_api import BinanceUSDFeatureHttp
+    from gateway.bybit_api import BybitHttp
+
+    binance = BinanceUSDFeatureHttp()
+    bybit = BybitHttp()
+    path = "/fapi/v1/positionMargin"
+    # type=2: 舊寫法會把 == True 的值 (1, Decimal("1")) 誤轉成 "true", 比較時避開
+    params = {"symbol": "BTCUSDT", "amount": Decimal("12.34567890"), "type": 2, "timestamp": "1700000000000", "recvWindow": 5000}
+    query_str = urllib.parse.urlencode(params)
+    payload = "category=linear&settleCoin=USDT"
+
+    # 確認兩種寫法結果一致
+    assert binance._sign(query_str) == legacy_sign(binance.SECRET_KEY, query_str)
+    assert binance._build_request(path, params)[0] == legacy_build_request(binance, path, dict(params))[0]
+    assert bybit._gen_signature(payload, "1700000000000") == legacy_gen_signature(bybit, payload, "1700000000000")
+
+    cases = [
+        ("BinanceHttp._sign",
+            lambda: legacy_sign(binance.SECRET_KEY, query_str),
+            lambda: binance._sign(query_str)),
+        ("BinanceHttp._build_request",
+            lambda: legacy_build_request(binance, path, dict(params)),
+            lambda: binance._build_request(path, params)),
+        ("BybitHttp._gen_signature",
+            lambda: legacy_gen_signature(bybit, payload, "1700000000000"),
+            lambda: bybit._gen_signature(payload, "1700000000000")),
+    ]
+
+    results = []
+    for name, legacy, current in cases:
+        legacy_us = measure(legacy, args.number, args.repeat)
+        current_us = measure(current, args.number, args.repeat)
+        results.append({"name": name, "legacy_us": legacy_us, "current_us": current_us, "speedup": legacy_us / current_us})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the request signing path")
+    parser.add_argument("--number", type=int, default=20000, help="每輪呼叫次數")
+    parser.add_argument("--repeat", type=int, default=5, help="取最佳的輪數")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="speedup 低於此值視為退步")
+    args = parser.parse_args()
+
+    regressed = False
+    print(f"{'case':<30} {'legacy µs':>10} {'current µs':>11} {'speedup':>8}")
+    for result in run(args):
+        print(f"{result['name']:<30} {result['legacy_us']:>10.2f} {result['current_us']:>11.2f} {result['speedup']:>7.2f}x")
+        regressed |= result["speedup"] < args.tolerance
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
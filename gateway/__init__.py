@@ -1,2 +1,13 @@
 from .binance_api import BinanceSpotHttp
-from .binance_api import BinanceUSDFeatureHttp
\ No newline at end of file
+from .binance_api import BinanceUSDFeatureHttp
+from .exceptions import GatewayError, RetryableError, FatalError, CircuitOpenError
+
+# asyncio 版本依賴 aiohttp (import 約 0.2 秒), 只有用到時才載入, 縮短冷啟動
+_ASYNC_EXPORTS: set = {"AsyncBinanceSpotHttp", "AsyncBinanceUSDFeatureHttp", "AsyncGatewayRunner"}
+
+
+def __getattr__(name: str):
+    if name in _ASYNC_EXPORTS:
+        from . import binance_async_api
+        return getattr(binance_async_api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -5,6 +5,16 @@ import urllib
 import hashlib
 import requests
 
+from requests.adapters import HTTPAdapter
+from gateway.rate_limiter import RateLimiter, DEFAULT_RATE_LIMITER
+from gateway.cache import ResponseCache
+from gateway.clock import ServerClock, get_clock
+from gateway.journal import GatewayJournal, ReplayTransport, get_journal, get_replay
+from gateway.retry import call_with_retry, policy_for, get_breaker, classify_requests_error
+from gateway.exceptions import GatewayError, RetryableError, RateLimitedError, TimestampError, FatalError
+from utils.metrics import GATEWAY_LATENCY, GATEWAY_RESPONSES, GATEWAY_RESPONSE_BYTES, GATEWAY_DECODE_SECONDS
+from utils import fast_json
+from utils.logger import get_logger
 from decimal import Decimal
 from enum import Enum
 from dotenv import load_dotenv
@@ -13,9 +23,12 @@ load_dotenv()
 # Ref: https://stackoverflow.com/questions/28521535/requests-how-to-disable-bypass-proxy
 os.environ['NO_PROXY'] = '*'
 
+logger = get_logger("gateway.binance")
+
 # default setting
-TRY_COUNTS: int = 1
+TRY_COUNTS: int = None  # None 代表依 endpoint 的 RetryPolicy
 API_TIMEOUT: int = 5
+POOL_SIZE: int = int(os.getenv("BINANCE_POOL_SIZE", "10"))
 
 class OrderStatus(Enum):
     NEW = "NEW"
@@ -53,69 +66,231 @@ class AcountType(Enum):
     FUND = "FUND"
 
 
+# 請求被拒絕, 確定沒有執行, 可以安全重送
+REJECTED_CODES: set = {-1008}
+# 執行狀態未知, 只有冪等的 request 可以重送
+UNKNOWN_EXECUTION_CODES: set = {-1000, -1001, -1006, -1007}
+
+
+def classify_binance_error(path: str, status_code: int, result) -> GatewayError:
+    """
+    依 HTTP status 與 Binance 錯誤代碼分類
+    Ref: https://binance-docs.github.io/apidocs/futures/en/#error-codes
+    """
+    code = result.get("code") if isinstance(result, dict) else None
+    message = result.get("msg", "") if isinstance(result, dict) else str(result)
+
+    if status_code in (429, 418) or code in (-1003, -1015):
+        return RateLimitedError("binance", path, status_code, code, message)
+    if code == -1021:
+        return TimestampError("binance", path, status_code, code, message)
+    if code in REJECTED_CODES:
+        return RetryableError("binance", path, status_code, code, message)
+    if code in UNKNOWN_EXECUTION_CODES or status_code >= 500:
+        return RetryableError("binance", path, status_code, code, message, maybe_executed=True)
+    return FatalError("binance", path, status_code, code, message)
+
+
+def _encode_value(value) -> str:
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return urllib.parse.quote_plus(str(value))
+
+
 class BinanceHttp(object):
     """
     Documentation: https://binance-docs.github.io/apidocs/futures/en/#change-log
     """
 
-    def __init__(self):
-        self.timeout: int = API_TIMEOUT
-        self.try_counts: int = TRY_COUNTS
-    
-    def _request(self, req_method: RequestMethod, path: str, params: dict=None):
+    def __init__(self, timeout: int=API_TIMEOUT, try_counts: int=TRY_COUNTS, pool_size: int=POOL_SIZE, rate_limiter: RateLimiter=None):
+        self.timeout: int = timeout
+        self.try_counts: int = try_counts
+        self.rate_limiter: RateLimiter = rate_limiter or DEFAULT_RATE_LIMITER
+        self.response_cache: ResponseCache = None
+        self.clock: ServerClock = None
+        self.journal: GatewayJournal = get_journal()
+        self.replay: ReplayTransport = get_replay()
+
+        # 每個 instance 持有自己的 keep-alive 連線池, 避免每次 request 都重新 TCP + TLS handshake
+        self.pool_size: int = pool_size
+        self.http_client = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http_client.mount("https://", adapter)
+        self.http_client.mount("http://", adapter)
+        self.http_client.headers.update({
+            "Accept-Encoding": "gzip",
+            "Connection": "keep-alive",
+        })
+        self._prepare_signing()
+
+    def _prepare_signing(self):
+        """ 預先建好已帶入 key 的 HMAC 與 headers, 每次 request 只需要 copy / 重用 """
+
+        secret_key = getattr(self, "SECRET_KEY", None)
+        self.signer = hmac.new(secret_key.encode("utf8"), digestmod=hashlib.sha256) if secret_key else None
+        self.headers: dict = {"X-MBX-APIKEY": getattr(self, "API_KEY", None)}
+
+    def connection_stats(self) -> dict:
+        """
+        連線池使用狀況, 用來確認 margin 調整的 critical path 上已沒有 handshake 成本
 
-        url = self.BASE_URL + path
+        Return:
+            requests (int): 總共送出的 request 數
+            new_connections (int): 新建立的連線數 (每一條都要付一次 handshake)
+            reused_connections (int): 重用既有連線的 request 數
+        """
+        num_requests, num_connections = 0, 0
+        for adapter in set(self.http_client.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+
+        return {
+            "requests": num_requests,
+            "new_connections": num_connections,
+            "reused_connections": num_requests - num_connections,
+        }
 
-        for param in list(params.keys()):
-            if params[param] == True:
-                params[param] = "true"
-            elif params[param] == False:
-                params[param] = "false"
+    def close(self):
+        self.http_client.close()
+    
+    def _build_request(self, path: str, params: dict=None):
+        """ 組出簽名後的 url 與 headers, sync / async 兩種 client 共用同一套簽名邏輯 """
 
-        query_str = urllib.parse.urlencode(params)
+        if not params:
+            return self.BASE_URL + path, self.headers
 
-        if params:
-            signature = self._sign(query_str)
-            url += f'?{query_str}&signature={signature}'
+        query_str = self._encode_params(params)
+        return f"{self.BASE_URL}{path}?{query_str}&signature={self._sign(query_str)}", self.headers
 
-        headers = {
-            "X-MBX-APIKEY": self.API_KEY
-        }
+    @staticmethod
+    def _encode_params(params: dict) -> str:
+        """
+        與 urllib.parse.urlencode 相同的結果, 但不修改呼叫端的 params, 速度約快一倍.
+        key 都是 API 定義的參數名稱, 不需要 quote. bool 用 is 判斷, 避免 Decimal("1") == True 被轉成 "true"
+        """
+        return "&".join([f"{key}={_encode_value(value)}" for key, value in params.items()])
 
-        for _ in range(self.try_counts):
+    def _on_success(self, req_method: RequestMethod, path: str, params: dict, result):
+        """ request 成功後更新快取, 不影響 request 本身的結果 """
 
-            try:
-                response = requests.request(req_method.value, url=url, headers=headers, timeout=self.timeout)
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    print(response.json(), response.status_code)
+        if self.response_cache is None:
+            return
 
-            except Exception as error:
-                print(f"请求:{path}, 发生了错误: {error}")
-                time.sleep(1.5)
+        try:
+            if req_method == RequestMethod.GET:
+                self.response_cache.set(path, params, result)
+            else:
+                self.response_cache.on_mutation(path, params)
+        except Exception as error:
+            logger.warning(f"更新快取:{path}, 发生了错误: {error}")
+            self.response_cache.invalidate()
+
+    def _request(self, req_method: RequestMethod, path: str, params: dict=None):
 
-        return None
+        if self.response_cache is not None and req_method == RequestMethod.GET:
+            cached = self.response_cache.get(path, params)
+            if cached is not None:
+                return cached
+
+        send = lambda: self._send(req_method, path, params)
+        if self.journal is not None:
+            send = self.journal.wrap(send, "binance", req_method.value, path, params)
+
+        return call_with_retry(
+            send,
+            policy_for(req_method.value, path, self.try_counts),
+            get_breaker(self.BASE_URL),
+            venue="binance",
+            endpoint=path,
+            before_retry=self._before_retry,
+        )
+
+    def _send(self, req_method: RequestMethod, path: str, params: dict):
+        """ 送出一次 request, 失敗時 raise GatewayError, 由 call_with_retry 決定是否重送 """
+
+        if self.replay is not None:
+            result = self.replay.send("binance", req_method.value, path, params)
+            self._on_success(req_method, path, params, result)
+            return result
+
+        # 排隊等待額度後才簽名, 避免 timestamp 在等待期間過期
+        self.rate_limiter.acquire(path)
+        url, headers = self._build_request(path, self._refresh_timestamp(params))
+        try:
+            with GATEWAY_LATENCY.time(venue="binance", endpoint=path):
+                response = self.http_client.request(req_method.value, url=url, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as error:
+            GATEWAY_RESPONSES.inc(venue="binance", endpoint=path, status="error")
+            raise classify_requests_error("binance", path, error) from error
+
+        GATEWAY_RESPONSES.inc(venue="binance", endpoint=path, status=str(response.status_code))
+        self.rate_limiter.update(path, response.status_code, response.headers)
+        result = self._decode(path, response.content)
+
+        if response.status_code == 200:
+            self._on_success(req_method, path, params, result)
+            return result
+
+        logger.warning(f"请求:{path}, 回应异常", extra={"status": response.status_code, "response": result})
+        raise classify_binance_error(path, response.status_code, result)
+
+    @staticmethod
+    def _decode(path: str, body: bytes):
+        """ 解析 response body 並記錄大小與耗時, 不是 JSON 時保留前 200 bytes 作為錯誤訊息 """
+
+        start_time = time.perf_counter()
+        try:
+            result = fast_json.loads(body)
+        except ValueError:
+            result = {"msg": body[:200].decode("utf-8", "replace")}
+        GATEWAY_DECODE_SECONDS.inc(time.perf_counter() - start_time, venue="binance", endpoint=path)
+        GATEWAY_RESPONSE_BYTES.inc(len(body), venue="binance", endpoint=path)
+        return result
+
+    def _before_retry(self, error: GatewayError):
+        # timestamp 超出 recvWindow, 重新對時後再送
+        if isinstance(error, TimestampError) and self.clock is not None:
+            self.clock.sync()
+
+    def _refresh_timestamp(self, params: dict) -> dict:
+        """ 回傳帶有最新 timestamp 的新 dict, 呼叫端的 params 保持不變, 重送時也不會殘留上一次的值 """
+        if "timestamp" not in params:
+            return params
+        if self.clock is not None:
+            return {**params, "timestamp": self._get_current_timestamp(), "recvWindow": self.clock.recv_window}
+        return {**params, "timestamp": self._get_current_timestamp()}
 
     def _get_current_timestamp(self) -> str:
+        if self.clock is not None:
+            return str(self.clock.now_ms())
         return str(int(time.time() * 1000))
 
+
     def _sign(self, query_str: str) -> str:
-        hex_digest = hmac.new(
-            self.SECRET_KEY.encode('utf8'), query_str.encode("utf-8"), hashlib.sha256).hexdigest()
-        return str(hex_digest)
+        signer = self.signer.copy()
+        signer.update(query_str.encode("utf-8"))
+        return signer.hexdigest()
 
 
 class BinanceUSDFeatureHttp(BinanceHttp):
 
-    def __init__(self, timeout: int=API_TIMEOUT, try_counts: int=TRY_COUNTS):
+    def __init__(
+        self, timeout: int=API_TIMEOUT, try_counts: int=TRY_COUNTS, pool_size: int=POOL_SIZE, rate_limiter: RateLimiter=None,
+        api_key: str=None, secret_key: str=None):
 
-        self.API_KEY: str = os.getenv("BINANCE_API_KEY")
-        self.SECRET_KEY: str = os.getenv("BINANCE_SECRET_KEY")
-        self.BASE_URL: str = "https://fapi.binance.com"
+        # 多帳戶時由呼叫端帶入各自的 key, 沒給就讀環境變數
+        self.API_KEY: str = api_key or os.getenv("BINANCE_API_KEY")
+        self.SECRET_KEY: str = secret_key or os.getenv("BINANCE_SECRET_KEY")
+        self.BASE_URL: str = os.getenv("BINANCE_FUTURES_BASE_URL", "https://fapi.binance.com")
 
-        self.timeout: int = timeout
-        self.try_counts: int = try_counts
+        super().__init__(timeout=timeout, try_counts=try_counts, pool_size=pool_size, rate_limiter=rate_limiter)
+        # replay 不可以碰網路, 對時會打真的 /fapi/v1/time
+        self.clock = get_clock(self.BASE_URL, "/fapi/v1/time") if self.replay is None else None
     
     def get_account_information_v2(self):
         """ 账户信息V2 (USER_DATA) """
@@ -129,7 +304,72 @@ class BinanceUSDFeatureHttp(BinanceHttp):
 
         return self._request(method, path, params)
 
-    def modify_isolated_position_margin(self, symbol: str, amount: Decimal, type: int):
+    def get_position_risk(self, **kwargs):
+        """
+        用户持仓风险V3 (USER_DATA): 只回传有持仓或挂单的交易对, 比账户信息V2 小很多
+
+        Args:
+            symbol (str): 只查询单一交易对
+        """
+
+        path = "/fapi/v3/positionRisk"
+        method = RequestMethod.GET
+
+        params = {
+            "timestamp": self._get_current_timestamp(),
+        }
+        for param in kwargs:
+            params[param] = kwargs[param]
+
+        return self._request(method, path, params)
+
+    def get_positions_snapshot(self, **kwargs) -> list:
+        """
+        只有持仓的精简快照, 栏位名称转换成 get_account_information_v2 的 positions 格式, 策略可以直接替换使用
+
+        Args:
+            symbol (str): 只查询单一交易对
+
+        Return:
+            positions (list): positionAmt 不为 0 的仓位
+        """
+        positions = []
+        for position in self.get_position_risk(**kwargs):
+            if float(position["positionAmt"]) == 0: # 只有挂单的交易对
+                continue
+            if "unRealizedProfit" in position:
+                position["unrealizedProfit"] = position.pop("unRealizedProfit")
+            positions.append(position)
+        return positions
+
+    def get_leverage_bracket(self, **kwargs):
+        """
+        杠杆分层标准 (USER_DATA): 各交易对每一层的名义价值上下限, 维持保证金率与速算数
+
+        Args:
+            symbol (str): 只查询单一交易对
+        """
+
+        path = "/fapi/v1/leverageBracket"
+        method = RequestMethod.GET
+
+        params = {
+            "timestamp": self._get_current_timestamp(),
+        }
+        for param in kwargs:
+            params[param] = kwargs[param]
+
+        return self._request(method, path, params)
+
+    def get_mark_prices(self):
+        """ 最新标记价格和资金费率 (MARKET_DATA): 不带 symbol 时回传所有交易对, 不需要签名 """
+
+        path = "/fapi/v1/premiumIndex"
+        method = RequestMethod.GET
+
+        return self._request(method, path, {})
+
+    def modify_isolated_position_margin(self, symbol: str, amount: Decimal, type: int, **kwargs):
         """ 
         调整逐仓保证金 (TRADE): 针对逐仓模式下的仓位，调整其逐仓保证金资金。
 
@@ -137,6 +377,7 @@ class BinanceUSDFeatureHttp(BinanceHttp):
             type (int): 调整方向
                 - 1: 增加逐仓保证金
                 - 2: 减少逐仓保证金
+            positionSide (str): 双向持仓模式下为 LONG / SHORT
         """
 
         path = "/fapi/v1/positionMargin"
@@ -149,19 +390,50 @@ class BinanceUSDFeatureHttp(BinanceHttp):
             "timestamp": self._get_current_timestamp(),
         }
 
+        for param in list(kwargs.keys()):
+            params[param] = kwargs[param]
+
         return self._request(method, path, params)
 
+    def new_listen_key(self):
+        """ 生成listenKey (USER_STREAM): 创建一个新的user data stream, 有效期为60分钟 """
+
+        path = "/fapi/v1/listenKey"
+        method = RequestMethod.POST
+
+        return self._request(method, path, {})
+
+    def keepalive_listen_key(self):
+        """ 延长listenKey有效期 (USER_STREAM): 有效期延长至本次调用后60分钟, 建议每30分钟发送一次 """
+
+        path = "/fapi/v1/listenKey"
+        method = RequestMethod.PUT
+
+        return self._request(method, path, {})
+
+    def close_listen_key(self):
+        """ 关闭listenKey (USER_STREAM) """
+
+        path = "/fapi/v1/listenKey"
+        method = RequestMethod.DELETE
+
+        return self._request(method, path, {})
+
 
 class BinanceSpotHttp(BinanceHttp):
     
-    def __init__(self, timeout: int=API_TIMEOUT, try_counts: int=TRY_COUNTS):
+    def __init__(
+        self, timeout: int=API_TIMEOUT, try_counts: int=TRY_COUNTS, pool_size: int=POOL_SIZE, rate_limiter: RateLimiter=None,
+        api_key: str=None, secret_key: str=None):
 
-        self.API_KEY: str = os.getenv("BINANCE_API_KEY")
-        self.SECRET_KEY: str = os.getenv("BINANCE_SECRET_KEY")
-        self.BASE_URL: str = "https://api.binance.com"
+        # 多帳戶時由呼叫端帶入各自的 key, 沒給就讀環境變數
+        self.API_KEY: str = api_key or os.getenv("BINANCE_API_KEY")
+        self.SECRET_KEY: str = secret_key or os.getenv("BINANCE_SECRET_KEY")
+        self.BASE_URL: str = os.getenv("BINANCE_SPOT_BASE_URL", "https://api.binance.com")
 
-        self.timeout: int = timeout
-        self.try_counts: int = try_counts
+        super().__init__(timeout=timeout, try_counts=try_counts, pool_size=pool_size, rate_limiter=rate_limiter)
+        # replay 不可以碰網路, 對時會打真的 /api/v3/time
+        self.clock = get_clock(self.BASE_URL, "/api/v3/time") if self.replay is None else None
 
     def get_flexible_product_position(self, **kwargs):
         """ 获取活期产品持仓(USER_DATA) """
@@ -194,6 +466,23 @@ class BinanceSpotHttp(BinanceHttp):
 
         return self._request(method, path, params)
     
+    def subscribe_flexible_product(self, productId, amount: Decimal, **kwargs):
+        """ 申购活期产品 (TRADE) """
+
+        path = "/sapi/v1/simple-earn/flexible/subscribe"
+        method = RequestMethod.POST
+
+        params = {
+            "timestamp": self._get_current_timestamp(),
+            "productId": productId,
+            "amount": str(amount),
+        }
+
+        for param in list(kwargs.keys()):
+            params[param] = kwargs[param]
+
+        return self._request(method, path, params)
+
     def new_future_account_transfer(self, asset: str, amount: Decimal, type: int):
         """ 合约资金划转 (USER_DATA): 执行现货账户与合约账户之间的划转 
         
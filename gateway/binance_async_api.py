@@ -0,0 +1,172 @@
+import time
+import asyncio
+import threading
+import aiohttp
+
+from gateway.binance_api import BinanceHttp, BinanceUSDFeatureHttp, BinanceSpotHttp
+from gateway.binance_api import RequestMethod, API_TIMEOUT, TRY_COUNTS, POOL_SIZE, classify_binance_error
+from gateway.rate_limiter import RateLimiter, DEFAULT_RATE_LIMITER
+from gateway.journal import get_journal, get_replay
+from gateway.retry import call_with_retry_async, policy_for, get_breaker
+from gateway.exceptions import GatewayError, RetryableError, TimestampError
+from utils.metrics import GATEWAY_LATENCY, GATEWAY_RESPONSES
+from utils.logger import get_logger
+
+logger = get_logger("gateway.binance_async")
+
+
+class AsyncBinanceHttp(BinanceHttp):
+    """
+    asyncio 版本的 BinanceHttp, 簽名與 params 處理沿用 BinanceHttp._build_request,
+    只有送出 request 的部分換成 aiohttp, 讓多個 request 可以同時送出
+    """
+
+    def __init__(self, timeout: int=API_TIMEOUT, try_counts: int=TRY_COUNTS, pool_size: int=POOL_SIZE, rate_limiter: RateLimiter=None):
+        self.timeout: int = timeout
+        self.try_counts: int = try_counts
+        self.rate_limiter: RateLimiter = rate_limiter or DEFAULT_RATE_LIMITER
+        self.response_cache = None
+        self.pool_size: int = pool_size
+
+        # aiohttp 的 session 必須在 event loop 裡建立, 所以等第一次 request 再建立
+        self.http_client: aiohttp.ClientSession = None
+        self.num_requests: int = 0
+        self.num_connections: int = 0
+        self.journal = get_journal()
+        self.replay = get_replay()
+        self._prepare_signing()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.http_client is None or self.http_client.closed:
+            # aiohttp 沒有連線池統計, 以 trace 記錄新建立的連線
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            self.http_client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Accept-Encoding": "gzip"},
+                trace_configs=[trace_config],
+            )
+        return self.http_client
+
+    async def _on_connection_created(self, session, context, params):
+        self.num_connections += 1
+
+    def connection_stats(self) -> dict:
+        """ 與 BinanceHttp.connection_stats 相同的欄位 """
+        return {
+            "requests": self.num_requests,
+            "new_connections": self.num_connections,
+            "reused_connections": self.num_requests - self.num_connections,
+        }
+
+    async def close(self):
+        if self.http_client is not None:
+            await self.http_client.close()
+
+    async def _request(self, req_method: RequestMethod, path: str, params: dict=None):
+
+        if self.response_cache is not None and req_method == RequestMethod.GET:
+            cached = self.response_cache.get(path, params)
+            if cached is not None:
+                return cached
+
+        send = lambda: self._send(req_method, path, params)
+        if self.journal is not None:
+            send = self.journal.wrap_async(send, "binance", req_method.value, path, params)
+
+        return await call_with_retry_async(
+            send,
+            policy_for(req_method.value, path, self.try_counts),
+            get_breaker(self.BASE_URL),
+            venue="binance",
+            endpoint=path,
+            before_retry=self._before_retry,
+        )
+
+    async def _send(self, req_method: RequestMethod, path: str, params: dict):
+
+        if self.replay is not None:
+            result = self.replay.send("binance", req_method.value, path, params)
+            self._on_success(req_method, path, params, result)
+            return result
+
+        # 不阻塞 event loop, 其他 request 可以在等待期間繼續進行
+        wait = self.rate_limiter.reserve(path)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        url, headers = self._build_request(path, self._refresh_timestamp(params))
+
+        start_time = time.perf_counter()
+        self.num_requests += 1
+        try:
+            async with self._get_session().request(req_method.value, url, headers=headers) as response:
+                GATEWAY_LATENCY.observe(time.perf_counter() - start_time, venue="binance", endpoint=path)
+                GATEWAY_RESPONSES.inc(venue="binance", endpoint=path, status=str(response.status))
+                self.rate_limiter.update(path, response.status, response.headers)
+                result = self._decode(path, await response.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            GATEWAY_RESPONSES.inc(venue="binance", endpoint=path, status="error")
+            # 連不上 host 時 request 一定沒有送出, 其他情況無法確定
+            raise RetryableError(
+                "binance", path, message=repr(error), maybe_executed=not isinstance(error, aiohttp.ClientConnectorError)) from error
+
+        if response.status == 200:
+            self._on_success(req_method, path, params, result)
+            return result
+
+        logger.warning(f"请求:{path}, 回应异常", extra={"status": response.status, "response": result})
+        raise classify_binance_error(path, response.status, result)
+
+    async def _before_retry(self, error: GatewayError):
+        # timestamp 超出 recvWindow, 重新對時後再送
+        if isinstance(error, TimestampError) and self.clock is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.clock.sync)
+
+
+# 繼承順序讓 endpoint 定義來自 sync 版本, _request 則來自 AsyncBinanceHttp,
+# 因此每個 endpoint method 回傳的都是可以 await 的 coroutine
+class AsyncBinanceUSDFeatureHttp(BinanceUSDFeatureHttp, AsyncBinanceHttp):
+    pass
+
+
+class AsyncBinanceSpotHttp(BinanceSpotHttp, AsyncBinanceHttp):
+    pass
+
+
+class AsyncGatewayRunner(object):
+    """
+    sync facade: 在背景執行緒跑一個常駐的 event loop, 讓原本 sync 的呼叫端也能一次送出多個 request
+
+    Example:
+        runner = AsyncGatewayRunner()
+        account, flexible = runner.gather(
+            spot_client.get_account_information(),
+            spot_client.get_flexible_product_position(asset="USDT"))
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        """ 在背景 event loop 執行 coroutine, 並阻塞等待結果 """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def gather(self, *coroutines, return_exceptions: bool=False) -> list:
+        """
+        同時執行多個 coroutine, 依傳入順序回傳結果
+
+        Args:
+            return_exceptions (bool): 失敗的 coroutine 以 exception 物件回傳, 不影響其他結果
+        """
+
+        async def _gather():
+            return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
+
+        return self.run(_gather())
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
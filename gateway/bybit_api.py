@@ -1,4 +1,5 @@
 import os
+import json
 import time
 import urllib.parse
 import requests
@@ -8,24 +9,68 @@ import hmac
 from dotenv import load_dotenv
 load_dotenv()
 
+from gateway.binance_api import API_TIMEOUT
+from gateway.journal import get_journal, get_replay
+from gateway.retry import call_with_retry, policy_for, get_breaker, classify_requests_error
+from gateway.exceptions import GatewayError, RetryableError, RateLimitedError, TimestampError, FatalError
+from utils.metrics import GATEWAY_LATENCY, GATEWAY_RESPONSES
+
+# Ref: https://bybit-exchange.github.io/docs/v5/error
+RATE_LIMIT_CODES: set = {10006, 10018}
+TIMESTAMP_CODES: set = {10002}
+UNKNOWN_EXECUTION_CODES: set = {10000, 10016}
+
+
+def classify_bybit_error(endpoint: str, status_code: int, response) -> GatewayError:
+    """ 依 HTTP status 與 Bybit retCode 分類 """
+    code = response.get("retCode") if isinstance(response, dict) else None
+    message = response.get("retMsg", "") if isinstance(response, dict) else str(response)
+
+    if status_code in (403, 429) or code in RATE_LIMIT_CODES:
+        return RateLimitedError("bybit", endpoint, status_code, code, message)
+    if code in TIMESTAMP_CODES:
+        return TimestampError("bybit", endpoint, status_code, code, message)
+    if code in UNKNOWN_EXECUTION_CODES or status_code >= 500:
+        return RetryableError("bybit", endpoint, status_code, code, message, maybe_executed=True)
+    return FatalError("bybit", endpoint, status_code, code, message)
+
 class BybitHttp(object):
     """
     Class for making HTTP requests to the Bybit API.
     Ref: https://github.com/bybit-exchange/api-usage-examples/blob/master/V5_demo/api_demo/Encryption_HMAC.py
     """
 
-    def __init__(self):
+    def __init__(self, api_key: str=None, api_secret: str=None, timeout: int=API_TIMEOUT):
         """
         Initialize BybitHttp with API key, API secret, and base URL.
+
+        Args:
+            api_key (str): API key of this account, defaults to BYBIT_API_KEY.
+            api_secret (str): API secret of this account, defaults to BYBIT_API_SECRET.
+            timeout (int): Seconds to wait for each request, same default as the Binance client.
         """
-        self.API_KEY = os.getenv("BYBIT_API_KEY")
-        self.API_SECRET = os.getenv("BYBIT_API_SECRET")
-        self.BASE_URL = "https://api.bybit.com"
-        os.environ['NO_PROXY'] = self.BASE_URL
-        # Ref: https://www.cnblogs.com/Eeyhan/p/14610998.html
-        
+        self.API_KEY = api_key or os.getenv("BYBIT_API_KEY")
+        self.API_SECRET = api_secret or os.getenv("BYBIT_API_SECRET")
+        self.BASE_URL = os.getenv("BYBIT_BASE_URL", "https://api.bybit.com")
+        self.timeout = timeout
+
         self.recv_window = str(5000)
         self.http_client = requests.Session()
+        # Bypass proxies for this session only instead of overwriting the process-wide NO_PROXY shared with the Binance client
+        # Ref: https://www.cnblogs.com/Eeyhan/p/14610998.html
+        self.http_client.trust_env = False
+        self.journal = get_journal()
+        self.replay = get_replay()
+
+        # Pre-keyed HMAC state and static headers, copied / reused on every request
+        self.signer = hmac.new(bytes(self.API_SECRET, "utf-8"), digestmod=hashlib.sha256) if self.API_SECRET else None
+        self.signature_prefix = f"{self.API_KEY}{self.recv_window}"
+        self.headers = {
+            'X-BAPI-API-KEY': self.API_KEY,
+            'X-BAPI-SIGN-TYPE': '2',
+            'X-BAPI-RECV-WINDOW': self.recv_window,
+            'Content-Type': 'application/json'
+        }
 
     def _gen_signature(self, payload: str, time_stamp: str) -> str:
         """
@@ -38,18 +83,13 @@ class BybitHttp(object):
         Returns:
             str: HMAC signature.
         """
-        param_str = f"{time_stamp}{self.API_KEY}{self.recv_window}{payload}"
-        hash_obj = hmac.new(
-            bytes(self.API_SECRET, "utf-8"),
-            param_str.encode("utf-8"),
-            hashlib.sha256
-        )
-        signature = hash_obj.hexdigest()
-        return signature
+        hash_obj = self.signer.copy()
+        hash_obj.update(f"{time_stamp}{self.signature_prefix}{payload}".encode("utf-8"))
+        return hash_obj.hexdigest()
 
-    def http_request(self, endpoint: str, method: str, payload: dict) -> str:
+    def http_request(self, endpoint: str, method: str, payload: dict) -> dict:
         """
-        Make an HTTP request to the Bybit API.
+        Make an HTTP request to the Bybit API, retried by the shared gateway retry policy.
 
         Args:
             endpoint (str): API endpoint.
@@ -57,46 +97,104 @@ class BybitHttp(object):
             payload (dict): Request payload.
 
         Returns:
-            str: Response text.
+            dict: The "result" field of the response.
+
+        Raises:
+            GatewayError: The request failed after all retries.
+        """
+        send = lambda: self._send(endpoint, method, payload)
+        if self.replay is not None:
+            send = lambda: self.replay.send("bybit", method, endpoint, payload)
+        elif self.journal is not None:
+            send = self.journal.wrap(send, "bybit", method, endpoint, payload)
+
+        return call_with_retry(
+            send,
+            policy_for(method, endpoint),
+            get_breaker(self.BASE_URL),
+            venue="bybit",
+            endpoint=endpoint,
+        )
+
+    def _send(self, endpoint: str, method: str, payload: dict) -> dict:
+        """
+        Send a single signed request.
+
+        Raises:
+            GatewayError: Classified by classify_bybit_error.
         """
-        # Encode payload for GET requests
+        # GET signs the query string, POST signs the JSON body
         if method == "GET":
             payload = urllib.parse.urlencode(payload)
+        else:
+            payload = json.dumps(payload, separators=(",", ":"))
 
         # Generate timestamp and signature
         time_stamp = str(int(time.time() * 10 ** 3))
         signature = self._gen_signature(payload, time_stamp)
 
         # Set request headers
-        headers = {
-            'X-BAPI-API-KEY': self.API_KEY,
-            'X-BAPI-SIGN': signature,
-            'X-BAPI-SIGN-TYPE': '2',
-            'X-BAPI-TIMESTAMP': time_stamp,
-            'X-BAPI-RECV-WINDOW': self.recv_window,
-            'Content-Type': 'application/json'
-        }
+        headers = {**self.headers, 'X-BAPI-SIGN': signature, 'X-BAPI-TIMESTAMP': time_stamp}
 
         # Make HTTP request
-        if method == "POST":
-            response = self.http_client.request(
-                method, f"{self.BASE_URL}{endpoint}", headers=headers, data=payload)
-        else:
-            response = self.http_client.request(
-                method, f"{self.BASE_URL}{endpoint}?{payload}", headers=headers)
-            
-        response = response.json()
-        return response["result"] if response["retMsg"] == "OK" else response
+        try:
+            with GATEWAY_LATENCY.time(venue="bybit", endpoint=endpoint):
+                if method == "POST":
+                    response = self.http_client.request(
+                        method, f"{self.BASE_URL}{endpoint}", headers=headers, data=payload, timeout=self.timeout)
+                else:
+                    response = self.http_client.request(
+                        method, f"{self.BASE_URL}{endpoint}?{payload}", headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as error:
+            GATEWAY_RESPONSES.inc(venue="bybit", endpoint=endpoint, status="error")
+            raise classify_requests_error("bybit", endpoint, error) from error
+        GATEWAY_RESPONSES.inc(venue="bybit", endpoint=endpoint, status=str(response.status_code))
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"retMsg": response.text[:200]}
+
+        if response.status_code == 200 and body.get("retCode") == 0:
+            return body["result"]
+        raise classify_bybit_error(endpoint, response.status_code, body)
     
-    def get_position_info(self):
+    def get_position_info(self, **kwargs):
+        """
+        Args:
+            symbol (str): Only query one symbol.
+            limit (int): Page size, up to 200.
+            cursor (str): nextPageCursor of the previous page.
+        """
 
         endpoint = "/v5/position/list"
         method = "GET"
         params = {
             "category": "linear",
-            # "symbol": "SAGAUSDT",
             "settleCoin": "USDT",
-            # "limit": 1,
+        }
+        params.update(kwargs)
+
+        response = self.http_request(endpoint, method, params)
+        return response
+
+    def add_or_reduce_margin(self, symbol: str, margin, position_idx: int=0):
+        """
+        Add or reduce the margin of an isolated position.
+
+        Args:
+            symbol (str): Symbol name.
+            margin (Decimal): Positive to add margin, negative to reduce.
+            position_idx (int): 0 for one-way mode, 1 / 2 for the buy / sell side in hedge mode.
+        """
+
+        endpoint = "/v5/position/add-margin"
+        method = "POST"
+        params = {
+            "category": "linear",
+            "symbol": symbol,
+            "margin": str(margin),
+            "positionIdx": position_idx,
         }
 
         response = self.http_request(endpoint, method, params)
@@ -114,26 +212,32 @@ class BybitHttp(object):
         response = self.http_request(endpoint, method, params)
         return response
     
-    def get_wallet_balance(self):
+    def get_wallet_balance(self, coin: str=None):
 
         endpoint = "/v5/account/wallet-balance"
         method = "GET"
         params = {
             "accountType": "UNIFIED",
-            # "coin": "USDT",
         }
+        if coin:
+            params["coin"] = coin
 
         response = self.http_request(endpoint, method, params)
         return response
 
-    def get_risk_limit(self):
+    def get_risk_limit(self, symbol: str=None):
+        """
+        Args:
+            symbol (str): Symbol name, all symbols when omitted.
+        """
 
         endpoint = "/v5/market/risk-limit"
         method = "GET"
         params = {
             "category": "linear",
-            "symbol": "SAGAUSDT",
         }
+        if symbol is not None:
+            params["symbol"] = symbol
 
         response = self.http_request(endpoint, method, params)
         return response
@@ -0,0 +1,131 @@
+import copy
+import time
+import threading
+
+from decimal import Decimal
+
+# 可以快取的 GET endpoint
+CACHEABLE_PATHS: set = {
+    "/api/v3/account",
+    "/sapi/v1/simple-earn/flexible/position",
+    "/sapi/v2/loan/flexible/ongoing/orders",
+}
+
+# 簽名相關的參數每次都不同, 不列入快取 key
+IGNORED_PARAMS: set = {"timestamp", "recvWindow", "signature"}
+
+
+class ResponseCache:
+    """
+    巡邏期間的短效快取: GET 的結果在 ttl 秒內重複使用, 自己發出的劃轉/贖回/借款成功後,
+    直接在本地修正快取內容, 不需要為了確認餘額再打一次 API
+
+    Args:
+        ttl (float): 快取有效秒數
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (expires_at, response)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(path: str, params: dict):
+        return (path, tuple(sorted((key, str(value)) for key, value in params.items() if key not in IGNORED_PARAMS)))
+
+    def get(self, path: str, params: dict):
+        """ 回傳快取的副本, 過期或沒有則回傳 None """
+
+        if path not in CACHEABLE_PATHS:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(self.make_key(path, params))
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+            return None
+
+    def set(self, path: str, params: dict, response):
+        if path not in CACHEABLE_PATHS or response is None:
+            return
+
+        with self.lock:
+            self.entries[self.make_key(path, params)] = (time.monotonic() + self.ttl, copy.deepcopy(response))
+
+    def invalidate(self, path: str=None):
+        """ 清除某個 endpoint 的快取, 沒給 path 則全部清除 """
+        with self.lock:
+            if path is None:
+                self.entries = {}
+            else:
+                self.entries = {key: entry for key, entry in self.entries.items() if key[0] != path}
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries),
+            }
+
+    def _cached_responses(self, path: str) -> list:
+        return [entry[1] for key, entry in self.entries.items() if key[0] == path and entry[0] > time.monotonic()]
+
+    def _patch_spot_balance(self, asset: str, delta: Decimal):
+        for response in self._cached_responses("/api/v3/account"):
+            balances = [balance for balance in response["balances"] if balance["asset"] == asset]
+            if balances:
+                balances[0]["free"] = str(Decimal(balances[0]["free"]) + delta)
+            else: # omitZeroBalances 時原本可能沒有這個 asset
+                response["balances"].append({"asset": asset, "free": str(delta), "locked": "0"})
+
+    def _patch_flexible_position(self, product_id: str, delta: Decimal) -> str:
+        """ 回傳該活存產品的 asset, 快取裡沒有的話以 productId 推測 (USDT001 -> USDT) """
+
+        asset = product_id.rstrip("0123456789")
+        for response in self._cached_responses("/sapi/v1/simple-earn/flexible/position"):
+            for row in response["rows"]:
+                if row["productId"] == product_id:
+                    row["totalAmount"] = str(Decimal(row["totalAmount"]) + delta)
+                    asset = row["asset"]
+        return asset
+
+    def on_mutation(self, path: str, params: dict):
+        """ 自己發出的劃轉/贖回/借款成功後, 修正對應的快取 """
+
+        with self.lock:
+            if path == "/sapi/v1/futures/transfer":
+                amount = Decimal(str(params["amount"]))
+                if params["type"] == "1": # 现货账户向USDT合约账户划转
+                    self._patch_spot_balance(params["asset"], -amount)
+                elif params["type"] == "2": # USDT合约账户向现货账户划转
+                    self._patch_spot_balance(params["asset"], amount)
+                else:
+                    self.entries = {key: entry for key, entry in self.entries.items() if key[0] != "/api/v3/account"}
+
+            elif path == "/sapi/v1/simple-earn/flexible/redeem":
+                if "amount" not in params: # redeemAll, 無法得知實際金額
+                    self.entries = {}
+                    return
+                amount = Decimal(str(params["amount"]))
+                asset = self._patch_flexible_position(params["productId"], -amount)
+                if params.get("destAccount", "SPOT") == "SPOT":
+                    self._patch_spot_balance(asset, amount)
+
+            elif path == "/sapi/v1/simple-earn/flexible/subscribe":
+                amount = Decimal(str(params["amount"]))
+                asset = self._patch_flexible_position(params["productId"], amount)
+                if params.get("sourceAccount", "SPOT") == "SPOT":
+                    self._patch_spot_balance(asset, -amount)
+
+            elif path == "/sapi/v2/loan/flexible/borrow":
+                self._patch_spot_balance(params["loanCoin"], Decimal(params["loanAmount"]))
+                # LTV 需要由交易所重新計算
+                self.entries = {
+                    key: entry for key, entry in self.entries.items() if key[0] != "/sapi/v2/loan/flexible/ongoing/orders"}
@@ -0,0 +1,130 @@
+import os
+import time
+import threading
+import requests
+
+from collections import deque
+
+from utils.metrics import CLOCK_OFFSET, CLOCK_DRIFT
+from utils.logger import get_logger
+
+logger = get_logger("gateway.clock")
+
+# default setting
+CLOCK_SYNC_INTERVAL: float = float(os.getenv("CLOCK_SYNC_INTERVAL", "60"))
+RECV_WINDOW: int = int(os.getenv("BINANCE_RECV_WINDOW", "5000"))
+
+
+class ServerClock:
+    """
+    估計本機時鐘與 Binance 伺服器時間的差距, 讓簽名的 timestamp 不受容器時鐘漂移影響, 避免 -1021 錯誤.
+
+    每次取樣以 round trip 的中點作為伺服器回應的時間 (NTP 的估計方式), 保留最近幾筆樣本,
+    offset 取 round trip 最短的樣本 (誤差最小), drift 以樣本的線性迴歸估計, 並從該樣本的時間開始外插
+
+    Args:
+        base_url (str): 伺服器的 base url
+        time_path (str): 伺服器時間的 endpoint
+        sync_interval (float): 多久重新取樣一次
+        recv_window (int): 簽名 request 帶上的 recvWindow (ms)
+        max_samples (int): 保留的樣本數
+    """
+
+    def __init__(
+        self, base_url: str, time_path: str, sync_interval: float=CLOCK_SYNC_INTERVAL, recv_window: int=RECV_WINDOW, max_samples: int=8):
+        self.base_url = base_url
+        self.time_path = time_path
+        self.sync_interval = sync_interval
+        self.recv_window = recv_window
+        self.samples = deque(maxlen=max_samples)  # (本機時間 ms, offset ms, round trip ms)
+        self.offset = 0.0           # 伺服器時間 - 本機時間 (ms)
+        self.drift = 0.0            # 每秒 offset 的變化量 (ms/sec.)
+        self.offset_at = None       # offset 所屬樣本的本機時間 (ms), drift 從這個時間開始外插
+        self.synced_at = None       # 上次取樣的本機時間 (ms)
+        self.lock = threading.Lock()
+        self.syncing = False
+        self.http_client = requests.Session()
+
+    def sample(self) -> tuple:
+        """
+        取樣一次伺服器時間
+
+        Return:
+            (local_ms, offset_ms, round_trip_ms)
+        """
+        start_ms = time.time() * 1000
+        response = self.http_client.get(self.base_url + self.time_path, timeout=5)
+        end_ms = time.time() * 1000
+        response.raise_for_status()
+
+        midpoint_ms = (start_ms + end_ms) / 2
+        return (midpoint_ms, response.json()["serverTime"] - midpoint_ms, end_ms - start_ms)
+
+    def sync(self):
+        """ 取樣並更新 offset / drift, 失敗時保留原本的估計值 """
+        try:
+            local_ms, offset, round_trip = self.sample()
+        except Exception as error:
+            logger.warning(f"同步伺服器時間:{self.time_path}, 发生了错误: {error}")
+            return
+        finally:
+            self.syncing = False
+
+        with self.lock:
+            self.samples.append((local_ms, offset, round_trip))
+            self.offset_at, self.offset, _ = min(self.samples, key=lambda sample: sample[2])
+            self.drift = self._estimate_drift()
+            self.synced_at = local_ms
+
+        CLOCK_OFFSET.set(self.offset, base_url=self.base_url)
+        CLOCK_DRIFT.set(self.drift, base_url=self.base_url)
+
+    def _estimate_drift(self) -> float:
+        """ offset 對本機時間的最小平方法斜率, 樣本不足時為 0 """
+
+        if len(self.samples) < 3:
+            return 0.0
+
+        times = [sample[0] / 1000 for sample in self.samples]
+        offsets = [sample[1] for sample in self.samples]
+        mean_time, mean_offset = sum(times) / len(times), sum(offsets) / len(offsets)
+        variance = sum((t - mean_time) ** 2 for t in times)
+        if variance == 0:
+            return 0.0
+        return sum((t - mean_time) * (o - mean_offset) for t, o in zip(times, offsets)) / variance
+
+    def _sync_in_background(self):
+        with self.lock:
+            if self.syncing:
+                return
+            self.syncing = True
+        threading.Thread(target=self.sync, name="clock-sync", daemon=True).start()
+
+    def now_ms(self) -> int:
+        """ 校正後的伺服器時間 (ms), 過期時在背景重新取樣, 不阻塞呼叫端 """
+
+        local_ms = time.time() * 1000
+        synced_at = self.synced_at
+        if synced_at is None or local_ms - synced_at > self.sync_interval * 1000:
+            self._sync_in_background()
+        with self.lock:
+            offset, drift, offset_at = self.offset, self.drift, self.offset_at
+        if offset_at is None:
+            return int(local_ms + offset)
+
+        return int(local_ms + offset + drift * (local_ms - offset_at) / 1000)
+
+
+_clocks = {}
+_clocks_lock = threading.Lock()
+
+
+def get_clock(base_url: str, time_path: str) -> ServerClock:
+    """ 同一個 base url 的 sync / async client 與所有帳戶共用同一個 ServerClock """
+
+    with _clocks_lock:
+        clock = _clocks.get(base_url)
+        if clock is None:
+            clock = ServerClock(base_url, time_path)
+            _clocks[base_url] = clock
+        return clock
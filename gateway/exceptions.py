@@ -0,0 +1,56 @@
+class GatewayError(Exception):
+    """
+    gateway 呼叫失敗的共同父類別
+
+    Args:
+        venue (str): 交易所
+        endpoint (str): API path
+        status (int): HTTP status code, 沒有收到 response 時為 None
+        code (int): 交易所的錯誤代碼
+        message (str): 錯誤訊息
+    """
+
+    def __init__(self, venue: str, endpoint: str, status: int=None, code: int=None, message: str=""):
+        super().__init__(f"{venue} {endpoint} status={status} code={code}: {message}")
+        self.venue = venue
+        self.endpoint = endpoint
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+class RetryableError(GatewayError):
+    """
+    暫時性的錯誤, 重送有機會成功
+
+    Args:
+        maybe_executed (bool): 交易所可能已經執行了這個 request (ex: 讀取逾時, 5xx), 非冪等的 request 不能重送
+    """
+
+    def __init__(self, *args, maybe_executed: bool=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.maybe_executed = maybe_executed
+
+
+class RateLimitedError(RetryableError):
+    """ 429 / 418 或交易所回報超過頻率限制 """
+
+
+class TimestampError(RetryableError):
+    """ timestamp 超出 recvWindow, 重新對時後可以重送 """
+
+
+class FatalError(GatewayError):
+    """ 參數錯誤, 權限不足, 餘額不足等, 重送也不會成功 """
+
+
+class CircuitOpenError(GatewayError):
+    """ 同一個 host 連續失敗, circuit breaker 暫停送出 request """
+
+
+class DeadlineExceededError(GatewayError):
+    """ 重試超過總時限 """
+
+
+class ReplayExhaustedError(GatewayError):
+    """ 回放 journal 時, 這個 endpoint 已沒有紀錄 """
@@ -0,0 +1,199 @@
+import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import threading
+
+from collections import deque
+
+from gateway import exceptions
+from gateway.exceptions import GatewayError, ReplayExhaustedError
+from utils.logger import get_logger, current_account
+
+logger = get_logger("gateway.journal")
+
+# 簽名相關的參數每次都不同, 也不需要重現, 不寫入 journal
+IGNORED_PARAMS: set = {"timestamp", "recvWindow", "signature"}
+# response 內屬於憑證的欄位
+REDACTED_FIELDS: set = {"listenKey"}
+REDACTED: str = "<redacted>"
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return {key: REDACTED if key in REDACTED_FIELDS else _redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+class GatewayJournal:
+    """
+    把每一次 gateway 呼叫與結果寫成 gzip 壓縮的 JSON lines, 用於離線重現事故與以真實流量做 benchmark.
+    壓縮與寫檔由背景執行緒負責. 簽名參數與 listenKey 不會寫入, API key 只在 header 內, 本來就不會記錄
+
+    每一筆的欄位:
+        ts: 送出的時間, account: 帳戶名稱, venue: 交易所, method / endpoint / params: request,
+        elapsed: 耗時, response: 成功的結果, error: 失敗時的 exception 類別與欄位
+
+    Args:
+        path (str): journal 檔案路徑, 已存在時接在後面 (gzip 支援多個 member 串接)
+        compresslevel (int): gzip 壓縮等級
+    """
+
+    def __init__(self, path: str, compresslevel: int=6):
+        self.path = path
+        self.file = gzip.open(path, "at", encoding="utf-8", compresslevel=compresslevel)
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._write_forever, name="gateway-journal", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, venue: str, method: str, endpoint: str, params: dict, start_time: float, response=None, error: GatewayError=None):
+        entry = {
+            "ts": start_time,
+            "account": current_account(),
+            "venue": venue,
+            "method": method,
+            "endpoint": endpoint,
+            "params": {key: value for key, value in (params or {}).items() if key not in IGNORED_PARAMS},
+            "elapsed": round(time.time() - start_time, 6),
+        }
+        if error is None:
+            entry["response"] = response
+        else:
+            entry["error"] = {
+                "type": type(error).__name__,
+                "status": error.status,
+                "code": error.code,
+                "message": error.message,
+                "maybe_executed": getattr(error, "maybe_executed", False),
+            }
+        # 先序列化, 避免呼叫端之後修改 response; 壓縮與寫檔留給背景執行緒
+        self.queue.put(json.dumps(_redact(entry), separators=(",", ":"), default=str))
+
+    def wrap(self, send, venue: str, method: str, endpoint: str, params: dict):
+        """ 包裝單次送出的 callable, 結果與錯誤都寫入 journal """
+
+        def _send():
+            start_time = time.time()
+            try:
+                response = send()
+            except GatewayError as error:
+                self.record(venue, method, endpoint, params, start_time, error=error)
+                raise
+            self.record(venue, method, endpoint, params, start_time, response=response)
+            return response
+        return _send
+
+    def wrap_async(self, send, venue: str, method: str, endpoint: str, params: dict):
+        """ wrap 的 asyncio 版本 """
+
+        async def _send():
+            start_time = time.time()
+            try:
+                response = await send()
+            except GatewayError as error:
+                self.record(venue, method, endpoint, params, start_time, error=error)
+                raise
+            self.record(venue, method, endpoint, params, start_time, response=response)
+            return response
+        return _send
+
+    def _write_forever(self):
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            self.file.write(line + "\n")
+
+    def close(self):
+        """ 寫完 queue 內剩下的紀錄後關閉檔案 """
+        if self.file.closed:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+class ReplayTransport:
+    """
+    依 journal 的紀錄回放 gateway 的結果, 不會連到交易所也不會等待.
+    同一個 (account, venue, method, endpoint) 依紀錄的順序回放, 與 request 完成的先後無關, 所以平行的查詢也是確定性的
+
+    Args:
+        path (str): journal 檔案路徑
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self.replayed = 0
+        self.lock = threading.Lock()
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                key = (entry.get("account"), entry["venue"], entry["method"], entry["endpoint"])
+                self.entries.setdefault(key, deque()).append(entry)
+
+    def remaining(self) -> int:
+        with self.lock:
+            return sum(len(entries) for entries in self.entries.values())
+
+    def send(self, venue: str, method: str, endpoint: str, params: dict=None):
+        """
+        Return:
+            response: 紀錄的結果
+
+        Raises:
+            GatewayError: 紀錄的是錯誤時, 重建相同類別的 exception
+            ReplayExhaustedError: 這個 endpoint 已沒有紀錄
+        """
+        key = (current_account(), venue, method, endpoint)
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise ReplayExhaustedError(venue, endpoint, message=f"no more journal entries in {self.path}")
+            entry = entries.popleft()
+            self.replayed += 1
+
+        error = entry.get("error")
+        if error is None:
+            return entry["response"]
+
+        error_class = getattr(exceptions, error["type"], GatewayError)
+        kwargs = {"maybe_executed": error["maybe_executed"]} if issubclass(error_class, exceptions.RetryableError) else {}
+        raise error_class(venue, endpoint, error["status"], error["code"], error["message"], **kwargs)
+
+
+_journal = None
+_replay = None
+_transport_lock = threading.Lock()
+
+
+def get_journal() -> GatewayJournal:
+    """ 設定 GATEWAY_JOURNAL 時, 同一個 process 的所有 client 寫入同一個 journal """
+    global _journal
+    path = os.getenv("GATEWAY_JOURNAL")
+    if not path:
+        return None
+    with _transport_lock:
+        if _journal is None:
+            _journal = GatewayJournal(path)
+            logger.info(f"gateway journal: {path}")
+        return _journal
+
+
+def get_replay() -> ReplayTransport:
+    """ 設定 GATEWAY_REPLAY 時, 所有 client 改由 journal 回放, 不連到交易所 """
+    global _replay
+    path = os.getenv("GATEWAY_REPLAY")
+    if not path:
+        return None
+    with _transport_lock:
+        if _replay is None:
+            _replay = ReplayTransport(path)
+            logger.info(f"gateway replay: {path}")
+        return _replay
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+
+# Ref: https://binance-docs.github.io/apidocs/futures/en/#limits
+# Ref: https://binance-docs.github.io/apidocs/spot/en/#limits
+BUCKET_CAPACITY: dict = { # 每分鐘的額度
+    "fapi_weight": int(os.getenv("FAPI_WEIGHT_LIMIT", "2400")),
+    "fapi_orders": int(os.getenv("FAPI_ORDER_LIMIT", "1200")),
+    "api_weight": int(os.getenv("API_WEIGHT_LIMIT", "6000")),
+    "api_orders": int(os.getenv("API_ORDER_LIMIT", "6000")),
+    "sapi_ip_weight": int(os.getenv("SAPI_IP_WEIGHT_LIMIT", "12000")),
+    "sapi_uid_weight": int(os.getenv("SAPI_UID_WEIGHT_LIMIT", "180000")),
+}
+
+# 以 IP 計算的 bucket, 同一個 process 內的所有帳戶共用; 其餘 (UID / 下單數) 以帳戶計算
+IP_BUCKETS: set = {"fapi_weight", "api_weight", "sapi_ip_weight"}
+
+# path -> (bucket, weight), 沒列出的 endpoint 以 weight 1 計算
+ENDPOINT_WEIGHTS: dict = {
+    "/fapi/v2/account": ("fapi_weight", 5),
+    "/fapi/v2/positionRisk": ("fapi_weight", 5),
+    "/fapi/v3/positionRisk": ("fapi_weight", 5),
+    "/fapi/v1/positionMargin": ("fapi_weight", 1),
+    "/fapi/v1/leverageBracket": ("fapi_weight", 1),
+    "/fapi/v1/premiumIndex": ("fapi_weight", 10),
+    "/fapi/v1/listenKey": ("fapi_weight", 1),
+    "/api/v3/account": ("api_weight", 20),
+    "/sapi/v1/simple-earn/flexible/position": ("sapi_ip_weight", 150),
+    "/sapi/v1/simple-earn/flexible/redeem": ("sapi_uid_weight", 1),
+    "/sapi/v1/simple-earn/flexible/subscribe": ("sapi_uid_weight", 1),
+    "/sapi/v1/futures/transfer": ("sapi_ip_weight", 1),
+    "/sapi/v2/loan/flexible/borrow": ("sapi_uid_weight", 6000),
+    "/sapi/v2/loan/flexible/ongoing/orders": ("sapi_ip_weight", 300),
+}
+
+# path -> 兩次呼叫之間最少要間隔幾秒
+ENDPOINT_COOLDOWNS: dict = {
+    "/sapi/v1/simple-earn/flexible/redeem": 3.0,
+}
+
+# response header -> 對應的 bucket, 用來學習交易所實際記錄的已用額度
+USED_WEIGHT_HEADERS: dict = {
+    "fapi": {"X-MBX-USED-WEIGHT-1M": "fapi_weight", "X-MBX-ORDER-COUNT-1M": "fapi_orders"},
+    "api": {"X-MBX-USED-WEIGHT-1M": "api_weight", "X-MBX-ORDER-COUNT-1M": "api_orders"},
+    "sapi": {"X-SAPI-USED-IP-WEIGHT-1M": "sapi_ip_weight", "X-SAPI-USED-UID-WEIGHT-1M": "sapi_uid_weight"},
+}
+
+
+def _endpoint_class(path: str) -> str:
+    return path.split("/")[1]
+
+
+def _default_bucket(path: str) -> str:
+    endpoint_class = _endpoint_class(path)
+    return "sapi_ip_weight" if endpoint_class == "sapi" else f"{endpoint_class}_weight"
+
+
+class TokenBucket:
+    """
+    每分鐘 capacity 個 token 的 token bucket, 允許 token 變成負數來表示排隊中的 request
+
+    Args:
+        capacity (int): 每分鐘的額度
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.refill_rate = capacity / 60.0
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def reserve(self, cost: int, now: float) -> float:
+        """ 預先扣除 cost, 回傳需要等待的秒數 """
+        self._refill(now)
+        self.tokens -= cost
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.refill_rate
+
+    def sync_used(self, used: int, now: float):
+        """ 以交易所回報的已用額度為準 """
+        self._refill(now)
+        self.tokens = min(self.tokens, float(self.capacity - used))
+
+
+class RateLimiter:
+    """
+    Binance 的 client 端限流: 每個 endpoint 類別一個 token bucket, 並從 response header 學習實際剩餘額度,
+    遇到 429 / 418 時依 Retry-After 暫停整個 endpoint 類別, 讓 request 排隊而不是直接失敗.
+    sync 的 client 用 acquire() 阻塞, async 的 client 用 reserve() 取得等待秒數後自行 await
+
+    Args:
+        capacity (dict): 各 bucket 每分鐘的額度, 預設為 BUCKET_CAPACITY
+        shared (RateLimiter): 多帳戶時帶入, IP_BUCKETS 與 Retry-After 的封鎖和它共用, 只有 UID / 下單數的額度各自計算
+    """
+
+    def __init__(self, capacity: dict=None, shared: "RateLimiter"=None):
+        capacity = capacity or BUCKET_CAPACITY
+        if shared is None:
+            self.lock = threading.Lock()
+            self.buckets = {name: TokenBucket(limit) for name, limit in capacity.items()}
+            self.blocked_until = {}  # endpoint class -> Retry-After 結束時間
+        else:
+            # 共用的 bucket 必須在同一個 lock 下修改
+            self.lock = shared.lock
+            self.buckets = {
+                name: shared.buckets[name] if name in IP_BUCKETS else TokenBucket(limit) for name, limit in capacity.items()}
+            self.blocked_until = shared.blocked_until
+        self.next_allowed = {}  # path -> 冷卻結束時間
+        self.used = {}          # bucket -> 經由這個 limiter 送出的累計 weight, 共用 bucket 時也只算自己的
+        self.waited_seconds = 0.0
+
+    def set_capacity(self, capacity: dict):
+        """ 重設部分 bucket 的額度, 需要在建立共用這些 bucket 的 limiter 之前呼叫 """
+        with self.lock:
+            for name, limit in capacity.items():
+                self.buckets[name] = TokenBucket(limit)
+
+    def reserve(self, path: str) -> float:
+        """ 預約一次呼叫, 回傳送出前需要等待的秒數 """
+
+        bucket_name, weight = ENDPOINT_WEIGHTS.get(path, (_default_bucket(path), 1))
+        with self.lock:
+            now = time.monotonic()
+            wait = self.buckets[bucket_name].reserve(weight, now)
+            self.used[bucket_name] = self.used.get(bucket_name, 0) + weight
+            wait = max(wait, self.blocked_until.get(_endpoint_class(path), 0.0) - now)
+
+            if path in ENDPOINT_COOLDOWNS:
+                wait = max(wait, self.next_allowed.get(path, 0.0) - now)
+                self.next_allowed[path] = now + wait + ENDPOINT_COOLDOWNS[path]
+
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self, path: str):
+        """ 阻塞直到可以送出 """
+        wait = self.reserve(path)
+        if wait > 0:
+            time.sleep(wait)
+
+    def update(self, path: str, status_code: int, headers: dict):
+        """ 依 response 的 header 與 status code 更新額度 """
+
+        endpoint_class = _endpoint_class(path)
+        with self.lock:
+            now = time.monotonic()
+
+            for header, bucket_name in USED_WEIGHT_HEADERS.get(endpoint_class, {}).items():
+                used = headers.get(header)
+                if used is not None:
+                    self.buckets[bucket_name].sync_used(int(used), now)
+
+            # 429: 超過頻率限制, 418: IP 已被封鎖, 兩者都要等到 Retry-After 之後
+            if status_code in (429, 418):
+                retry_after = float(headers.get("Retry-After", "60"))
+                self.blocked_until[endpoint_class] = max(self.blocked_until.get(endpoint_class, 0.0), now + retry_after)
+
+    def remaining(self) -> dict:
+        """ 各 bucket 目前估計的剩餘額度 """
+        with self.lock:
+            now = time.monotonic()
+            for bucket in self.buckets.values():
+                bucket._refill(now)
+            return {name: bucket.tokens for name, bucket in self.buckets.items()}
+
+
+# 同一個 process 內所有 Binance client 共用, 因為 IP weight 是以 IP 計算
+DEFAULT_RATE_LIMITER = RateLimiter()
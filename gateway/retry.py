@@ -0,0 +1,234 @@
+import os
+import time
+import random
+import asyncio
+import inspect
+import threading
+import requests
+
+from urllib3.exceptions import NewConnectionError
+from enum import Enum
+from dataclasses import dataclass, replace
+
+from gateway.exceptions import GatewayError, RetryableError, RateLimitedError, TimestampError
+from gateway.exceptions import CircuitOpenError, DeadlineExceededError
+from utils.metrics import GATEWAY_RETRIES, GATEWAY_CIRCUIT_OPEN
+from utils.logger import get_logger
+
+logger = get_logger("gateway.retry")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    單一 endpoint 的重試設定, backoff 使用 full jitter: uniform(0, min(max_delay, base_delay * 2^attempt))
+
+    Args:
+        max_attempts (int): 最多送出幾次
+        base_delay (float): 第一次重試的 backoff 上限 (秒)
+        max_delay (float): 單次 backoff 上限 (秒)
+        deadline (float): 從第一次送出開始的總時限 (秒)
+        idempotent (bool): 重送是否安全, False 時只重送確定沒有被交易所執行的 request
+    """
+    max_attempts: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+    base_delay: float = float(os.getenv("RETRY_BASE_DELAY", "0.05"))
+    max_delay: float = float(os.getenv("RETRY_MAX_DELAY", "1.0"))
+    deadline: float = float(os.getenv("RETRY_DEADLINE", "3.0"))
+    idempotent: bool = True
+
+    def backoff(self, attempt: int, error: RetryableError=None) -> float:
+        # 重新對時後馬上重送, 不需要等待
+        if isinstance(error, TimestampError):
+            return 0.0
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def can_retry(self, error: RetryableError, attempt: int) -> bool:
+        if attempt >= self.max_attempts:
+            return False
+        return self.idempotent or not error.maybe_executed
+
+
+READ_POLICY = RetryPolicy()
+WRITE_POLICY = RetryPolicy(idempotent=False)
+
+# 與 method 預設不同的 endpoint
+ENDPOINT_POLICIES: dict = {
+    "/fapi/v1/listenKey": READ_POLICY,  # 建立 / 延長 listenKey 重送也安全
+}
+
+
+def policy_for(method: str, path: str, max_attempts: int=None) -> RetryPolicy:
+    """
+    Args:
+        method (str): HTTP method
+        path (str): API path
+        max_attempts (int): 呼叫端指定的次數, 覆寫 policy 的設定
+    """
+    policy = ENDPOINT_POLICIES.get(path, READ_POLICY if method == "GET" else WRITE_POLICY)
+    if max_attempts is not None:
+        policy = replace(policy, max_attempts=max_attempts)
+    return policy
+
+
+class CircuitState(Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitBreaker:
+    """
+    每個 host 一個 circuit breaker: 連續 failure_threshold 次暫時性錯誤後打開, 期間直接拒絕 request,
+    reset_timeout 秒後只放行一個 request 試探, 成功才恢復
+
+    Args:
+        host (str): base url
+        failure_threshold (int): 連續失敗幾次後打開
+        reset_timeout (float): 打開後多久允許試探
+    """
+
+    def __init__(self, host: str, failure_threshold: int=None, reset_timeout: float=None):
+        self.host = host
+        self.failure_threshold = failure_threshold or int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = reset_timeout or float(os.getenv("CIRCUIT_RESET_TIMEOUT", "10"))
+        self.lock = threading.Lock()
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before_call(self, venue: str, endpoint: str):
+        """ 打開時拒絕 request """
+        with self.lock:
+            if self.state == CircuitState.CLOSED:
+                return
+            if self.state == CircuitState.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = CircuitState.HALF_OPEN
+            if self.state == CircuitState.HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+        raise CircuitOpenError(venue, endpoint, message=f"circuit open for {self.host}")
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CircuitState.CLOSED:
+                logger.info(f"{self.host} 恢复连线")
+                self.state = CircuitState.CLOSED
+                GATEWAY_CIRCUIT_OPEN.set(0, host=self.host)
+
+    def record_failure(self, error: GatewayError):
+        # 限流與時間錯誤代表 host 是正常的, 不計入
+        if isinstance(error, (RateLimitedError, TimestampError)):
+            return self.record_success()
+
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != CircuitState.OPEN:
+                    logger.error(f"{self.host} 连续失败 {self.failures} 次, 暂停 {self.reset_timeout} sec.")
+                self.state = CircuitState.OPEN
+                self.opened_at = time.monotonic()
+                GATEWAY_CIRCUIT_OPEN.set(1, host=self.host)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """ 同一個 host 的所有 client 共用同一個 circuit breaker """
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _breakers[host] = breaker
+        return breaker
+
+
+def classify_requests_error(venue: str, endpoint: str, error: requests.exceptions.RequestException) -> RetryableError:
+    """ 連線前就失敗的 request 一定沒有被執行, 讀取逾時或斷線則無法確定 """
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    maybe_executed = not isinstance(error, requests.exceptions.ConnectTimeout) and not isinstance(reason, NewConnectionError)
+    return RetryableError(venue, endpoint, message=str(error), maybe_executed=maybe_executed)
+
+
+def call_with_retry(send, policy: RetryPolicy, breaker: CircuitBreaker, venue: str, endpoint: str, before_retry=None):
+    """
+    依 policy 重送, 直到成功, 遇到非暫時性錯誤, 或超過次數 / 總時限
+
+    Args:
+        send (callable): 送出一次 request, 失敗時 raise GatewayError
+        policy (RetryPolicy): 重試設定
+        breaker (CircuitBreaker): host 的 circuit breaker
+        venue (str): 交易所, 用於 metrics
+        endpoint (str): API path, 用於 metrics
+        before_retry (callable): 重送前呼叫, 參數為上一次的錯誤 (ex: 重新對時)
+
+    Raises:
+        GatewayError: 最後一次的錯誤, 超過總時限時為 DeadlineExceededError
+    """
+    start_time = time.monotonic()
+    attempt = 0
+    while True:
+        breaker.before_call(venue, endpoint)
+        attempt += 1
+        try:
+            result = send()
+        except RetryableError as error:
+            breaker.record_failure(error)
+            delay = _next_delay(policy, error, attempt, start_time, venue, endpoint)
+            time.sleep(delay)
+            if before_retry is not None:
+                before_retry(error)
+            continue
+        except GatewayError:
+            breaker.record_success()
+            raise
+
+        breaker.record_success()
+        return result
+
+
+async def call_with_retry_async(send, policy: RetryPolicy, breaker: CircuitBreaker, venue: str, endpoint: str, before_retry=None):
+    """ call_with_retry 的 asyncio 版本, send 與 before_retry 可以是 coroutine function """
+
+    start_time = time.monotonic()
+    attempt = 0
+    while True:
+        breaker.before_call(venue, endpoint)
+        attempt += 1
+        try:
+            result = await send()
+        except RetryableError as error:
+            breaker.record_failure(error)
+            delay = _next_delay(policy, error, attempt, start_time, venue, endpoint)
+            await asyncio.sleep(delay)
+            if before_retry is not None:
+                outcome = before_retry(error)
+                if inspect.isawaitable(outcome):
+                    await outcome
+            continue
+        except GatewayError:
+            breaker.record_success()
+            raise
+
+        breaker.record_success()
+        return result
+
+
+def _next_delay(policy: RetryPolicy, error: RetryableError, attempt: int, start_time: float, venue: str, endpoint: str) -> float:
+    """ 決定下次重送前的等待秒數, 不能重送時直接 raise """
+
+    if not policy.can_retry(error, attempt):
+        raise error
+
+    delay = policy.backoff(attempt, error)
+    if time.monotonic() - start_time + delay > policy.deadline:
+        raise DeadlineExceededError(venue, endpoint, error.status, error.code, f"deadline {policy.deadline} sec. exceeded") from error
+
+    GATEWAY_RETRIES.inc(venue=venue, endpoint=endpoint)
+    logger.warning(f"请求:{endpoint}, 第 {attempt} 次失败, {delay:.3f} sec. 后重试: {error}")
+    return delay
@@ -0,0 +1,166 @@
+from enum import Enum
+from decimal import Decimal
+
+from gateway.binance_api import BinanceSpotHttp, BinanceUSDFeatureHttp
+from gateway.bybit_api import BybitHttp
+
+
+class Venue(Enum):
+    BINANCE = "binance"
+    BYBIT = "bybit"
+
+
+class MarginVenue:
+    """
+    LiquidationShield 需要的交易所操作, 倉位一律轉成 Binance get_account_information_v2 的 positions 格式,
+    策略端不需要知道是哪一個交易所
+
+    Args:
+        venue (Venue): 交易所
+        unified (bool): 合約保證金與資金在同一個帳戶 (ex: Bybit 統一帳戶), 不需要現貨與合約之間的劃轉
+    """
+    venue: Venue = None
+    unified: bool = False
+
+    def get_positions(self) -> list:
+        """
+        Return:
+            positions (list): get_account_information_v2 格式的倉位
+        """
+        raise NotImplementedError
+
+    def modify_isolated_margin(self, symbol: str, amount: Decimal, add: bool, position_side: str="BOTH"):
+        """
+        Args:
+            symbol (str): 逐倉交易對
+            amount (Decimal): 調整的數量
+            add (bool): True 為增加保證金, False 為減少
+            position_side (str): BOTH 為單向持倉, 對沖模式下為 LONG / SHORT
+        """
+        raise NotImplementedError
+
+    def transfer(self, asset: str, amount: Decimal, to_futures: bool):
+        """ 現貨與合約帳戶之間的劃轉, 統一帳戶不需要劃轉 """
+        if self.unified:
+            return None
+        raise NotImplementedError
+
+    def get_available_balance(self, asset: str) -> Decimal:
+        """ asset 可以拿來增加保證金的數量, 統一帳戶為錢包的可用餘額, 其他為現貨帳戶的可用餘額 (需要先劃轉) """
+        raise NotImplementedError
+
+
+class BinanceVenue(MarginVenue):
+    """
+    Args:
+        feature_http_client (BinanceUSDFeatureHttp): U 本位合約
+        spot_http_client (BinanceSpotHttp): 現貨, 用於劃轉
+        position_source (str): account: 帳戶資訊 V2 (含所有交易對), position_risk: 只取有持倉的精簡快照
+    """
+    venue = Venue.BINANCE
+
+    def __init__(self, feature_http_client: BinanceUSDFeatureHttp, spot_http_client: BinanceSpotHttp, position_source: str="account"):
+        self.feature_http_client = feature_http_client
+        self.spot_http_client = spot_http_client
+        self.position_source = position_source
+
+    def get_positions(self) -> list:
+        if self.position_source == "position_risk":
+            return self.feature_http_client.get_positions_snapshot()
+        return self.feature_http_client.get_account_information_v2()["positions"]
+
+    def modify_isolated_margin(self, symbol: str, amount: Decimal, add: bool, position_side: str="BOTH"):
+        kwargs = {"positionSide": position_side} if position_side != "BOTH" else {}
+        return self.feature_http_client.modify_isolated_position_margin(symbol=symbol, amount=amount, type=1 if add else 2, **kwargs)
+
+    def transfer(self, asset: str, amount: Decimal, to_futures: bool):
+        return self.spot_http_client.new_future_account_transfer(asset=asset, amount=amount, type=1 if to_futures else 2)
+
+    def get_available_balance(self, asset: str) -> Decimal:
+        # 只有現貨帳戶, 活存與借貸的部分由 LiquidationShield._collect_margin 處理
+        balances = self.spot_http_client.get_account_information(omitZeroBalances=True)["balances"]
+        balances = [balance for balance in balances if balance["asset"] == asset]
+        return Decimal(balances[0]["free"]) if balances else Decimal("0")
+
+
+# Bybit positionIdx <-> positionSide, 0 為單向持倉, 1 / 2 為對沖模式的買/賣方向
+BYBIT_POSITION_SIDES: dict = {0: "BOTH", 1: "LONG", 2: "SHORT"}
+
+
+class BybitVenue(MarginVenue):
+    """
+    Bybit 統一帳戶 (UTA) 的 USDT 永續合約, 只保護逐倉倉位, 全倉倉位共用整個錢包沒有可調整的保證金.
+    增加保證金直接使用錢包的可用餘額, 減少的保證金也直接回到錢包
+
+    Args:
+        http_client (BybitHttp): Bybit V5 client
+        page_size (int): 查詢倉位每頁的筆數, 上限 200
+    """
+    venue = Venue.BYBIT
+    unified = True
+
+    def __init__(self, http_client: BybitHttp, page_size: int=200):
+        self.http_client = http_client
+        self.page_size = page_size
+        self.position_idx = {} # (symbol, positionSide) -> positionIdx, 對沖模式下同一個 symbol 有兩個倉位
+
+    def get_positions(self) -> list:
+        positions, cursor = [], None
+        while True:
+            params = {"limit": self.page_size}
+            if cursor:
+                params["cursor"] = cursor
+            result = self.http_client.get_position_info(**params)
+
+            for position in result["list"]:
+                if int(position.get("tradeMode", 0)) != 1 or Decimal(position["size"] or "0") == 0:
+                    continue
+                account_position = self._to_account_position(position)
+                self.position_idx[(position["symbol"], account_position["positionSide"])] = int(position.get("positionIdx", 0))
+                positions.append(account_position)
+
+            cursor = result.get("nextPageCursor")
+            if not cursor or len(result["list"]) < self.page_size:
+                return positions
+
+    @staticmethod
+    def _to_account_position(position: dict) -> dict:
+        """ /v5/position/list 的欄位轉成 get_account_information_v2 格式 """
+
+        size = Decimal(position["size"])
+        position_amt = size if position["side"] == "Buy" else -size
+        mark_price = Decimal(position["markPrice"])
+        return {
+            "symbol": position["symbol"],
+            "positionSide": BYBIT_POSITION_SIDES[int(position.get("positionIdx", 0))],
+            "isolated": True,
+            "leverage": position["leverage"],
+            "positionAmt": str(position_amt),
+            "entryPrice": position["avgPrice"],
+            "markPrice": position["markPrice"],
+            "notional": str(position_amt * mark_price),
+            "initialMargin": position["positionIM"],
+            "maintMargin": position["positionMM"],
+            "unrealizedProfit": position["unrealisedPnl"],
+            "isolatedWallet": position["positionBalance"],
+        }
+
+    def modify_isolated_margin(self, symbol: str, amount: Decimal, add: bool, position_side: str="BOTH"):
+        position_idx = self.position_idx.get((symbol, position_side), 0)
+        return self.http_client.add_or_reduce_margin(symbol, amount if add else -amount, position_idx)
+
+    def get_available_balance(self, asset: str) -> Decimal:
+        # 只看 asset 本身的餘額, 帳戶層級的 totalAvailableBalance 以 USD 計價且包含其他抵押幣種
+        wallet = self.http_client.get_wallet_balance(coin=asset)["list"][0]
+        coins = [coin for coin in wallet["coin"] if coin["coin"] == asset]
+        if not coins:
+            return Decimal("0")
+        coin = coins[0]
+
+        # 統一帳戶的 availableToWithdraw 已停用 (回傳空字串), 改以錢包餘額扣掉被佔用的部分
+        if coin.get("availableToWithdraw"):
+            available = Decimal(coin["availableToWithdraw"])
+        else:
+            occupied = sum((Decimal(coin.get(field) or "0") for field in ("locked", "totalPositionIM", "totalOrderIM")), Decimal("0"))
+            available = Decimal(coin["walletBalance"] or "0") - occupied
+        return max(Decimal("0"), available)
@@ -1,21 +1,50 @@
-from strategy.binance_liquidation_shield import LiquidationShield
-from flask import Flask
+import os
 import threading
+from strategy.binance_liquidation_shield import LiquidationShield
+from strategy.account import load_accounts, load_venue_accounts
+from strategy.account_runner import AccountRunner
+
+
+def create_app():
+    """
+    健康檢查與 metrics 的 Flask app, Flask 的 import 約 0.2 秒, 放在巡邏開始之後才載入.
+    巡邏路徑的模組在 main thread 就先 import 完, 避免兩個 thread 同時 import (urllib3 內建的 six 會 deadlock)
+    """
+    from flask import Flask, Response
+    from utils.metrics import REGISTRY
+
+    app = Flask(__name__)
 
-app = Flask(__name__)
+    @app.route('/health')
+    def health_check():
+        return 'Service is up and running!'
 
-@app.route('/health')
-def health_check():
-    return 'Service is up and running!'
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
 
 def start_liquidation_shield():
+    # 有 ACCOUNTS_FILE 時由同一個 process 保護多個子帳戶
+    accounts_file = os.getenv("ACCOUNTS_FILE")
+    if accounts_file:
+        AccountRunner(load_accounts(accounts_file)).start()
+        return
+
+    # 同時保護多個交易所, 各交易所獨立排程, 一個交易所變慢不會延誤另一個
+    venues = [venue for venue in os.getenv("VENUES", "binance").split(",") if venue.strip()]
+    if venues != ["binance"]:
+        AccountRunner(load_venue_accounts(venues)).start()
+        return
+
     sentinel = LiquidationShield()
     sentinel.start()
 
 if __name__ == "__main__":
-    # 啟動 LiquidationShield 作為單獨的執行緒
+    # 先啟動 LiquidationShield 的執行緒, 冷啟動時第一輪巡邏不用等健康檢查伺服器載入
     thread = threading.Thread(target=start_liquidation_shield)
     thread.start()
-    
+
     # 啟動 Flask 伺服器來處理健康檢查
-    app.run(host='0.0.0.0', port=8080)
+    create_app().run(host='0.0.0.0', port=int(os.getenv("PORT", "8080")))
@@ -0,0 +1,109 @@
+import os
+import json
+
+from dataclasses import dataclass, field
+
+from gateway.venue import Venue
+
+# 各交易所的 key 環境變數名稱
+VENUE_KEY_ENVS: dict = {
+    Venue.BINANCE: ("BINANCE_API_KEY", "BINANCE_SECRET_KEY"),
+    Venue.BYBIT: ("BYBIT_API_KEY", "BYBIT_API_SECRET"),
+}
+
+
+@dataclass
+class AccountConfig:
+    """
+    單一子帳戶的設定
+
+    Args:
+        name (str): 帳戶名稱, 用於 log 與排程
+        api_key (str): API key
+        secret_key (str): secret key
+        settings (dict): 覆寫的參數, key 與環境變數同名, ex {"ADJUSTMENT_THRESHOLD": "5"}
+        venue (str): Venue, 帳戶所在的交易所
+    """
+    name: str
+    api_key: str
+    secret_key: str
+    settings: dict = field(default_factory=dict)
+    venue: str = Venue.BINANCE.value
+
+    def getenv(self, key: str, default: str=None) -> str:
+        """ 先找帳戶自己的設定, 沒有才讀環境變數 """
+        if key in self.settings:
+            return str(self.settings[key])
+        return os.getenv(key, default)
+
+    def __repr__(self) -> str:
+        # 避免 key 被印到 log
+        return f"AccountConfig(name={self.name!r}, venue={self.venue!r}, settings={self.settings!r})"
+
+
+def load_accounts(path: str) -> list:
+    """
+    從 JSON 檔讀取帳戶設定, key 可以直接寫在檔案內, 或用 api_key_env / secret_key_env 指定環境變數名稱
+
+    Example:
+        [
+            {"name": "sub-01", "api_key_env": "SUB01_API_KEY", "secret_key_env": "SUB01_SECRET_KEY"},
+            {"name": "sub-02", "api_key": "...", "secret_key": "...", "settings": {"BUFFER_AMOUNT": "2.0"}},
+            {"name": "bybit-01", "venue": "bybit", "api_key_env": "BYBIT_API_KEY", "secret_key_env": "BYBIT_API_SECRET"}
+        ]
+
+    Args:
+        path (str): 設定檔路徑
+
+    Return:
+        accounts (list[AccountConfig]): 帳戶設定
+
+    Raises:
+        ValueError: 帳戶名稱重複, 缺少 key 或不支援的交易所
+    """
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+
+    accounts, names = [], set()
+    for entry in entries:
+        name = entry["name"]
+        if name in names:
+            raise ValueError(f"帳戶名稱重複: {name}")
+        names.add(name)
+
+        api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""))
+        secret_key = entry.get("secret_key") or os.getenv(entry.get("secret_key_env", ""))
+        if not api_key or not secret_key:
+            raise ValueError(f"{name} 缺少 api_key 或 secret_key")
+
+        venue = Venue(entry.get("venue", Venue.BINANCE.value)).value
+        accounts.append(AccountConfig(name=name, api_key=api_key, secret_key=secret_key, settings=entry.get("settings", {}), venue=venue))
+    return accounts
+
+
+def load_venue_accounts(venues: list) -> list:
+    """
+    同一組帳戶同時保護多個交易所, 每個交易所一個 AccountConfig, key 讀各交易所的環境變數.
+    以交易所名稱為前綴的環境變數只覆寫該交易所的參數, ex BYBIT_PATROL_FREQUENCY=1.5
+
+    Args:
+        venues (list[str]): 交易所名稱, ex ["binance", "bybit"]
+
+    Return:
+        accounts (list[AccountConfig]): 帳戶名稱即交易所名稱
+
+    Raises:
+        ValueError: 不支援的交易所或缺少 key
+    """
+    accounts = []
+    for name in venues:
+        venue = Venue(name.strip().lower())
+        api_key_env, secret_key_env = VENUE_KEY_ENVS[venue]
+        api_key, secret_key = os.getenv(api_key_env), os.getenv(secret_key_env)
+        if not api_key or not secret_key:
+            raise ValueError(f"{venue.value} 缺少 {api_key_env} 或 {secret_key_env}")
+
+        prefix = f"{venue.value.upper()}_"
+        settings = {key[len(prefix):]: value for key, value in os.environ.items() if key.startswith(prefix)}
+        accounts.append(AccountConfig(name=venue.value, api_key=api_key, secret_key=secret_key, settings=settings, venue=venue.value))
+    return accounts
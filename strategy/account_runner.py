@@ -0,0 +1,133 @@
+import os
+import time
+import heapq
+import queue
+import itertools
+import threading
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gateway.rate_limiter import BUCKET_CAPACITY, IP_BUCKETS, DEFAULT_RATE_LIMITER
+from strategy.binance_liquidation_shield import LiquidationShield
+from utils.logger import get_logger
+
+logger = get_logger("strategy.account_runner")
+
+
+class PatrolShard:
+    """
+    在同一個 process 內巡邏多個帳戶. 以 heap 依到期時間排程 (earliest deadline first),
+    同一個帳戶同時只會有一輪巡邏, 較慢的帳戶只佔用一個 worker, 不會拖慢其他帳戶
+
+    Args:
+        accounts (list[AccountConfig]): 這個 shard 負責的帳戶
+        max_workers (int): 同時巡邏的帳戶數上限
+    """
+
+    def __init__(self, accounts: list, max_workers: int=None):
+        from gateway.binance_async_api import AsyncGatewayRunner # aiohttp 只在多帳戶時才需要在啟動時載入
+
+        self.max_workers = max_workers or int(os.getenv("ACCOUNT_THREADS", "8"))
+        self.async_runner = AsyncGatewayRunner()
+        self.shields = {account.name: LiquidationShield(account, self.async_runner) for account in accounts}
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="account")
+        self.completed = queue.Queue()
+        self.sequence = itertools.count()
+
+        # (到期時間, 序號, 帳戶名稱), 到期時間相同時先排入的先執行
+        self.heap = []
+        self.stream_threads = []
+        for name, shield in self.shields.items():
+            if shield.use_user_stream: # 事件觸發的帳戶自己常駐一個執行緒
+                thread = threading.Thread(target=shield.start, name=f"stream-{name}", daemon=True)
+                thread.start()
+                self.stream_threads.append(thread)
+            else:
+                self.heap.append((0.0, next(self.sequence), name))
+        heapq.heapify(self.heap)
+
+    def _patrol(self, name: str):
+        self.completed.put((name, self.shields[name].patrol_once()))
+
+    def run(self):
+        in_flight = 0
+        while self.heap or in_flight:
+
+            # 把已到期的帳戶交給 worker
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now and in_flight < self.max_workers:
+                _, _, name = heapq.heappop(self.heap)
+                self.pool.submit(self._patrol, name)
+                in_flight += 1
+
+            # 等到有巡邏完成, 或下一個帳戶到期
+            timeout = None
+            if self.heap and in_flight < self.max_workers:
+                timeout = max(0.0, self.heap[0][0] - now)
+            try:
+                name, patrol_delay = self.completed.get(timeout=timeout)
+            except queue.Empty:
+                continue
+
+            in_flight -= 1
+            heapq.heappush(self.heap, (time.monotonic() + patrol_delay, next(self.sequence), name))
+
+        for thread in self.stream_threads:
+            thread.join()
+
+
+def _run_shard(accounts: list, max_workers: int, ip_share: float=1.0):
+    """
+    Args:
+        ip_share (float): 這個 shard 可以使用的 IP 額度比例, 所有 shard 在同一個 IP 上, 合計不能超過交易所的上限
+    """
+    if ip_share < 1.0:
+        DEFAULT_RATE_LIMITER.set_capacity({name: int(BUCKET_CAPACITY[name] * ip_share) for name in IP_BUCKETS})
+    PatrolShard(accounts, max_workers).run()
+
+
+class AccountRunner:
+    """
+    一個 process 保護多個子帳戶: 帳戶以 round-robin 分成 processes 個 shard, 每個 shard 是一個獨立的 process,
+    帳戶之間的狀態與 UID 額度互相隔離, 增加帳戶時可以隨 CPU 核心數線性擴充.
+    IP 額度以 IP 計算: 同一個 shard 內的帳戶共用, 多個 shard 時每個 shard 分到 1 / processes
+
+    Args:
+        accounts (list[AccountConfig]): 所有帳戶
+        processes (int): shard 數, 1 代表在目前的 process 內執行
+        max_workers (int): 每個 shard 同時巡邏的帳戶數上限
+
+    Warning:
+        processes 大於 1 時, 各 shard 的 metrics 留在自己的 process, /metrics 只看得到主 process
+    """
+
+    def __init__(self, accounts: list, processes: int=None, max_workers: int=None):
+        self.accounts = accounts
+        self.processes = min(processes or int(os.getenv("ACCOUNT_PROCESSES", "1")), len(accounts))
+        self.max_workers = max_workers or int(os.getenv("ACCOUNT_THREADS", "8"))
+        self.restart_delay = float(os.getenv("SHARD_RESTART_DELAY", "5"))
+
+    def shards(self) -> list:
+        return [self.accounts[index::self.processes] for index in range(self.processes)]
+
+    def start(self):
+        logger.info(f"{len(self.accounts)} 個帳戶分成 {self.processes} 個 shard", extra={"processes": self.processes})
+        if self.processes <= 1:
+            return _run_shard(self.accounts, self.max_workers)
+
+        # spawn 讓每個 shard 都有乾淨的連線池與背景執行緒, 不繼承父 process 的狀態
+        context = multiprocessing.get_context("spawn")
+        shards = self.shards()
+        workers = {}
+        while True:
+            for index, accounts in enumerate(shards):
+                worker = workers.get(index)
+                if worker is None or not worker.is_alive():
+                    if worker is not None:
+                        logger.error(f"shard {index} 結束 (exit code {worker.exitcode}), 重新啟動")
+                    worker = context.Process(
+                        target=_run_shard, args=(accounts, self.max_workers, 1.0 / self.processes), name=f"shard-{index}", daemon=True)
+                    worker.start()
+                    workers[index] = worker
+            time.sleep(self.restart_delay)
@@ -0,0 +1,76 @@
+import os
+import heapq
+
+from enum import Enum
+from decimal import Decimal, ROUND_DOWN
+from dataclasses import replace
+
+# 分配到的金額無條件捨去到 1e-8, 確保總額不會超過可用的保證金
+AMOUNT_PRECISION: Decimal = Decimal("0.00000001")
+
+
+class AllocationPolicy(Enum):
+    GREEDY = "greedy"              # 依緊急程度逐一補滿, 不夠的最後一個只補部分
+    PROPORTIONAL = "proportional"  # 依需求比例分配, 每個倉位都補一部分
+
+
+class MarginAllocator:
+    """
+    增加保證金的排序與分配: 依距離強平的空間 (headroom) 由小到大排序, 最緊急的倉位最先執行,
+    保證金不足時依 policy 分配, 最危險倉位的保護時間不再受同一輪其他倉位的數量影響
+
+    Args:
+        policy (AllocationPolicy): 保證金不足時的分配方式
+        min_amount (Decimal): 分配到的金額低於此值就不調整, 避免送出過小的請求
+    """
+
+    def __init__(self, policy: AllocationPolicy=None, min_amount: Decimal=None):
+        self.policy = policy or AllocationPolicy(os.getenv("MARGIN_ALLOCATION_POLICY", "greedy").lower())
+        self.min_amount = min_amount if min_amount is not None else Decimal(os.getenv("MIN_ALLOCATION_AMOUNT", "1.0"))
+
+    @staticmethod
+    def rank(positions: list) -> list:
+        """
+        以 heap 依 headroom 由小到大排序, O(n log n)
+
+        Args:
+            positions (list[Position]): 要增加保證金的倉位
+
+        Return:
+            ranked (list[Position]): 最緊急的倉位在最前面, headroom 相同時維持原順序
+        """
+        heap = [(position.headroom, index, position) for index, position in enumerate(positions)]
+        heapq.heapify(heap)
+        return [heapq.heappop(heap)[2] for _ in range(len(heap))]
+
+    def allocate(self, positions: list, available_amount: Decimal) -> list:
+        """
+        在可用的保證金內決定每個倉位實際要增加的數量
+
+        Args:
+            positions (list[Position]): 要增加保證金的倉位
+            available_amount (Decimal): 已湊到的保證金
+
+        Return:
+            allocations (list[Position]): 依緊急程度排序, adjustment_limit 為分配後的數量, 沒分配到的倉位不會出現
+        """
+        ranked = self.rank(positions)
+        required_amount = sum((position.adjustment_limit for position in ranked), Decimal("0"))
+        if available_amount >= required_amount:
+            return ranked
+        if available_amount <= 0:
+            return []
+
+        if self.policy == AllocationPolicy.PROPORTIONAL:
+            ratio = available_amount / required_amount
+            amounts = [(position.adjustment_limit * ratio).quantize(AMOUNT_PRECISION, rounding=ROUND_DOWN) for position in ranked]
+        else:
+            amounts, remaining = [], available_amount
+            for position in ranked:
+                amount = min(position.adjustment_limit, remaining)
+                amounts.append(amount)
+                remaining -= amount
+
+        return [
+            replace(position, adjustment_limit=amount)
+            for position, amount in zip(ranked, amounts) if amount >= self.min_amount]
@@ -1,54 +1,168 @@
 import os
 import time
-import pandas as pd
-import pytz
-from datetime import datetime
-from enum import Enum
+import threading
+from typing import TYPE_CHECKING
 from decimal import Decimal
 from dotenv import load_dotenv
 load_dotenv()
 
 from gateway.binance_api import BinanceSpotHttp, BinanceUSDFeatureHttp
 from gateway.binance_api import AcountType
+from gateway.bybit_api import BybitHttp
+from gateway.venue import Venue, BinanceVenue, BybitVenue
+from gateway.cache import ResponseCache
+from gateway.rate_limiter import RateLimiter, DEFAULT_RATE_LIMITER
+from strategy.position import Position, AdjustmentSide, CurrentAsset
+from strategy.position_book import IncrementalPositionBook, PositionEventType
+from strategy.margin_model import LeverageBrackets, MarginModel
+from strategy.liquidity_reserve import LiquidityReserve
+from strategy.executor import MarginExecutor, CycleReport
+from strategy.scheduler import AdaptiveScheduler
+from strategy.transfer_planner import TransferType, plan_transfers
+from strategy.allocator import MarginAllocator
+from strategy.account import AccountConfig
+from utils.metrics import PATROL_DURATION, PATROL_FAILURES, ADJUSTMENTS, ADJUSTMENT_AMOUNT, TRANSFER_CALLS_SAVED
+from utils.metrics import mark_patrol_success
+from utils.logger import get_logger, new_cycle_id, set_account
+
+if TYPE_CHECKING: # aiohttp 與 websocket 只在需要時才載入, 這裡只給型別標註使用
+    from gateway.binance_async_api import AsyncGatewayRunner, AsyncBinanceSpotHttp
+    from strategy.user_stream import StreamEventType
+
+logger = get_logger("strategy.liquidation_shield")
+
+# aiohttp (async client / user data stream) 與 numpy (PositionTable) 只在用到時才 import, 冷啟動不需要等它們載入
 
-# TODO: 用 logging 不要用 print
 # TODO: 新增去槓桿參數
 # TODO: 對衝 Sui, Solana 2 倍槓桿, 鏈上質押, 找到一個平衡點
 
-class AdjustmentSide(Enum):
-    ADD = "ADD"
-    REDUCE = "REDUCE"
-
-
-class CurrentAsset(Enum):
-    USDT = "USDT"
-
-
 class LiquidationShield:
 
-    def __init__(self):
+    def __init__(self, account: AccountConfig=None, async_runner: "AsyncGatewayRunner"=None):
         """
         Args:
+            account (AccountConfig): 多帳戶執行時的帳戶設定, 帶有各自的 key, 交易所與覆寫的參數, 沒給就讀環境變數
+            async_runner (AsyncGatewayRunner): 同一個 process 內的帳戶可以共用一個背景 event loop
             adjustment_threshold (float): 當可調整額度達到此閥值, 才開始進行調整
             patrol_frequency (float): 多久巡邏一次要不要調整
             cooldown_period (float): 發生 Error 時, 要停幾秒
             buffer_amount (Decimal): 為了避免時間差, 加入一些調整保證金的 buffer_amount
+            use_user_stream (bool): 改用 user data stream 事件觸發調整, REST 只做慢速對帳
+            reconcile_frequency (float): user data stream 模式下, 多久用 REST 對帳一次
+            use_position_table (bool): 用 NumPy 倉位表整欄計算, 適合持有上百個逐倉倉位的子帳戶
+            incremental_position_book (bool): 跨巡邏保留倉位簿, 只重算與上一輪快照不同的倉位, 優先於 use_position_table
+            margin_model (bool): 用快取的槓桿分層在本地計算 margin ratio, 超過 MAX_MARGIN_RATIO 才增加保證金,
+                數量補到 TARGET_MARGIN_RATIO 而不是 adjustment_limit - buffer_amount, 只支援 Binance, 優先於其他倉位計算方式
+            liquidity_reserve (bool): 背景執行緒在現貨帳戶預先保留 USDT 浮存, 增加保證金時通常不需要贖回活存或借款, 只支援 Binance
+            max_concurrent_adjustments (int): 同時調整的 symbol 數上限, 1 為逐一執行
+            adaptive_patrol (bool): 依倉位距離強平的空間與波動決定巡邏間隔, 取代固定的 patrol_frequency
+            net_transfer (bool): 同一輪的減少/增加保證金先在合約帳戶內互抵, 現貨與合約之間只劃轉淨額
+            margin_allocator (MarginAllocator): 增加保證金依緊急程度排序, 保證金不足時依 MARGIN_ALLOCATION_POLICY 分配
+            venue (MarginVenue): 倉位查詢與保證金調整都經過這個介面, Bybit 統一帳戶直接用錢包餘額, 沒有三道防線與劃轉
 
         Warning:
-            目前取回活期存款 API 有 3 秒的限制, 所以 patrol_frequency 建議不要低於 3
+            取回活期存款 API 有 3 秒的限制, 已由 gateway 的 RateLimiter 排隊控管, patrol_frequency 可以低於 3,
+            但過低時贖回會被延後到冷卻結束
         """
-        self.feature_http_client = BinanceUSDFeatureHttp()
-        self.spot_http_client = BinanceSpotHttp()
-
-        self.adjustment_threshold = Decimal(os.getenv("ADJUSTMENT_THRESHOLD", "3.0"))
-        self.patrol_frequency = float(os.getenv("PATROL_FREQUENCY", "3.5"))
-        self.cooldown_period = float(os.getenv("COOLDOWN_PERIOD", "1.0"))
-        self.buffer_amount = Decimal(os.getenv("BUFFER_AMOUNT", "1.0"))
-        self.ltv_limit = Decimal(os.getenv("LTV_LIMIT", "0.7"))
-        self.demand_product_id = { # 活期存款的產品代碼
+        getenv = account.getenv if account is not None else os.getenv
+
+        self.account_name = account.name if account is not None else None
+        self._async_runner = async_runner
+        self._async_spot_http_client = None
+        self._async_client_kwargs = {}
+        self.response_cache = None
+        self.feature_http_client = self.spot_http_client = None
+
+        venue = Venue(account.venue if account is not None else Venue.BINANCE.value)
+        if venue == Venue.BYBIT:
+            credentials = {"api_key": account.api_key, "api_secret": account.secret_key} if account is not None else {}
+            self.venue = BybitVenue(BybitHttp(**credentials))
+        else:
+            # 每個帳戶有自己的限流器, UID 額度各自計算; IP 額度以 IP 計算, 同一個 process 內的帳戶共用
+            credentials = {"api_key": account.api_key, "secret_key": account.secret_key} if account is not None else {}
+            rate_limiter = RateLimiter(shared=DEFAULT_RATE_LIMITER) if account is not None else None
+            self.feature_http_client = BinanceUSDFeatureHttp(rate_limiter=rate_limiter, **credentials)
+            self.spot_http_client = BinanceSpotHttp(rate_limiter=rate_limiter, **credentials)
+
+            # 三道防線的查詢改為同時送出, 最差情況的延遲從三次 round trip 降為一次, client 在第一次湊保證金時才建立
+            self._async_client_kwargs = {"rate_limiter": rate_limiter, **credentials}
+
+            # 現貨/活存/借款的查詢結果在短時間內重複使用, 自己的劃轉/贖回/借款會直接修正快取
+            response_cache_ttl = float(getenv("RESPONSE_CACHE_TTL", "0"))
+            self.response_cache = ResponseCache(response_cache_ttl) if response_cache_ttl > 0 else None
+            self.spot_http_client.response_cache = self.response_cache
+
+            # account: 帳戶資訊 V2 (含所有交易對), position_risk: 只取有持倉的精簡快照, 倉位多時 response 小很多
+            position_source = getenv("POSITION_SOURCE", "account").lower()
+            self.venue = BinanceVenue(self.feature_http_client, self.spot_http_client, position_source)
+
+        self.adjustment_threshold = Decimal(getenv("ADJUSTMENT_THRESHOLD", "3.0"))
+        self.patrol_frequency = float(getenv("PATROL_FREQUENCY", "3.5"))
+        self.cooldown_period = float(getenv("COOLDOWN_PERIOD", "1.0"))
+        self.buffer_amount = Decimal(getenv("BUFFER_AMOUNT", "1.0"))
+        self.ltv_limit = Decimal(getenv("LTV_LIMIT", "0.7"))
+        # user data stream 只支援 Binance
+        self.use_user_stream = getenv("USE_USER_STREAM", "false").lower() == "true" and venue == Venue.BINANCE
+        self.reconcile_frequency = float(getenv("RECONCILE_FREQUENCY", "60"))
+        self.use_position_table = getenv("USE_POSITION_TABLE", "false").lower() == "true"
+        self.incremental_book = IncrementalPositionBook(self.buffer_amount, self.adjustment_threshold) \
+            if getenv("INCREMENTAL_POSITION_BOOK", "false").lower() == "true" else None
+        self.margin_model = None
+        if getenv("MARGIN_MODEL", "false").lower() == "true" and venue == Venue.BINANCE:
+            # 槓桿分層很少變動, 預設一小時才重新查詢一次
+            self.margin_model = MarginModel(
+                LeverageBrackets(self.feature_http_client, float(getenv("LEVERAGE_BRACKET_TTL", "3600"))),
+                target_margin_ratio=Decimal(getenv("TARGET_MARGIN_RATIO", "0.2")),
+                max_margin_ratio=Decimal(getenv("MAX_MARGIN_RATIO", "0.3")),
+                min_margin_ratio=Decimal(getenv("MIN_MARGIN_RATIO", "0.1")),
+            )
+        self.liquidity_reserve = None
+        if getenv("LIQUIDITY_RESERVE", "false").lower() == "true" and venue == Venue.BINANCE:
+            self.liquidity_reserve = LiquidityReserve(
+                self.spot_http_client,
+                min_float=Decimal(getenv("RESERVE_MIN_FLOAT", "0")),
+                max_float=Decimal(getenv("RESERVE_MAX_FLOAT", "10000")),
+                volume_window=float(getenv("RESERVE_VOLUME_WINDOW", "3600")),
+                shock=Decimal(getenv("RESERVE_SHOCK", "0.02")),
+                calm_period=float(getenv("RESERVE_CALM_PERIOD", "60")),
+                tolerance=Decimal(getenv("RESERVE_TOLERANCE", "0.2")),
+                interval=float(getenv("RESERVE_INTERVAL", "30")),
+                use_loan=getenv("RESERVE_USE_LOAN", "false").lower() == "true",
+                ltv_limit=self.ltv_limit,
+                account_name=self.account_name,
+            )
+        self.margin_executor = MarginExecutor()
+        self.last_cycle_report = None
+        self.scheduler = None
+        if getenv("ADAPTIVE_PATROL", "false").lower() == "true":
+            self.scheduler = AdaptiveScheduler(
+                max_interval=float(getenv("ADAPTIVE_MAX_INTERVAL", str(self.patrol_frequency))),
+                trigger_offset=float(self.adjustment_threshold + self.buffer_amount),
+                rate_limiter=self.feature_http_client.rate_limiter if self.feature_http_client is not None else None,
+            )
+        self.net_transfer = getenv("NET_TRANSFER", "false").lower() == "true"
+        self.margin_allocator = MarginAllocator()
+        self.demand_product_id = { # 活期存款的產品代碼, 沒有列出的 asset 不使用活存防線
             "USDT": "USDT001",
+            "USDC": "USDC001",
         }
 
+    @property
+    def async_runner(self) -> "AsyncGatewayRunner":
+        if self._async_runner is None:
+            from gateway.binance_async_api import AsyncGatewayRunner
+            self._async_runner = AsyncGatewayRunner()
+        return self._async_runner
+
+    @property
+    def async_spot_http_client(self) -> "AsyncBinanceSpotHttp":
+        """ 只有 Binance 有, 第一次用到時才建立 """
+        if self._async_spot_http_client is None and self.venue.venue == Venue.BINANCE:
+            from gateway.binance_async_api import AsyncBinanceSpotHttp
+            self._async_spot_http_client = AsyncBinanceSpotHttp(**self._async_client_kwargs)
+            self._async_spot_http_client.response_cache = self.response_cache
+        return self._async_spot_http_client
+
     def _collect_margin(self, target_asset: str, adjustment_amount: Decimal):
         """ 
         從各個地方湊到所需的保證金, 並放到現貨帳戶, 
@@ -65,8 +179,24 @@ class LiquidationShield:
         """
         message = None
 
+        if self.venue.unified:
+            return self._collect_unified_margin(target_asset, adjustment_amount)
+
+        # 預先保留的浮存足夠時, 不需要查詢三道防線
+        if self.liquidity_reserve is not None and self.liquidity_reserve.draw(target_asset, adjustment_amount):
+            return {"success": True, "message": message, "lack_amount": Decimal("0")}
+
+        # 一次查詢三道防線的現況, 某道防線查詢失敗只在真的用到那道防線時才拋出, 現貨足夠時不受活存/借貸影響
+        account_information, flexible_position, ongoing_loan = self.async_runner.gather(
+            self.async_spot_http_client.get_account_information(omitZeroBalances=True),
+            self.async_spot_http_client.get_flexible_product_position(asset=target_asset),
+            self.async_spot_http_client.get_flexible_loan_ongoing_orders(collateralCoin="BTC", loanCoin=target_asset),
+            return_exceptions=True,
+        )
+
         # Defense 1: 現貨帳戶 ==============================================================================================================
-        account_information = self.spot_http_client.get_account_information(omitZeroBalances=True)
+        if isinstance(account_information, Exception):
+            raise account_information
         account_balance = account_information['balances'] 
         target_account_balance = [asset for asset in account_balance if asset["asset"] == target_asset]
 
@@ -83,11 +213,16 @@ class LiquidationShield:
             else:
                 adjustment_amount = adjustment_amount - free_balance
 
-        print(f"現貨額度不足, 缺少 {adjustment_amount}U")
+        logger.info(f"現貨額度不足, 缺少 {adjustment_amount}U")
 
         # Defense 2: 活存帳戶 ==============================================================================================================
-        flexible_position = self.spot_http_client.get_flexible_product_position(asset=target_asset)
-        flexible_position = [asset for asset in flexible_position["rows"] if asset["productId"] == self.demand_product_id[target_asset]]
+        product_id = self.demand_product_id.get(target_asset)
+        if product_id is None: # 這個 asset 沒有活期存款產品, 直接進到下一道防線
+            flexible_position = []
+        elif isinstance(flexible_position, Exception):
+            raise flexible_position
+        else:
+            flexible_position = [asset for asset in flexible_position["rows"] if asset["productId"] == product_id]
 
         if flexible_position: # 確認有活期存款資料再執行下去
             flexible_position = flexible_position[0]
@@ -111,10 +246,13 @@ class LiquidationShield:
             if adjustment_amount == Decimal("0"):
                 return {"success": True, "message": message, "lack_amount": adjustment_amount}
         
-        print(f"活存額度不足, 缺少 {adjustment_amount}U")
+        logger.info(f"活存額度不足, 缺少 {adjustment_amount}U")
 
         # Defense 3: BTC 借貸 ==============================================================================================================
-        ongoing_loan = self.spot_http_client.get_flexible_loan_ongoing_orders(collateralCoin="BTC", loanCoin=target_asset)
+        if isinstance(ongoing_loan, Exception):
+            raise ongoing_loan
+        if not ongoing_loan["rows"]: # 沒有進行中的借貸, 無法再借
+            return {"success": False, "message": message, "lack_amount": adjustment_amount}
         ongoing_loan = ongoing_loan["rows"][0]
         current_ltv = Decimal(ongoing_loan["currentLTV"])
 
@@ -142,7 +280,16 @@ class LiquidationShield:
 
         return {"success": False, "message": message, "lack_amount": adjustment_amount}
     
-    def _add_position_margin(self, symbol: str, adjustment_amount: Decimal, target_asset: str):
+    def _collect_unified_margin(self, target_asset: str, adjustment_amount: Decimal) -> dict:
+        """ 統一帳戶的保證金直接來自錢包, 只確認可用餘額是否足夠 """
+
+        available_balance = self.venue.get_available_balance(target_asset)
+        lack_amount = max(Decimal("0"), adjustment_amount - available_balance)
+        if lack_amount > 0:
+            logger.info(f"錢包可用額度不足, 缺少 {lack_amount}{target_asset}")
+        return {"success": lack_amount == 0, "message": None, "lack_amount": lack_amount}
+
+    def _add_position_margin(self, symbol: str, adjustment_amount: Decimal, target_asset: str, position_side: str="BOTH"):
         """
         增加逐倉合約保證金. From 現貨帳戶 to 逐倉帳戶
 
@@ -150,19 +297,18 @@ class LiquidationShield:
             symbol (str): 要調整的逐倉交易
             adjustment_amount (Decimal): 要調整的數量
             target_asset (str): 目標調整 asset
+            position_side (str): 對沖模式下的 LONG / SHORT
         """
 
         # 從現貨帳戶轉到合約帳戶
-        self.spot_http_client.new_future_account_transfer(
-            asset=target_asset, amount=adjustment_amount, type=1)
+        self.venue.transfer(asset=target_asset, amount=adjustment_amount, to_futures=True)
         
         # 從合約帳戶轉到目標逐倉帳戶
-        self.feature_http_client.modify_isolated_position_margin(
-            symbol=symbol, amount=adjustment_amount, type=1)
+        self.venue.modify_isolated_margin(symbol=symbol, amount=adjustment_amount, add=True, position_side=position_side)
 
         return {"success": True}
 
-    def _reduce_position_margin(self, symbol: str, adjustment_amount: Decimal, target_asset: str) -> dict:
+    def _reduce_position_margin(self, symbol: str, adjustment_amount: Decimal, target_asset: str, position_side: str="BOTH") -> dict:
         """ 
         減少逐倉合約保證金, 並轉到現貨帳戶, 等時間到系統會自動轉活存
 
@@ -170,77 +316,210 @@ class LiquidationShield:
             symbol (str): 要調整的逐倉交易
             adjustment_amount (Decimal): 要調整的數量
             target_asset (str): 調整的 asset
+            position_side (str): 對沖模式下的 LONG / SHORT
         """
  
         # Step 1: 提取到合約帳戶
-        self.feature_http_client.modify_isolated_position_margin(
-            symbol=symbol, amount=adjustment_amount, type=2)
+        self.venue.modify_isolated_margin(symbol=symbol, amount=adjustment_amount, add=False, position_side=position_side)
         
         # Step 2: 提取到現貨帳戶
-        self.spot_http_client.new_future_account_transfer(
-            asset=target_asset, amount=adjustment_amount, type=2)
+        self.venue.transfer(asset=target_asset, amount=adjustment_amount, to_futures=False)
+        if self.liquidity_reserve is not None:
+            self.liquidity_reserve.credit(target_asset, adjustment_amount)
+
+        return {"success": True}
+
+    def _release_position_margin(self, symbol: str, adjustment_amount: Decimal, target_asset: str, position_side: str="BOTH") -> dict:
+        """ 減少逐倉保證金, 資金留在合約帳戶, 由 _execute_transfer_plan 統一劃轉淨額 """
+
+        self.venue.modify_isolated_margin(symbol=symbol, amount=adjustment_amount, add=False, position_side=position_side)
 
         return {"success": True}
+
+    def _fund_position_margin(self, symbol: str, adjustment_amount: Decimal, target_asset: str, position_side: str="BOTH") -> dict:
+        """ 從合約帳戶增加逐倉保證金, 合約帳戶的資金已由 _execute_transfer_plan 準備好 """
+
+        self.venue.modify_isolated_margin(symbol=symbol, amount=adjustment_amount, add=True, position_side=position_side)
+
+        return {"success": True}
+
+    def _execute_transfer_plan(self, positions_for_adjustment: list, report: CycleReport):
+        """
+        依 asset 計算整輪的淨資金流: 減少保證金釋放的資金留在合約帳戶直接補給需要增加的倉位,
+        不足的部分才從現貨帳戶劃轉, 多出來的部分才轉回現貨帳戶, 每個 asset 最多一次劃轉
+
+        Args:
+            positions_for_adjustment (list[Position]): 本輪需要調整的倉位
+            report (CycleReport): 累加調整結果
+        """
+
+        for plan in plan_transfers(positions_for_adjustment).values():
+
+            # Step 1: 釋放保證金到合約帳戶, 以實際成功的數量計算
+            release_report = self.margin_executor.run(self._release_position_margin, plan.release)
+            report.results.extend(release_report.results)
+            released_amount = sum((result.amount for result in release_report.results if result.success), Decimal("0"))
+
+            # Step 2: 不足的部分先湊到現貨帳戶, 真的不夠就依緊急程度分配
+            fund_positions = self.margin_allocator.rank(plan.fund)
+            required_amount = plan.required_amount
+            if required_amount > released_amount:
+                response = self._collect_margin(target_asset=plan.asset, adjustment_amount=required_amount - released_amount)
+                if response["success"] is not True:
+                    logger.warning(f'本次調整還缺少 {response["lack_amount"]}{plan.asset} 保證金')
+                    fund_positions = self.margin_allocator.allocate(plan.fund, required_amount - response["lack_amount"])
+                    required_amount = sum((position.adjustment_limit for position in fund_positions), Decimal("0"))
+
+            # Step 3: 現貨與合約帳戶之間只劃轉一次淨額
+            transfer = plan.net_transfer(released_amount, required_amount)
+            if transfer is not None:
+                transfer_type, transfer_amount = transfer
+                try:
+                    self.venue.transfer(
+                        asset=plan.asset, amount=transfer_amount, to_futures=transfer_type == TransferType.SPOT_TO_FUTURES)
+                except Exception:
+                    if self.liquidity_reserve is not None:
+                        self.liquidity_reserve.invalidate()
+                    raise
+                if self.liquidity_reserve is not None and transfer_type == TransferType.FUTURES_TO_SPOT:
+                    self.liquidity_reserve.credit(plan.asset, transfer_amount)
+
+            # Step 4: 補保證金
+            self.margin_executor.run(self._fund_position_margin, fund_positions, report)
+
+            calls_saved = plan.naive_calls - plan.planned_calls(transfer)
+            TRANSFER_CALLS_SAVED.inc(calls_saved, asset=plan.asset)
+            logger.info(
+                f"{plan.asset} 淨劃轉 {transfer[1] if transfer else 0}, 節省 {calls_saved} 次 API 呼叫",
+                extra={"released": str(released_amount), "required": str(required_amount), "calls_saved": calls_saved})
     
-    def _get_positions_for_adjustment(self) -> pd.DataFrame:
+    def _fetch_positions(self) -> list:
+        """
+        Return:
+            positions (list): get_account_information_v2 格式的倉位
+        """
+        return self.venue.get_positions()
 
-        # 掃描現有倉位狀態, 並轉為 dataframe
-        account_info = self.feature_http_client.get_account_information_v2()
-        my_positions = [position for position in account_info["positions"] if Decimal(position["positionAmt"]) != 0]
-        df_positions = pd.DataFrame(my_positions)
-
-        # 計算可調整額度
-        df_positions["adjustment_limit"] = df_positions.apply(
-            lambda position: \
-                Decimal(position["isolatedWallet"]) - Decimal(position["initialMargin"]) + Decimal(position["unrealizedProfit"]),
-            axis=1)
-        
-        # 確認調整資產是 USDT or USDC
-        df_positions["asset"] = df_positions["symbol"].apply(
-            lambda x: CurrentAsset.USDT.value if x.endswith(CurrentAsset.USDT.value) else CurrentAsset.USDC.value)
-        
-        # 確認保證金調整方向
-        df_positions["adjustment_side"] = df_positions["adjustment_limit"].apply(
-            lambda x: AdjustmentSide.ADD.value if x < 0 else AdjustmentSide.REDUCE.value)
+    def _get_positions_for_adjustment(self, positions: list=None) -> list:
+        """
+        Args:
+            positions (list): get_account_information_v2 格式的倉位, 沒給的話就打 REST 取得
+
+        Return:
+            positions_for_adjustment (list[Position]): 超過調整門檻的倉位
+        """
+
+        # 掃描現有倉位狀態, 並轉為 Position
+        if positions is None:
+            positions = self._fetch_positions()
+
+        if self.margin_model is not None:
+            return self._get_positions_for_adjustment_model(positions)
+
+        if self.incremental_book is not None:
+            return self._get_positions_for_adjustment_incremental(positions)
+
+        if self.use_position_table:
+            return self._get_positions_for_adjustment_vectorized(positions)
+
+        my_positions = [
+            Position.from_account_position(position, self.buffer_amount)
+            for position in positions if Decimal(position["positionAmt"]) != 0]
 
-        # 確認調整倉為並扣除 buffrt
-        df_positions["adjustment_limit"] = df_positions["adjustment_limit"].apply(
-            lambda x: abs(x) - self.buffer_amount)
-        
         # print 不需調整的 position
-        df_show = df_positions[df_positions["adjustment_limit"] < self.adjustment_threshold]
-        df_show.apply(
-            lambda row: print(f'{row["symbol"]} 預計調整 {row["adjustment_limit"]}{row["asset"]} 保證金, 未達門檻暫時不作動'),
-            axis=1)
-        
+        for position in my_positions:
+            if position.adjustment_limit < self.adjustment_threshold:
+                logger.info(
+                    f'{position.symbol} 預計調整 {position.adjustment_limit}{position.asset} 保證金, 未達門檻暫時不作動',
+                    extra={"throttle_key": f"below_threshold:{position.symbol}"})
+
         # 移除調整幅度過小的 position
-        df_positions_for_adjustment = df_positions[df_positions["adjustment_limit"] > self.adjustment_threshold]
-        df_positions_for_adjustment = df_positions_for_adjustment.reset_index(drop=True)
+        positions_for_adjustment = [position for position in my_positions if position.adjustment_limit > self.adjustment_threshold]
 
-        return df_positions_for_adjustment
+        return positions_for_adjustment
 
-    def _start_patrol(self):
+    def _get_positions_for_adjustment_model(self, positions: list) -> list:
+        """ 由本地保證金模型決定調整方向與數量, margin ratio 在 MIN_MARGIN_RATIO ~ MAX_MARGIN_RATIO 之間不調整 """
 
-        df_positions_for_adjustment = self._get_positions_for_adjustment()
+        positions_for_adjustment = []
+        for raw in positions:
+            if Decimal(raw["positionAmt"]) == 0:
+                continue
+            position = self.margin_model.plan(raw, self.buffer_amount)
+            if position.adjustment_limit > self.adjustment_threshold:
+                positions_for_adjustment.append(position)
+            elif position.adjustment_limit > 0: # print 不需調整的 position
+                logger.info(
+                    f'{position.symbol} 預計調整 {position.adjustment_limit}{position.asset} 保證金, 未達門檻暫時不作動',
+                    extra={"throttle_key": f"below_threshold:{position.symbol}"})
 
-        # 減少保證金
-        df_reduce_mergin = df_positions_for_adjustment[df_positions_for_adjustment["adjustment_side"] == AdjustmentSide.REDUCE.value]
-        if df_reduce_mergin.empty is False:
-            
-            # TODO: 目前用 for 迴圈是為了要保證執行的維持, 可找其他方案優化
-            for _, row in df_reduce_mergin.iterrows():
-                self._reduce_position_margin(
-                    symbol=row["symbol"], 
-                    adjustment_amount=row["adjustment_limit"],
-                    target_asset=row["asset"])
-                print(f'{row["symbol"]} 減少 {row["adjustment_limit"]}{row["asset"]} 保證金')
+        return positions_for_adjustment
+
+    def _get_positions_for_adjustment_incremental(self, positions: list) -> list:
+        """ 與 _get_positions_for_adjustment 相同結果, 但只重算有變動的倉位 """
+
+        for event in self.incremental_book.update(positions):
+            position = event.position
+            if event.event_type == PositionEventType.CLOSED:
+                logger.info(f"{event.symbol} 已平倉")
+            elif position.adjustment_limit < self.adjustment_threshold: # print 不需調整的 position
+                logger.info(
+                    f'{position.symbol} 預計調整 {position.adjustment_limit}{position.asset} 保證金, 未達門檻暫時不作動',
+                    extra={"throttle_key": f"below_threshold:{position.symbol}"})
+
+        return self.incremental_book.positions_for_adjustment()
+
+    def _get_positions_for_adjustment_vectorized(self, positions: list) -> list:
+        """ 與 _get_positions_for_adjustment 相同結果, 但改用 PositionTable 整欄計算 """
+        from strategy.position_table import PositionTable
+
+        table = PositionTable.from_account_positions(positions)
+        evaluation = table.evaluate(self.buffer_amount, self.adjustment_threshold)
+
+        # print 不需調整的 position
+        for position in table.to_positions(evaluation, evaluation["below_threshold"]):
+            logger.info(
+                f'{position.symbol} 預計調整 {position.adjustment_limit}{position.asset} 保證金, 未達門檻暫時不作動',
+                extra={"throttle_key": f"below_threshold:{position.symbol}"})
+
+        # 移除調整幅度過小的 position
+        return table.to_positions(evaluation, evaluation["above_threshold"])
+
+    def _start_patrol(self, positions: list=None) -> list:
+        """
+        Args:
+            positions (list): get_account_information_v2 格式的倉位, 沒給的話就打 REST 取得
+
+        Return:
+            adjustments (list): 本次實際執行的調整, 每筆為 {"symbol", "side", "amount"}
+        """
+
+        report = CycleReport()
+        if positions is None:
+            positions = self._fetch_positions()
+
+        # 浮存的目標依倉位風險決定, 背景執行緒在第一輪巡邏之後才啟動, 冷啟動不會與巡邏搶 import
+        if self.liquidity_reserve is not None:
+            self.liquidity_reserve.observe_positions(positions)
+            self.liquidity_reserve.start()
+
+        positions_for_adjustment = self._get_positions_for_adjustment(positions)
+
+        if self.net_transfer:
+            self._execute_transfer_plan(positions_for_adjustment, report)
+            positions_for_adjustment = []
+
+        # 減少保證金, 不同 symbol 之間平行執行, 同一個 symbol 內仍依序 (調整逐倉 -> 劃轉)
+        reduce_positions = [position for position in positions_for_adjustment if position.adjustment_side == AdjustmentSide.REDUCE.value]
+        self.margin_executor.run(self._reduce_position_margin, reduce_positions, report)
         
-        # 增加保證金
-        df_add_mergin = df_positions_for_adjustment[df_positions_for_adjustment["adjustment_side"] == AdjustmentSide.ADD.value]
-        if df_add_mergin.empty is False:
+        # 增加保證金, 距離強平最近的倉位最先執行
+        add_positions = self.margin_allocator.rank(
+            [position for position in positions_for_adjustment if position.adjustment_side == AdjustmentSide.ADD.value])
+        if add_positions:
 
             # 把所有需要的保證金先轉到現貨帳戶
-            total_add_amount = df_add_mergin["adjustment_limit"].sum()
+            total_add_amount = sum(position.adjustment_limit for position in add_positions)
             response = self._collect_margin(
                 target_asset=CurrentAsset.USDT.value, 
                 adjustment_amount=total_add_amount)
@@ -248,75 +527,136 @@ class LiquidationShield:
             # 開始調整
             if response["success"] is True: # 資源足夠, 開始進行調整
 
-                # TODO: 目前用 for 迴圈是為了要保證執行的維持, 可找其他方案優化
-                for _, row in df_add_mergin.iterrows():
-                    self._add_position_margin(
-                        symbol=row["symbol"], 
-                        adjustment_amount=row["adjustment_limit"], 
-                        target_asset=row["asset"])
-                    
-                    print(f'{row["symbol"]} 增加 {row["adjustment_limit"]}{row["asset"]} 保證金')
+                # 不同 symbol 之間平行執行, 同一個 symbol 內仍依序 (劃轉 -> 調整逐倉)
+                self.margin_executor.run(self._add_position_margin, add_positions, report)
 
-            else: 
-                print(f'本次調整還缺少 {response["lack_amount"]}{row["asset"]} 保證金')
-                # TODO: 如果保證金真的不夠, 要有排序跟比例給最緊急的 position 最多
-                # 考慮是要全保還是放棄單一
+            else: # 保證金不夠, 已湊到的部分依緊急程度分配
+                logger.warning(f'本次調整還缺少 {response["lack_amount"]}{CurrentAsset.USDT.value} 保證金')
+                allocations = self.margin_allocator.allocate(add_positions, total_add_amount - response["lack_amount"])
+                self.margin_executor.run(self._add_position_margin, allocations, report)
+
+        for result in report.results:
+            action = "增加" if result.side == AdjustmentSide.ADD.value else "減少"
+            ADJUSTMENTS.inc(symbol=result.symbol, side=result.side, result="success" if result.success else "error")
+            if result.success:
+                ADJUSTMENT_AMOUNT.inc(float(result.amount), symbol=result.symbol, side=result.side, asset=result.asset)
+                logger.info(f'{result.symbol} {action} {result.amount}{result.asset} 保證金', extra={"elapsed": result.elapsed})
+            else:
+                logger.error(f'{result.symbol} {action}保證金失敗: {result.error}')
+                if self.liquidity_reserve is not None and result.side == AdjustmentSide.ADD.value:
+                    self.liquidity_reserve.invalidate()
+        self.last_cycle_report = report
 
         # TODO: 監控帳戶狀態, ex 借款 LTV, 目前活存金額, 總槓桿數
          
-        return None
+        return report.adjustments()
 
-        # Step 2: 開始逐一判斷是否需要調整
-        for position in my_positions:
+    def _on_stream_update(self, event_type: "StreamEventType", symbols: set):
+        """ user data stream 的 callback, 只負責喚醒巡邏, 實際調整在巡邏執行緒進行 """
+        from strategy.user_stream import StreamEventType
 
-            # 計算可調整額度
-            symbol=position["symbol"]
-            adjustment_limit = \
-                Decimal(position["isolatedWallet"]) - Decimal(position["initialMargin"]) + Decimal(position["unrealizedProfit"])
+        # mark price 每秒都會推播, 只有超過門檻才喚醒, 避免空轉
+        if event_type == StreamEventType.MARK_PRICE_UPDATE and not self._has_actionable(symbols):
+            return
 
-            # 如果調整幅度夠大, 則開始調整
-            if adjustment_limit > self.adjustment_threshold:
+        self.stream_event.set()
 
-                adjustment_limit = adjustment_limit - self.buffer_amount
-                self._reduce_position_margin(
-                    symbol=symbol,
-                    adjustment_amount=adjustment_limit
-                )
+    def _has_actionable(self, symbols: set) -> bool:
+        """
+        有保證金模型時直接用推播的 mark price 在本地判斷, 不需要再查一次帳戶.
+        這裡在 user data stream 的 event loop 上執行, 只用快取的槓桿分層, 更新分層由巡邏執行緒負責
+        """
 
-                print(f"{symbol} 減少 {adjustment_limit}U 保證金")
+        if self.margin_model is None:
+            return self.position_book.has_actionable(symbols, self.adjustment_threshold, self.buffer_amount)
+        return any(
+            self.margin_model.plan(position, self.buffer_amount, cached_only=True).adjustment_limit > self.adjustment_threshold
+            for position in self.position_book.positions() if position["symbol"] in symbols)
 
-            elif adjustment_limit < -self.adjustment_threshold:
-                
-                adjustment_limit = abs(adjustment_limit) - self.buffer_amount
-                response = self._add_position_margin(
-                    symbol=symbol,
-                    adjustment_amount=adjustment_limit
-                )
+    def _reconcile(self):
+        """ 用 REST 重建倉位簿, 作為 user data stream 漏事件時的保險 """
+        account_info = self.feature_http_client.get_account_information_v2()
+        self.position_book.load_snapshot(account_info["positions"])
+        self.last_reconcile_time = time.time()
 
-                print(f"{symbol} 增加 {adjustment_limit}U 保證金")
-                if response["message"]:
-                    print(response["message"])
+    def _start_streaming(self):
+        """ 由 user data stream 事件觸發調整, 超過 reconcile_frequency 沒有事件時才用 REST 對帳 """
+        from strategy.user_stream import StreamPositionBook, UserDataStream
 
-            else:
-                print(f'本次調整未觸發, 原預計幅度為 {adjustment_limit}')
+        set_account(self.account_name)
+        self.position_book = StreamPositionBook()
+        self.stream_event = threading.Event()
+        self.last_reconcile_time = 0.0
+        self.user_stream = UserDataStream(self.feature_http_client, self.position_book, self._on_stream_update)
+        self.user_stream.start()
 
-    def start(self):
         while True:
             try:
+                triggered = self.stream_event.wait(timeout=self.reconcile_frequency)
+                self.stream_event.clear()
                 start_time = time.time()
 
-                print("====================== START ======================")
-                print(f"開始時間: {datetime.now(pytz.timezone('Asia/Singapore')).strftime('%Y-%m-%d %H:%M:%S')}")
-                self._start_patrol()
-                print(f"執行時間： {time.time() - start_time:.3f} sec.")
-                print("======================= END =======================\n")
-                
-                time.sleep(self.patrol_frequency)
+                new_cycle_id()
+                logger.info("巡邏開始", extra={"trigger": "stream" if triggered else "timeout"})
+                reconcile_due = time.time() - self.last_reconcile_time > self.reconcile_frequency
+                if not triggered or reconcile_due or self.position_book.needs_reconcile:
+                    logger.info("REST 對帳")
+                    self._reconcile()
+
+                issued_at = time.time()
+                adjustments = self._start_patrol(positions=self.position_book.positions())
+                self.position_book.apply_adjustments(adjustments, issued_at)
+                PATROL_DURATION.observe(time.time() - start_time)
+                mark_patrol_success(self.account_name)
+                elapsed = time.time() - start_time
+                logger.info(f"巡邏結束, 執行時間: {elapsed:.3f} sec.", extra={"elapsed": elapsed})
 
             except Exception as e:
-                print(f"Error: {e}")
+                PATROL_FAILURES.inc()
+                logger.exception(f"Error: {e}")
+                self.position_book.needs_reconcile = True
                 time.sleep(self.cooldown_period)
 
+    def patrol_once(self) -> float:
+        """
+        執行一輪巡邏, 多帳戶的 runner 由外部排程呼叫
+
+        Return:
+            patrol_delay (float): 距離下一輪巡邏要等幾秒, 發生 Error 時為 cooldown_period
+        """
+        set_account(self.account_name)
+        try:
+            start_time = time.time()
+
+            new_cycle_id()
+            logger.info("巡邏開始")
+            if self.scheduler is None:
+                self._start_patrol()
+                patrol_delay = self.patrol_frequency
+            else:
+                positions = self._fetch_positions()
+                self._start_patrol(positions)
+                self.scheduler.observe(positions)
+                patrol_delay = self.scheduler.next_delay()
+                logger.info(f"下次巡邏: {patrol_delay:.2f} sec. 後", extra={"most_urgent": self.scheduler.most_urgent(1)})
+            PATROL_DURATION.observe(time.time() - start_time)
+            mark_patrol_success(self.account_name)
+            elapsed = time.time() - start_time
+            logger.info(f"巡邏結束, 執行時間: {elapsed:.3f} sec.", extra={"elapsed": elapsed})
+            return patrol_delay
+
+        except Exception as e:
+            PATROL_FAILURES.inc()
+            logger.exception(f"Error: {e}")
+            return self.cooldown_period
+
+    def start(self):
+        if self.use_user_stream:
+            return self._start_streaming()
+
+        while True:
+            time.sleep(self.patrol_once())
+
 
 if __name__ == "__main__":
     sentinel = LiquidationShield()
@@ -0,0 +1,243 @@
+import time
+import threading
+
+from decimal import Decimal
+from collections import deque
+
+from gateway.binance_api import BinanceSpotHttp, AcountType
+from utils.metrics import LIQUIDITY_RESERVE_FLOAT, LIQUIDITY_RESERVE_DRAWS
+from utils.logger import get_logger, set_account
+
+logger = get_logger("strategy.liquidity_reserve")
+
+
+class LiquidityReserve:
+    """
+    在現貨帳戶預先保留一筆 asset 浮存, 增加保證金時浮存足夠就只需要劃轉與調整逐倉兩個呼叫,
+    贖回活存 (每 3 秒一次) 與 BTC 借貸移出關鍵路徑, 改由背景執行緒在平靜期處理.
+
+    浮存目標 = max(近期增加保證金的量, 所有倉位名目價值 * shock), 再限制在 min_float ~ max_float 之間.
+    距離上一次增加保證金超過 calm_period 才視為平靜期: 浮存低於目標時從活存 (不夠再從 BTC 借貸) 補足,
+    高於目標時把多出來的部分申購回活存. 偏離目標不到 tolerance 時不動作, 避免來回贖回/申購
+
+    Args:
+        spot_http_client (BinanceSpotHttp): 現貨, 查詢餘額/贖回/申購/借款
+        asset (str): 保留的 asset
+        product_id (str): asset 的活期存款產品代碼
+        min_float (Decimal): 浮存下限
+        max_float (Decimal): 浮存上限
+        volume_window (float): 近期增加保證金量的統計區間 (秒)
+        shock (Decimal): 倉位風險以名目價值乘上此價格變動比例估算
+        calm_period (float): 距離上一次增加保證金超過此秒數才補足/釋放浮存
+        tolerance (Decimal): 浮存偏離目標超過此比例才補足/釋放
+        interval (float): 背景執行緒多久檢查一次
+        use_loan (bool): 活存不夠時是否用 BTC 借貸補足, 借款有利息, 預設只用活存
+        ltv_limit (Decimal): 借款後的質押率上限
+        account_name (str): 多帳戶執行時的帳戶名稱, 用於 log
+    """
+
+    def __init__(
+        self,
+        spot_http_client: BinanceSpotHttp,
+        asset: str="USDT",
+        product_id: str="USDT001",
+        min_float: Decimal=Decimal("0"),
+        max_float: Decimal=Decimal("10000"),
+        volume_window: float=3600.0,
+        shock: Decimal=Decimal("0.02"),
+        calm_period: float=60.0,
+        tolerance: Decimal=Decimal("0.2"),
+        interval: float=30.0,
+        use_loan: bool=False,
+        ltv_limit: Decimal=Decimal("0.7"),
+        account_name: str=None,
+    ):
+        self.spot_http_client = spot_http_client
+        self.asset = asset
+        self.product_id = product_id
+        self.min_float = min_float
+        self.max_float = max_float
+        self.volume_window = volume_window
+        self.shock = shock
+        self.calm_period = calm_period
+        self.tolerance = tolerance
+        self.interval = interval
+        self.use_loan = use_loan
+        self.ltv_limit = ltv_limit
+        self.account_name = account_name
+
+        self.lock = threading.Lock()
+        self.float_amount = None      # 現貨帳戶可用餘額的本地估計, None 代表未知
+        self.drawn_total = Decimal("0") # 累計從浮存扣除的數量, 用來修正查詢期間被扣掉的部分
+        self.demands = deque()        # (time, amount), 近期增加保證金的需求
+        self.last_demand_time = 0.0
+        self.exposure = Decimal("0")  # 所有倉位名目價值的絕對值總和
+        self.thread = None
+
+    # 巡邏執行緒 =====================================================================================================================
+
+    def observe_positions(self, positions: list):
+        """
+        Args:
+            positions (list): get_account_information_v2 格式的倉位
+        """
+        # 名目價值 = positionAmt * markPrice = positionAmt * entryPrice + unrealizedProfit, 所有倉位來源都有這些欄位
+        self.exposure = sum((
+            abs(Decimal(position["positionAmt"]) * Decimal(position["entryPrice"]) + Decimal(position["unrealizedProfit"]))
+            for position in positions if Decimal(position["positionAmt"]) != 0), Decimal("0"))
+
+    def draw(self, asset: str, amount: Decimal) -> bool:
+        """
+        記錄一次增加保證金的需求, 浮存足夠時直接從本地估計扣除.
+        不夠時呼叫端會走三道防線, 實際花掉的現貨餘額無法得知, 本地估計作廢到下一次查詢
+
+        Return:
+            success (bool): 浮存足夠, 不需要再查詢三道防線
+        """
+        if asset != self.asset:
+            return False
+
+        now = time.time()
+        with self.lock:
+            self.demands.append((now, amount))
+            self.last_demand_time = now
+            success = self.float_amount is not None and self.float_amount >= amount
+            if success:
+                self.float_amount -= amount
+                self.drawn_total += amount
+            else:
+                self.float_amount = None
+
+        LIQUIDITY_RESERVE_DRAWS.inc(asset=asset, result="hit" if success else "miss")
+        return success
+
+    def credit(self, asset: str, amount: Decimal):
+        """ 減少保證金轉回現貨帳戶的資金計入浮存 """
+        if asset == self.asset:
+            self._adjust_float(amount)
+
+    def invalidate(self):
+        """ 劃轉失敗等情況代表本地估計不可信, 等下一次查詢前都不使用浮存 """
+        with self.lock:
+            self.float_amount = None
+
+    # 背景執行緒 =====================================================================================================================
+
+    def target(self) -> Decimal:
+        """ 依近期增加保證金的量與倉位風險決定浮存目標 """
+
+        with self.lock:
+            while self.demands and self.demands[0][0] < time.time() - self.volume_window:
+                self.demands.popleft()
+            recent_volume = sum((amount for _, amount in self.demands), Decimal("0"))
+
+        return min(self.max_float, max(self.min_float, recent_volume, self.exposure * self.shock))
+
+    def is_calm(self) -> bool:
+        return time.time() - self.last_demand_time > self.calm_period
+
+    def _query_float(self) -> Decimal:
+        """ 以現貨帳戶的可用餘額更新本地估計 """
+
+        drawn_before = self.drawn_total
+        account_information = self.spot_http_client.get_account_information(omitZeroBalances=True)
+        balances = [balance for balance in account_information["balances"] if balance["asset"] == self.asset]
+        free_balance = Decimal(balances[0]["free"]) if balances else Decimal("0")
+
+        # 查詢期間被扣除的部分可能還沒反映在餘額上, 寧可低估
+        with self.lock:
+            self.float_amount = free_balance - (self.drawn_total - drawn_before)
+            return self.float_amount
+
+    def _adjust_float(self, delta: Decimal):
+        with self.lock:
+            if self.float_amount is not None:
+                self.float_amount += delta
+
+    def _top_up(self, amount: Decimal) -> Decimal:
+        """
+        從活存補足浮存, 不夠再從 BTC 借貸補足
+
+        Return:
+            topped_up (Decimal): 實際補足的數量
+        """
+        topped_up = Decimal("0")
+
+        flexible_position = self.spot_http_client.get_flexible_product_position(asset=self.asset)
+        rows = [row for row in flexible_position["rows"] if row["productId"] == self.product_id]
+        redeem_amount = min(amount, Decimal(rows[0]["totalAmount"])) if rows else Decimal("0")
+        if redeem_amount > 0:
+            self.spot_http_client.redeem_flexible_product(
+                productId=self.product_id, amount=redeem_amount, destAccount=AcountType.SPOT.value)
+            self._adjust_float(redeem_amount)
+            topped_up += redeem_amount
+
+        if not self.use_loan or topped_up >= amount:
+            return topped_up
+
+        ongoing_loan = self.spot_http_client.get_flexible_loan_ongoing_orders(collateralCoin="BTC", loanCoin=self.asset)
+        if not ongoing_loan["rows"]: # 沒有進行中的借貸, 無法再借
+            return topped_up
+        ongoing_loan = ongoing_loan["rows"][0]
+        current_ltv = Decimal(ongoing_loan["currentLTV"])
+        if current_ltv < self.ltv_limit:
+            ltv_per_u = current_ltv / Decimal(ongoing_loan["totalDebt"])
+            loan_amount = min(amount - topped_up, (self.ltv_limit - current_ltv) / ltv_per_u)
+            self.spot_http_client.flexible_loan_borrow(loan_coin=self.asset, loan_amount=loan_amount, collateral_coin="BTC")
+            self._adjust_float(loan_amount)
+            topped_up += loan_amount
+
+        return topped_up
+
+    def _release(self, target: Decimal) -> Decimal:
+        """
+        超過目標的浮存申購回活存. 數量在 lock 內以最新的估計計算並先扣除, 同時發生的 draw 不會用到正在申購的資金
+
+        Return:
+            released (Decimal): 實際申購的數量
+        """
+        with self.lock:
+            if self.float_amount is None or self.float_amount <= target:
+                return Decimal("0")
+            amount = self.float_amount - target
+            self.float_amount = target
+
+        try:
+            self.spot_http_client.subscribe_flexible_product(productId=self.product_id, amount=amount)
+        except Exception:
+            self.invalidate()
+            raise
+        return amount
+
+    def rebalance(self):
+        """ 更新浮存的估計, 平靜期才補足或釋放 """
+
+        free_balance = self._query_float()
+        target = self.target()
+        LIQUIDITY_RESERVE_FLOAT.set(float(free_balance), asset=self.asset)
+
+        if not self.is_calm():
+            return
+
+        if free_balance < target * (1 - self.tolerance):
+            topped_up = self._top_up(target - free_balance)
+            logger.info(f"補足浮存 {topped_up}{self.asset}, 目標 {target}{self.asset}")
+        elif free_balance > target * (1 + self.tolerance):
+            released = self._release(target)
+            logger.info(f"釋放浮存 {released}{self.asset} 回活存, 目標 {target}{self.asset}")
+
+    def _run(self):
+        set_account(self.account_name)
+        while True:
+            try:
+                self.rebalance()
+            except Exception as e:
+                self.invalidate()
+                logger.exception(f"浮存調整失敗: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        """ 啟動背景執行緒, 重複呼叫不會啟動第二個 """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=f"liquidity-reserve-{self.asset}", daemon=True)
+            self.thread.start()
@@ -0,0 +1,254 @@
+import time
+import bisect
+import threading
+
+from decimal import Decimal, ROUND_DOWN
+from dataclasses import dataclass, replace
+
+from gateway.binance_api import BinanceUSDFeatureHttp
+from strategy.position import Position, AdjustmentSide
+from utils.metrics import POSITION_MARGIN_RATIO
+from utils.logger import get_logger
+
+logger = get_logger("strategy.margin_model")
+
+AMOUNT_PRECISION: Decimal = Decimal("0.00000001")
+# margin_balance <= 0 時 margin ratio 為無限大, metric 以此值代替 (超過 1 就已經是強平)
+MAX_REPORTED_MARGIN_RATIO: float = 10.0
+
+
+@dataclass(frozen=True, slots=True)
+class Bracket:
+    """
+    單一槓桿分層
+
+    Args:
+        notional_floor (Decimal): 名目價值下限
+        notional_cap (Decimal): 名目價值上限
+        maint_margin_ratio (Decimal): 維持保證金率
+        cum (Decimal): 速算數, 維持保證金 = 名目價值 * 維持保證金率 - cum
+    """
+    notional_floor: Decimal
+    notional_cap: Decimal
+    maint_margin_ratio: Decimal
+    cum: Decimal
+
+
+class LeverageBrackets:
+    """
+    槓桿分層的快取, 分層很少變動, 超過 ttl 才在下一次查詢時重新取得; 重新取得失敗時沿用舊的分層
+
+    Args:
+        feature_http_client (BinanceUSDFeatureHttp): 用來查詢 /fapi/v1/leverageBracket
+        ttl (float): 快取秒數
+    """
+
+    def __init__(self, feature_http_client: BinanceUSDFeatureHttp, ttl: float=3600.0):
+        self.feature_http_client = feature_http_client
+        self.ttl = ttl
+        self.brackets = {}  # symbol -> list[Bracket], 依 notional_floor 排序
+        self.floors = {}    # symbol -> list[Decimal], 給 bisect 使用
+        self.loaded_at = None
+        self.missed_at = {} # symbol -> 因為缺少分層而重新查詢的時間, 每個 symbol 每 ttl 最多重新查詢一次
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        response = self.feature_http_client.get_leverage_bracket()
+        if isinstance(response, dict): # 帶 symbol 查詢時只回傳單一物件
+            response = [response]
+
+        brackets, floors = {}, {}
+        for item in response:
+            symbol_brackets = sorted((
+                Bracket(
+                    notional_floor=Decimal(str(bracket["notionalFloor"])),
+                    notional_cap=Decimal(str(bracket["notionalCap"])),
+                    maint_margin_ratio=Decimal(str(bracket["maintMarginRatio"])),
+                    cum=Decimal(str(bracket.get("cum", 0))),
+                ) for bracket in item["brackets"]), key=lambda bracket: bracket.notional_floor)
+            brackets[item["symbol"]] = symbol_brackets
+            floors[item["symbol"]] = [bracket.notional_floor for bracket in symbol_brackets]
+
+        self.brackets, self.floors = brackets, floors
+        self.loaded_at = time.monotonic()
+        logger.info(f"更新槓桿分層: {len(brackets)} 個交易對")
+
+    def _ensure_fresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        with self.lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return
+            try:
+                self._refresh()
+            except Exception as error:
+                if self.loaded_at is None:
+                    raise
+                logger.warning(f"更新槓桿分層失敗, 沿用舊的分層: {error}")
+                self.loaded_at = time.monotonic()
+
+    def _refresh_missing(self, symbol: str):
+        """ 快取內沒有的交易對 (ex: 新上架的合約) 立即重新查詢一次 """
+
+        with self.lock:
+            missed_at = self.missed_at.get(symbol)
+            if symbol in self.brackets or (missed_at is not None and time.monotonic() - missed_at < self.ttl):
+                return
+            self.missed_at[symbol] = time.monotonic()
+            try:
+                self._refresh()
+            except Exception as error:
+                logger.warning(f"更新槓桿分層失敗: {error}")
+
+    def bracket_for(self, symbol: str, notional: Decimal, cached_only: bool=False) -> Bracket:
+        """
+        Args:
+            cached_only (bool): 只用已快取的分層, 不發出 request. 給 user data stream 的 event loop 使用,
+                過期或缺少的分層留給巡邏執行緒下一次呼叫時更新
+
+        Raises:
+            KeyError: 重新查詢後仍沒有這個交易對的分層
+        """
+        if not cached_only:
+            self._ensure_fresh()
+            if symbol not in self.brackets:
+                self._refresh_missing(symbol)
+        brackets = self.brackets[symbol]
+        index = bisect.bisect_right(self.floors[symbol], notional) - 1
+        return brackets[max(0, min(index, len(brackets) - 1))]
+
+
+@dataclass(frozen=True, slots=True)
+class MarginState:
+    """
+    以本地模型算出的逐倉保證金狀態
+
+    Args:
+        symbol (str): 交易對
+        mark_price (Decimal): 計算用的 mark price
+        notional (Decimal): 名目價值 (絕對值)
+        maint_margin (Decimal): 維持保證金
+        margin_balance (Decimal): 逐倉錢包 + 未實現損益
+        margin_ratio (Decimal): 維持保證金 / margin_balance, 達到 1 即強平
+        liquidation_price (Decimal): 預估強平價格, 不會強平時為 None
+    """
+    symbol: str
+    mark_price: Decimal
+    notional: Decimal
+    maint_margin: Decimal
+    margin_balance: Decimal
+    margin_ratio: Decimal
+    liquidation_price: Decimal
+
+    @property
+    def headroom(self) -> float:
+        """ 與 liquidation_headroom 相同的定義, 但用分層的維持保證金 """
+        if self.notional == 0:
+            return 1.0
+        return max(0.0, float((self.margin_balance - self.maint_margin) / self.notional))
+
+    def margin_to_target(self, target_margin_ratio: Decimal) -> Decimal:
+        """ 要讓 margin_ratio 變成 target_margin_ratio 需要增加 (正) 或可以取出 (負) 的保證金 """
+        return self.maint_margin / target_margin_ratio - self.margin_balance
+
+
+class MarginModel:
+    """
+    用快取的槓桿分層與倉位欄位在本地計算維持保證金, margin ratio 與強平價格, 有新的 mark price 時不需要再查一次帳戶.
+    margin ratio 超過 max_margin_ratio 時增加保證金, 低於 min_margin_ratio 時取出保證金, 兩者都調整到 target_margin_ratio;
+    取出的數量不超過原本 adjustment_limit 的算法, 不會低於交易所允許的下限
+
+    Args:
+        brackets (LeverageBrackets): 槓桿分層快取
+        target_margin_ratio (Decimal): 調整後的 margin ratio
+        max_margin_ratio (Decimal): 超過此值就增加保證金
+        min_margin_ratio (Decimal): 低於此值才取出保證金
+    """
+
+    def __init__(
+        self,
+        brackets: LeverageBrackets,
+        target_margin_ratio: Decimal=Decimal("0.2"),
+        max_margin_ratio: Decimal=Decimal("0.3"),
+        min_margin_ratio: Decimal=Decimal("0.1"),
+    ):
+        self.brackets = brackets
+        self.target_margin_ratio = target_margin_ratio
+        self.max_margin_ratio = max_margin_ratio
+        self.min_margin_ratio = min_margin_ratio
+        if not self.min_margin_ratio <= self.target_margin_ratio <= self.max_margin_ratio:
+            raise ValueError("需要 MIN_MARGIN_RATIO <= TARGET_MARGIN_RATIO <= MAX_MARGIN_RATIO")
+
+    def evaluate(self, position: dict, mark_price: Decimal=None, cached_only: bool=False) -> MarginState:
+        """
+        Args:
+            position (dict): get_account_information_v2 格式的倉位
+            mark_price (Decimal): 最新的 mark price, 沒給就用倉位的 markPrice, 再沒有就由 unrealizedProfit 反推
+            cached_only (bool): 見 LeverageBrackets.bracket_for
+        """
+        position_amt = Decimal(position["positionAmt"])
+        entry_price = Decimal(position["entryPrice"])
+        if mark_price is None:
+            if "markPrice" in position:
+                mark_price = Decimal(position["markPrice"])
+            else:
+                mark_price = entry_price + Decimal(position["unrealizedProfit"]) / position_amt
+
+        size = abs(position_amt)
+        side = 1 if position_amt > 0 else -1
+        notional = size * mark_price
+        bracket = self.brackets.bracket_for(position["symbol"], notional, cached_only)
+
+        isolated_wallet = Decimal(position["isolatedWallet"])
+        maint_margin = notional * bracket.maint_margin_ratio - bracket.cum
+        margin_balance = isolated_wallet + position_amt * (mark_price - entry_price)
+        margin_ratio = maint_margin / margin_balance if margin_balance > 0 else Decimal("Infinity")
+
+        # 逐倉單一倉位: (WB + cum - side * size * entry) / (size * MMR - side * size)
+        denominator = size * bracket.maint_margin_ratio - side * size
+        liquidation_price = None
+        if denominator != 0:
+            liquidation_price = max(Decimal("0"), (isolated_wallet + bracket.cum - side * size * entry_price) / denominator)
+
+        return MarginState(
+            symbol=position["symbol"],
+            mark_price=mark_price,
+            notional=notional,
+            maint_margin=maint_margin,
+            margin_balance=margin_balance,
+            margin_ratio=margin_ratio,
+            liquidation_price=liquidation_price,
+        )
+
+    def plan(self, position: dict, buffer_amount: Decimal, mark_price: Decimal=None, cached_only: bool=False) -> Position:
+        """
+        依 margin ratio 決定調整方向與數量
+
+        Args:
+            position (dict): get_account_information_v2 格式的倉位
+            buffer_amount (Decimal): 原本 adjustment_limit 算法的 buffer, 用來限制取出的上限
+            mark_price (Decimal): 最新的 mark price
+            cached_only (bool): 見 LeverageBrackets.bracket_for
+
+        Return:
+            position (Position): adjustment_limit 為 0 代表不需要調整, 沒有分層的交易對改用原本 adjustment_limit 的算法
+        """
+        try:
+            state = self.evaluate(position, mark_price, cached_only)
+        except KeyError:
+            logger.warning(
+                f"{position['symbol']} 沒有槓桿分層, 改用原本的調整算法", extra={"throttle_key": f"missing_bracket:{position['symbol']}"})
+            return Position.from_account_position(position, buffer_amount)
+        POSITION_MARGIN_RATIO.set(min(float(state.margin_ratio), MAX_REPORTED_MARGIN_RATIO), symbol=state.symbol)
+        heuristic = Position.from_account_position(position, buffer_amount)
+
+        side, amount = heuristic.adjustment_side, Decimal("0")
+        if state.margin_ratio > self.max_margin_ratio:
+            side = AdjustmentSide.ADD.value
+            amount = state.margin_to_target(self.target_margin_ratio)
+        elif state.margin_ratio < self.min_margin_ratio and heuristic.adjustment_side == AdjustmentSide.REDUCE.value:
+            side = AdjustmentSide.REDUCE.value
+            amount = min(heuristic.adjustment_limit, -state.margin_to_target(self.target_margin_ratio))
+
+        amount = max(Decimal("0"), amount).quantize(AMOUNT_PRECISION, rounding=ROUND_DOWN)
+        return replace(heuristic, adjustment_side=side, adjustment_limit=amount, headroom=state.headroom)
@@ -0,0 +1,95 @@
+from enum import Enum
+from decimal import Decimal
+from dataclasses import dataclass, asdict
+
+
+class AdjustmentSide(Enum):
+    ADD = "ADD"
+    REDUCE = "REDUCE"
+
+
+class CurrentAsset(Enum):
+    USDT = "USDT"
+    USDC = "USDC"
+
+
+@dataclass(slots=True)
+class Position:
+    """
+    巡邏用的精簡倉位, 只保留計算保證金調整需要的欄位
+
+    Args:
+        symbol (str): 逐倉交易對
+        asset (str): 調整保證金用的 asset
+        adjustment_side (str): AdjustmentSide, 保證金調整方向
+        adjustment_limit (Decimal): 扣除 buffer 後的可調整額度
+        headroom (float): 價格再變動多少比例會碰到維持保證金, 越小越緊急
+        position_side (str): BOTH 為單向持倉, 對沖模式下為 LONG / SHORT
+    """
+    symbol: str
+    asset: str
+    adjustment_side: str
+    adjustment_limit: Decimal
+    headroom: float = 1.0
+    position_side: str = "BOTH"
+
+    @classmethod
+    def from_account_position(cls, position: dict, buffer_amount: Decimal) -> "Position":
+        """ 由 get_account_information_v2 的單筆 position 建立 """
+
+        # 計算可調整額度
+        adjustment_limit = \
+            Decimal(position["isolatedWallet"]) - Decimal(position["initialMargin"]) + Decimal(position["unrealizedProfit"])
+
+        symbol = position["symbol"]
+        return cls(
+            symbol=symbol,
+            # 確認調整資產是 USDT or USDC
+            asset=CurrentAsset.USDT.value if symbol.endswith(CurrentAsset.USDT.value) else CurrentAsset.USDC.value,
+            # 確認保證金調整方向
+            adjustment_side=AdjustmentSide.ADD.value if adjustment_limit < 0 else AdjustmentSide.REDUCE.value,
+            # 確認調整倉為並扣除 buffer
+            adjustment_limit=abs(adjustment_limit) - buffer_amount,
+            headroom=liquidation_headroom(position),
+            position_side=position.get("positionSide", "BOTH"),
+        )
+
+
+def liquidation_headroom(position: dict) -> float:
+    """
+    價格再變動多少比例會碰到維持保證金, 0 代表已到強平邊緣
+
+    Args:
+        position (dict): get_account_information_v2 格式的倉位
+    """
+    position_amt = float(position["positionAmt"])
+    if position_amt == 0:
+        return 1.0
+
+    # account v2 的 positions 沒有 mark price, 用 entryPrice + unrealizedProfit / positionAmt 反推
+    if "markPrice" in position:
+        mark_price = float(position["markPrice"])
+    else:
+        mark_price = float(position["entryPrice"]) + float(position["unrealizedProfit"]) / position_amt
+
+    notional = abs(position_amt) * mark_price
+    if notional == 0:
+        return 1.0
+
+    margin_balance = float(position["isolatedWallet"]) + float(position["unrealizedProfit"])
+    return max(0.0, (margin_balance - float(position.get("maintMargin", 0))) / notional)
+
+
+def positions_to_dataframe(positions: list):
+    """
+    報表用, 把 Position 轉成 pandas DataFrame. pandas 不在巡邏的必要路徑上, 所以只在這裡才 import
+
+    Raises:
+        ImportError: 沒有安裝 pandas
+    """
+    try:
+        import pandas as pd
+    except ImportError as error:
+        raise ImportError("報表功能需要 pandas, 請先 pip install pandas") from error
+
+    return pd.DataFrame([asdict(position) for position in positions])
@@ -0,0 +1,106 @@
+from enum import Enum
+from decimal import Decimal
+from operator import itemgetter
+from collections import Counter
+from dataclasses import dataclass
+
+from strategy.position import Position
+from utils.metrics import POSITION_BOOK_EVENTS
+
+# 決定可調整額度的欄位, 所有倉位來源都有. mark price / maintMargin 的變動一定也會反映在 unrealizedProfit, 不需要另外比對
+FINGERPRINT_FIELDS: tuple = ("positionAmt", "isolatedWallet", "initialMargin", "unrealizedProfit")
+
+
+class PositionEventType(Enum):
+    ADDED = "ADDED"
+    CHANGED = "CHANGED"
+    CLOSED = "CLOSED"
+
+
+@dataclass(slots=True)
+class PositionEvent:
+    """
+    Args:
+        event_type (PositionEventType): 事件類型
+        symbol (str): 交易對
+        position (Position): 重算後的倉位, CLOSED 時為最後一次的狀態
+    """
+    event_type: PositionEventType
+    symbol: str
+    position: Position
+
+
+class IncrementalPositionBook:
+    """
+    跨巡邏保留的倉位簿, 以 (symbol, positionSide) 為 key. 每輪只比對原始欄位字串, 沒有變動的倉位沿用上一輪的 Position,
+    只有新增或變動的倉位才重新計算, 每輪的計算量與配置量隨變動的倉位數增加, 而不是隨倉位總數
+
+    Args:
+        buffer_amount (Decimal): 扣除的 buffer
+        adjustment_threshold (Decimal): 可調整額度超過此值才需要調整
+    """
+
+    def __init__(self, buffer_amount: Decimal, adjustment_threshold: Decimal):
+        self.buffer_amount = buffer_amount
+        self.adjustment_threshold = adjustment_threshold
+        self.fingerprint = itemgetter(*FINGERPRINT_FIELDS) # 原始欄位字串, 不做 Decimal 轉換
+        self.fingerprints = {}  # key -> 上一輪的原始欄位
+        self.positions = {}     # key -> Position, 只有非零倉位
+        self.actionable = {}    # key -> Position, 超過調整門檻的倉位
+
+    def update(self, positions: list) -> list:
+        """
+        Args:
+            positions (list): get_account_information_v2 格式的倉位, 可以包含 positionAmt 為 0 的交易對
+
+        Return:
+            events (list[PositionEvent]): 這一輪新增/變動/平倉的倉位
+        """
+        events = []
+        seen = set()
+        fingerprints, get_fingerprint = self.fingerprints, self.fingerprint
+        added, changed = PositionEventType.ADDED, PositionEventType.CHANGED
+        for raw in positions:
+            key = (raw["symbol"], raw.get("positionSide", "BOTH"))
+            seen.add(key)
+
+            fingerprint = get_fingerprint(raw)
+            if fingerprints.get(key) == fingerprint:
+                continue
+            fingerprints[key] = fingerprint
+
+            if Decimal(raw["positionAmt"]) == 0:
+                self._close(key, events)
+                continue
+
+            position = Position.from_account_position(raw, self.buffer_amount)
+            event_type = changed if key in self.positions else added
+            self.positions[key] = position
+            if position.adjustment_limit > self.adjustment_threshold:
+                self.actionable[key] = position
+            else:
+                self.actionable.pop(key, None)
+            events.append(PositionEvent(event_type, key[0], position))
+
+        # 只列出持倉的來源 (ex: positionRisk), 平倉後就不會出現在快照內
+        for key in self.fingerprints.keys() - seen:
+            del self.fingerprints[key]
+        for key in self.positions.keys() - seen:
+            self._close(key, events)
+
+        for event_type, count in Counter(event.event_type for event in events).items():
+            POSITION_BOOK_EVENTS.inc(count, event=event_type.value)
+        return events
+
+    def _close(self, key: tuple, events: list):
+        position = self.positions.pop(key, None)
+        self.actionable.pop(key, None)
+        if position is not None:
+            events.append(PositionEvent(PositionEventType.CLOSED, key[0], position))
+
+    def positions_for_adjustment(self) -> list:
+        """
+        Return:
+            positions_for_adjustment (list[Position]): 超過調整門檻的倉位
+        """
+        return list(self.actionable.values())
@@ -0,0 +1,110 @@
+import numpy as np
+
+from decimal import Decimal
+
+from strategy.position import Position, AdjustmentSide, CurrentAsset, liquidation_headroom
+
+# 金額欄位以 1e-8 為單位存成 int64, 加減與比較都是精確的整數運算
+SCALE: int = 10 ** 8
+
+
+def _to_scaled(values: list) -> np.ndarray:
+    """ 字串轉 scaled int64, 有效位數在 15 位以內 (例如 9,999,999.12345678) 都是精確的 """
+    return np.rint(np.array(values, dtype=np.float64) * SCALE).astype(np.int64)
+
+
+def _to_decimal(value: int) -> Decimal:
+    return Decimal(int(value)) / SCALE
+
+
+class PositionTable:
+    """
+    以 NumPy 陣列儲存的倉位表, 給持有大量逐倉倉位的子帳戶使用,
+    調整額度/方向/門檻的判斷都是整欄運算, 只有最後交給 gateway 的金額才轉回 Decimal
+
+    Args:
+        symbols (np.ndarray): 交易對
+        isolated_wallet, initial_margin, unrealized_profit (np.ndarray): scaled int64 金額欄位
+        position_amt, mark_price, headroom (np.ndarray): float64, 只用於報表與風險估算
+        position_sides (np.ndarray): BOTH / LONG / SHORT
+    """
+
+    def __init__(
+        self,
+        symbols: np.ndarray,
+        isolated_wallet: np.ndarray,
+        initial_margin: np.ndarray,
+        unrealized_profit: np.ndarray,
+        position_amt: np.ndarray,
+        mark_price: np.ndarray,
+        headroom: np.ndarray,
+        position_sides: np.ndarray,
+    ):
+        self.symbols = symbols
+        self.isolated_wallet = isolated_wallet
+        self.initial_margin = initial_margin
+        self.unrealized_profit = unrealized_profit
+        self.position_amt = position_amt
+        self.mark_price = mark_price
+        self.headroom = headroom
+        self.position_sides = position_sides
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @classmethod
+    def from_account_positions(cls, positions: list) -> "PositionTable":
+        """ 由 get_account_information_v2 的 positions 建立, 並移除 positionAmt 為 0 的倉位 """
+
+        position_amt = np.array([position["positionAmt"] for position in positions], dtype=np.float64)
+        keep = np.flatnonzero(position_amt != 0)
+        positions = [positions[index] for index in keep]
+
+        return cls(
+            symbols=np.array([position["symbol"] for position in positions], dtype=object),
+            isolated_wallet=_to_scaled([position["isolatedWallet"] for position in positions]),
+            initial_margin=_to_scaled([position["initialMargin"] for position in positions]),
+            unrealized_profit=_to_scaled([position["unrealizedProfit"] for position in positions]),
+            position_amt=position_amt[keep],
+            mark_price=np.array([position.get("markPrice", "0") for position in positions], dtype=np.float64),
+            headroom=np.array([liquidation_headroom(position) for position in positions], dtype=np.float64),
+            position_sides=np.array([position.get("positionSide", "BOTH") for position in positions], dtype=object),
+        )
+
+    def evaluate(self, buffer_amount: Decimal, adjustment_threshold: Decimal) -> dict:
+        """
+        整欄計算可調整額度, 邏輯與 Position.from_account_position 相同
+
+        Return:
+            adjustment_limit (np.ndarray): 扣除 buffer 後的可調整額度 (scaled int64)
+            is_add (np.ndarray): True 為增加保證金, False 為減少
+            below_threshold (np.ndarray): 未達門檻, 不作動
+            above_threshold (np.ndarray): 超過門檻, 需要調整
+        """
+        adjustment_limit = self.isolated_wallet - self.initial_margin + self.unrealized_profit
+        is_add = adjustment_limit < 0
+        adjustment_limit = np.abs(adjustment_limit) - int(buffer_amount * SCALE)
+
+        threshold = int(adjustment_threshold * SCALE)
+        return {
+            "adjustment_limit": adjustment_limit,
+            "is_add": is_add,
+            "below_threshold": adjustment_limit < threshold,
+            "above_threshold": adjustment_limit > threshold,
+        }
+
+    def to_positions(self, evaluation: dict, mask: np.ndarray) -> list:
+        """ 只把 mask 選到的列轉回 Position, 金額轉回精確的 Decimal """
+
+        positions = []
+        for index in np.flatnonzero(mask):
+            symbol = self.symbols[index]
+            positions.append(Position(
+                symbol=symbol,
+                asset=CurrentAsset.USDT.value if symbol.endswith(CurrentAsset.USDT.value) else CurrentAsset.USDC.value,
+                adjustment_side=AdjustmentSide.ADD.value if evaluation["is_add"][index] else AdjustmentSide.REDUCE.value,
+                adjustment_limit=_to_decimal(evaluation["adjustment_limit"][index]),
+                headroom=float(self.headroom[index]),
+                position_side=self.position_sides[index],
+            ))
+        return positions
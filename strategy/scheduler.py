@@ -0,0 +1,179 @@
+import os
+import math
+import time
+
+from dataclasses import dataclass
+
+from gateway.rate_limiter import RateLimiter, BUCKET_CAPACITY
+
+
+@dataclass(slots=True)
+class PositionSchedule:
+    """
+    單一倉位的排程狀態
+
+    Args:
+        mark_price (float): 上次觀察到的 mark price
+        observed_at (float): 上次觀察的時間
+        variance_rate (float): 每秒報酬率變異數的 EWMA
+        headroom (float): 距離增加保證金門檻的價格變動比例, 0 代表已到門檻
+        next_check (float): 下次需要檢查的時間
+    """
+    mark_price: float
+    observed_at: float
+    variance_rate: float
+    headroom: float = 1.0
+    next_check: float = 0.0
+
+
+class AdaptiveScheduler:
+    """
+    依每個倉位距離強平的空間與近期波動決定下次巡邏時間, 危險的倉位可以做到 sub-second 巡邏, 安全的倉位則很少檢查.
+    所有倉位共用同一個 get_account_information_v2, 所以實際的巡邏間隔是最早到期的倉位, 再受全域 request 額度限制
+
+    預估到達門檻的時間以布朗運動的首次通過時間估算: (headroom / sigma)^2, 再乘上 safety_factor 作為下次檢查的間隔.
+    headroom 以 shield 自己增加保證金的門檻 (initialMargin - adjustment_threshold - buffer_amount) 計算, 而不是維持保證金,
+    shield 在離維持保證金很遠時就會動作. max_interval 預設為 PATROL_FREQUENCY, 任何倉位都不會比固定巡邏更晚檢查
+
+    request 額度以實際用量計算: 有 rate_limiter 時, 兩次 observe 之間這個帳戶在每個 bucket 用掉的 weight
+    (包含增加保證金時查詢現貨/活存/借貸的 api / sapi weight) 不能超過該 bucket 每分鐘額度的 budget_share.
+    沒有 rate_limiter (ex: Bybit) 時只以每次巡邏查詢倉位的 patrol_weight 估算
+
+    Args:
+        min_interval (float): 最短巡邏間隔
+        max_interval (float): 最長巡邏間隔, 預設為 PATROL_FREQUENCY
+        budget_share (float): 巡邏最多可使用每個 bucket 每分鐘額度的比例
+        patrol_weight (int): 沒有 rate_limiter 時, 每次巡邏消耗的 fapi weight
+        rate_limiter (RateLimiter): 帳戶的限流器, 用來取得實際的用量
+        default_volatility (float): 沒有歷史價格時使用的每日波動率
+        safety_factor (float): 預估到達強平時間的幾分之一後就要再檢查
+        ewma_alpha (float): 波動率 EWMA 的權重
+        trigger_offset (float): 保證金低於 initialMargin 多少才會增加保證金, 即 adjustment_threshold + buffer_amount
+    """
+
+    def __init__(
+        self,
+        min_interval: float=None,
+        max_interval: float=None,
+        budget_share: float=None,
+        patrol_weight: int=5,
+        rate_limiter: RateLimiter=None,
+        default_volatility: float=None,
+        safety_factor: float=None,
+        ewma_alpha: float=0.2,
+        trigger_offset: float=0.0,
+    ):
+        if min_interval is None:
+            min_interval = float(os.getenv("ADAPTIVE_MIN_INTERVAL", "0.5"))
+        if max_interval is None:
+            max_interval = float(os.getenv("ADAPTIVE_MAX_INTERVAL", os.getenv("PATROL_FREQUENCY", "3.5")))
+        if budget_share is None:
+            budget_share = float(os.getenv("ADAPTIVE_BUDGET_SHARE", "0.25"))
+        if default_volatility is None:
+            default_volatility = float(os.getenv("ADAPTIVE_DEFAULT_VOLATILITY", "0.05"))
+        if safety_factor is None:
+            safety_factor = float(os.getenv("ADAPTIVE_SAFETY_FACTOR", "0.1"))
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget_share = budget_share
+        self.patrol_weight = patrol_weight
+        self.rate_limiter = rate_limiter
+        self.default_variance_rate = default_volatility ** 2 / 86400
+        self.safety_factor = safety_factor
+        self.ewma_alpha = ewma_alpha
+        self.trigger_offset = trigger_offset
+
+        self.schedules = {}  # symbol -> PositionSchedule
+        self.used_at_observe = dict(rate_limiter.used) if rate_limiter is not None else {}  # bucket -> 上次 observe 時的累計用量
+        self.cycle_weights = {"fapi_weight": patrol_weight}  # bucket -> 上一輪巡邏用掉的 weight
+
+    def _update_cycle_weights(self):
+        if self.rate_limiter is None:
+            return
+        used = dict(self.rate_limiter.used)
+        self.cycle_weights = {bucket: weight - self.used_at_observe.get(bucket, 0) for bucket, weight in used.items()}
+        self.used_at_observe = used
+
+    @property
+    def budget_interval(self) -> float:
+        """ 依上一輪巡邏實際用掉的 weight, 在每個 bucket 的 budget_share 內, 兩次巡邏之間最短的間隔 """
+        if self.budget_share <= 0:
+            return self.max_interval
+        return max((
+            weight * 60 / (self._capacity(bucket) * self.budget_share) for bucket, weight in self.cycle_weights.items()), default=0.0)
+
+    def _capacity(self, bucket: str) -> int:
+        """ 多個 shard 時 IP bucket 的額度會被縮小, 以限流器實際的額度為準 """
+        if self.rate_limiter is not None:
+            return self.rate_limiter.buckets[bucket].capacity
+        return BUCKET_CAPACITY[bucket]
+
+    def _headroom(self, position: dict, mark_price: float) -> float:
+        """ 價格再變動多少比例會碰到 shield 增加保證金的門檻 """
+
+        notional = abs(float(position["positionAmt"])) * mark_price
+        if notional == 0:
+            return 1.0
+
+        margin_balance = float(position["isolatedWallet"]) + float(position["unrealizedProfit"])
+        trigger = float(position["initialMargin"]) - self.trigger_offset
+        return max(0.0, (margin_balance - trigger) / notional)
+
+    @staticmethod
+    def _mark_price(position: dict) -> float:
+        """ account v2 的 positions 沒有 mark price, 用 entryPrice + unrealizedProfit / positionAmt 反推 """
+        if "markPrice" in position:
+            return float(position["markPrice"])
+        return float(position["entryPrice"]) + float(position["unrealizedProfit"]) / float(position["positionAmt"])
+
+    def observe(self, positions: list, now: float=None):
+        """ 用最新的 get_account_information_v2 positions 更新波動率與每個倉位的下次檢查時間 """
+
+        now = now or time.time()
+        active = set()
+        self._update_cycle_weights()
+
+        for position in positions:
+            if float(position["positionAmt"]) == 0:
+                continue
+
+            symbol = position["symbol"]
+            active.add(symbol)
+            mark_price = self._mark_price(position)
+
+            schedule = self.schedules.get(symbol)
+            if schedule is None:
+                schedule = PositionSchedule(mark_price=mark_price, observed_at=now, variance_rate=self.default_variance_rate)
+                self.schedules[symbol] = schedule
+            elif now > schedule.observed_at and mark_price > 0 and schedule.mark_price > 0:
+                log_return = math.log(mark_price / schedule.mark_price)
+                variance_rate = log_return ** 2 / (now - schedule.observed_at)
+                schedule.variance_rate = (1 - self.ewma_alpha) * schedule.variance_rate + self.ewma_alpha * variance_rate
+                schedule.mark_price = mark_price
+                schedule.observed_at = now
+
+            schedule.headroom = self._headroom(position, mark_price)
+            time_to_liquidation = schedule.headroom ** 2 / max(schedule.variance_rate, 1e-18)
+            delay = min(self.max_interval, max(self.min_interval, self.safety_factor * time_to_liquidation))
+            schedule.next_check = now + delay
+
+        # 已平倉的 symbol 不需要再排程
+        for symbol in set(self.schedules) - active:
+            del self.schedules[symbol]
+
+    def next_delay(self, now: float=None) -> float:
+        """ 距離下次巡邏還要等幾秒 """
+
+        now = now or time.time()
+        if not self.schedules:
+            return self.max_interval
+
+        next_check = min(schedule.next_check for schedule in self.schedules.values())
+        delay = min(self.max_interval, next_check - now)
+        return max(delay, self.budget_interval, 0.0)
+
+    def most_urgent(self, count: int=5) -> list:
+        """ 距離增加保證金門檻最近的幾個倉位, 回傳 (symbol, headroom) """
+        ranked = sorted(self.schedules.items(), key=lambda item: item[1].headroom)
+        return [(symbol, schedule.headroom) for symbol, schedule in ranked[:count]]
@@ -0,0 +1,78 @@
+from enum import Enum
+from decimal import Decimal
+from dataclasses import dataclass, field
+
+from strategy.position import AdjustmentSide
+
+
+class TransferType(Enum):
+    """ new_future_account_transfer 的 type """
+    SPOT_TO_FUTURES = 1
+    FUTURES_TO_SPOT = 2
+
+
+@dataclass
+class TransferPlan:
+    """
+    單一 asset 在一輪巡邏中的淨資金流: 減少保證金釋放出來的資金留在合約帳戶, 直接拿來補需要增加保證金的倉位,
+    現貨與合約帳戶之間最多只劃轉一次淨額
+
+    Args:
+        asset (str): 調整的 asset
+        release (list[Position]): 要減少保證金的倉位
+        fund (list[Position]): 要增加保證金的倉位
+    """
+    asset: str
+    release: list = field(default_factory=list)
+    fund: list = field(default_factory=list)
+
+    @property
+    def released_amount(self) -> Decimal:
+        return sum((position.adjustment_limit for position in self.release), Decimal("0"))
+
+    @property
+    def required_amount(self) -> Decimal:
+        return sum((position.adjustment_limit for position in self.fund), Decimal("0"))
+
+    def net_transfer(self, released_amount: Decimal, required_amount: Decimal) -> tuple:
+        """
+        依實際釋放與需要的數量決定唯一一筆劃轉
+
+        Return:
+            (type, amount): TransferType 與數量, 不需要劃轉時回傳 None
+        """
+        net_amount = required_amount - released_amount
+        if net_amount > 0:
+            return (TransferType.SPOT_TO_FUTURES, net_amount)
+        if net_amount < 0:
+            return (TransferType.FUTURES_TO_SPOT, -net_amount)
+        return None
+
+    @property
+    def naive_calls(self) -> int:
+        """ 原本每個倉位各自經過現貨帳戶: 每個倉位 2 次 """
+        return 2 * (len(self.release) + len(self.fund))
+
+    def planned_calls(self, transfer: tuple) -> int:
+        """ 每個倉位只剩調整逐倉 1 次, 加上最多 1 次淨額劃轉 """
+        return len(self.release) + len(self.fund) + (1 if transfer is not None else 0)
+
+
+def plan_transfers(positions: list) -> dict:
+    """
+    依 asset 分組建立 TransferPlan
+
+    Args:
+        positions (list[Position]): 本輪需要調整的倉位
+
+    Return:
+        plans (dict): asset -> TransferPlan
+    """
+    plans = {}
+    for position in positions:
+        plan = plans.setdefault(position.asset, TransferPlan(asset=position.asset))
+        if position.adjustment_side == AdjustmentSide.REDUCE.value:
+            plan.release.append(position)
+        else:
+            plan.fund.append(position)
+    return plans
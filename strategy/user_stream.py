@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import aiohttp
+
+from enum import Enum
+from decimal import Decimal
+
+from gateway.binance_api import BinanceUSDFeatureHttp
+from utils.logger import get_logger
+
+logger = get_logger("strategy.user_stream")
+
+
+class StreamEventType(Enum):
+    ACCOUNT_UPDATE = "ACCOUNT_UPDATE"
+    MARGIN_CALL = "MARGIN_CALL"
+    ACCOUNT_CONFIG_UPDATE = "ACCOUNT_CONFIG_UPDATE"
+    LISTEN_KEY_EXPIRED = "listenKeyExpired"
+    MARK_PRICE_UPDATE = "markPriceUpdate"
+
+
+class StreamPositionBook:
+    """
+    由 user data stream 維護的倉位簿, 欄位格式與 get_account_information_v2 的 positions 相同,
+    所以 LiquidationShield 可以直接拿來計算, 不需要再打一次 REST.
+
+    自己發出的保證金調整先記為 pending, 只在讀取時疊加到 isolatedWallet, 不寫進交易所給的值;
+    收到該 symbol 的 ACCOUNT_UPDATE / MARGIN_CALL 或 REST 對帳時清除, 避免同一筆調整被算兩次
+
+    Args:
+        pending_ttl (float): pending 調整等不到對應事件的秒數上限, 超過就丟棄並要求 REST 對帳
+    """
+
+    def __init__(self, pending_ttl: float=None):
+        self.lock = threading.Lock()
+        self.positions_by_key = {}  # (symbol, positionSide) -> position
+        self.sides_by_symbol = {}   # symbol -> set(positionSide), mark price 推播時直接找到持倉, 不需要掃過所有倉位
+        self.leverage_by_symbol = {}
+        self.needs_reconcile = True
+        self.pending_ttl = pending_ttl or float(os.getenv("PENDING_ADJUSTMENT_TTL", "10"))
+        self.pending = {}           # symbol -> list[(amount, issued_at)], 還沒收到對應事件的調整
+        self.updated_at = {}        # symbol -> 最後一次收到交易所倉位事件的時間
+
+    def load_snapshot(self, positions: list):
+        """ 用 REST 的 get_account_information_v2 positions 重建倉位簿 """
+
+        with self.lock:
+            self.positions_by_key = {}
+            self.sides_by_symbol = {}
+            for position in positions:
+                self.leverage_by_symbol[position["symbol"]] = Decimal(position["leverage"])
+                if Decimal(position["positionAmt"]) != 0:
+                    key = (position["symbol"], position.get("positionSide", "BOTH"))
+                    self.positions_by_key[key] = dict(position)
+                    self.sides_by_symbol.setdefault(key[0], set()).add(key[1])
+            self.pending = {}
+            self.needs_reconcile = False
+
+    def _pending_amount(self, symbol: str) -> Decimal:
+        """ 尚未反映在交易所事件上的調整總和, 過期的 pending 丟棄並要求 REST 對帳 """
+
+        pending = self.pending.get(symbol)
+        if not pending:
+            return Decimal("0")
+
+        expires_at = time.time() - self.pending_ttl
+        if any(issued_at < expires_at for _, issued_at in pending):
+            self.pending[symbol] = [(amount, issued_at) for amount, issued_at in pending if issued_at >= expires_at]
+            self.needs_reconcile = True
+        return sum((amount for amount, _ in self.pending[symbol]), Decimal("0"))
+
+    def _with_pending(self, position: dict) -> dict:
+        position = dict(position)
+        pending_amount = self._pending_amount(position["symbol"])
+        if pending_amount:
+            position["isolatedWallet"] = str(Decimal(position["isolatedWallet"]) + pending_amount)
+        return position
+
+    def _mark_updated(self, symbol: str):
+        """ 交易所送來的 isolatedWallet 已包含之前送出的調整 """
+        self.updated_at[symbol] = time.time()
+        self.pending.pop(symbol, None)
+
+    def positions(self) -> list:
+        with self.lock:
+            return [self._with_pending(position) for position in self.positions_by_key.values()]
+
+    def symbols(self) -> set:
+        with self.lock:
+            return {symbol for symbol, _ in self.positions_by_key.keys()}
+
+    def _update_position(self, symbol: str, position_side: str, fields: dict, mark_price: Decimal=None):
+        """ 更新單一倉位, 並用 mark price 重算 initialMargin """
+
+        key = (symbol, position_side)
+        if Decimal(fields["positionAmt"]) == 0:
+            self.positions_by_key.pop(key, None)
+            sides = self.sides_by_symbol.get(symbol)
+            if sides is not None:
+                sides.discard(position_side)
+                if not sides:
+                    del self.sides_by_symbol[symbol]
+            return
+
+        leverage = self.leverage_by_symbol.get(symbol)
+        if leverage is None: # 新開倉位不知道槓桿, 只能等 REST 對帳
+            self.needs_reconcile = True
+            return
+
+        position = self.positions_by_key.setdefault(key, {"symbol": symbol, "positionSide": position_side})
+        self.sides_by_symbol.setdefault(symbol, set()).add(position_side)
+        position.update(fields)
+
+        position_amt = Decimal(position["positionAmt"])
+        if mark_price is None:
+            # ACCOUNT_UPDATE 沒有 mark price, 用 entryPrice + unrealizedProfit 反推名目價值
+            notional = abs(position_amt * Decimal(position["entryPrice"]) + Decimal(position["unrealizedProfit"]))
+        else:
+            notional = abs(position_amt * mark_price)
+            position["markPrice"] = str(mark_price)
+
+        position["leverage"] = str(leverage)
+        position["initialMargin"] = str(notional / leverage)
+
+    def apply_account_update(self, event: dict) -> set:
+        """ 處理 ACCOUNT_UPDATE, 回傳有變動的 symbol """
+
+        changed = set()
+        with self.lock:
+            for item in event["a"].get("P", []):
+                fields = {
+                    "positionAmt": item["pa"],
+                    "entryPrice": item["ep"],
+                    "unrealizedProfit": item["up"],
+                    "isolatedWallet": item["iw"],
+                    "isolated": item["mt"] == "isolated",
+                }
+                self._update_position(item["s"], item["ps"], fields)
+                self._mark_updated(item["s"])
+                changed.add(item["s"])
+        return changed
+
+    def apply_margin_call(self, event: dict) -> set:
+        """ 處理 MARGIN_CALL, 事件內帶有 mark price, 可以直接更新 """
+
+        changed = set()
+        with self.lock:
+            for item in event["p"]:
+                key = (item["s"], item["ps"])
+                entry_price = self.positions_by_key.get(key, {}).get("entryPrice", item["mp"])
+                fields = {
+                    "positionAmt": item["pa"],
+                    "entryPrice": entry_price,
+                    "unrealizedProfit": item["up"],
+                    "isolatedWallet": item["iw"],
+                    "isolated": item["mt"] == "ISOLATED" or item["mt"] == "isolated",
+                }
+                self._update_position(item["s"], item["ps"], fields, mark_price=Decimal(item["mp"]))
+                self._mark_updated(item["s"])
+                changed.add(item["s"])
+        return changed
+
+    def apply_account_config_update(self, event: dict) -> set:
+        """ 處理 ACCOUNT_CONFIG_UPDATE, 只關心槓桿倍數的變動 """
+
+        if "ac" not in event:
+            return set()
+
+        with self.lock:
+            symbol = event["ac"]["s"]
+            self.leverage_by_symbol[symbol] = Decimal(str(event["ac"]["l"]))
+            for position_side in tuple(self.sides_by_symbol.get(symbol, ())):
+                position = self.positions_by_key[(symbol, position_side)]
+                self._update_position(symbol, position_side, {"positionAmt": position["positionAmt"]})
+        return {symbol}
+
+    def apply_mark_price(self, updates: list) -> set:
+        """ 處理 markPriceUpdate, 用最新 mark price 重算持倉的 unrealizedProfit """
+
+        changed = set()
+        with self.lock:
+            for item in updates:
+                symbol = item["s"]
+                sides = self.sides_by_symbol.get(symbol)
+                if not sides: # 全市場推播, 大部分 symbol 沒有持倉
+                    continue
+                mark_price = Decimal(item["p"])
+                for position_side in tuple(sides):
+                    position = self.positions_by_key[(symbol, position_side)]
+                    position_amt = Decimal(position["positionAmt"])
+                    fields = {
+                        "positionAmt": position["positionAmt"],
+                        "unrealizedProfit": str(position_amt * (mark_price - Decimal(position["entryPrice"]))),
+                    }
+                    self._update_position(symbol, position_side, fields, mark_price=mark_price)
+                    changed.add(symbol)
+        return changed
+
+    def apply_adjustments(self, adjustments: list, issued_at: float):
+        """
+        把自己剛做完的保證金調整記為 pending, 避免在收到對應的 ACCOUNT_UPDATE 前重複調整.
+        巡邏回來時 ACCOUNT_UPDATE 通常已經到了, 在 issued_at 之後收到過事件的 symbol 就不再記錄
+
+        Args:
+            adjustments (list): _start_patrol 的回傳值, 每筆為 {"symbol", "side", "amount"}
+            issued_at (float): 開始送出調整的時間
+        """
+        with self.lock:
+            for adjustment in adjustments:
+                symbol = adjustment["symbol"]
+                if self.updated_at.get(symbol, 0.0) >= issued_at:
+                    continue
+                amount = adjustment["amount"] if adjustment["side"] == "ADD" else -adjustment["amount"]
+                self.pending.setdefault(symbol, []).append((amount, issued_at))
+
+    def has_actionable(self, symbols: set, adjustment_threshold: Decimal, buffer_amount: Decimal) -> bool:
+        """ 確認是否有倉位的可調整額度已超過門檻 """
+
+        with self.lock:
+            for symbol in symbols:
+                for position_side in self.sides_by_symbol.get(symbol, ()):
+                    position = self._with_pending(self.positions_by_key[(symbol, position_side)])
+                    adjustment_limit = \
+                        Decimal(position["isolatedWallet"]) - Decimal(position["initialMargin"]) + Decimal(position["unrealizedProfit"])
+                    if abs(adjustment_limit) - buffer_amount > adjustment_threshold:
+                        return True
+        return False
+
+
+class UserDataStream:
+    """
+    Binance 合約 user data stream: 取得並定期延長 listenKey, 把 ACCOUNT_UPDATE / MARGIN_CALL 等事件寫進倉位簿,
+    並同時訂閱全市場 mark price, 讓價格變動也能即時反映在 unrealizedProfit 上
+
+    Args:
+        feature_http_client (BinanceUSDFeatureHttp): 用來管理 listenKey
+        position_book (StreamPositionBook): 事件寫入的倉位簿
+        on_update (callable): 倉位簿更新後呼叫, 參數為 (event_type, changed_symbols)
+    """
+
+    def __init__(self, feature_http_client: BinanceUSDFeatureHttp, position_book: StreamPositionBook, on_update):
+        self.feature_http_client = feature_http_client
+        self.position_book = position_book
+        self.on_update = on_update
+
+        self.stream_url = os.getenv("BINANCE_FUTURES_STREAM_URL", "wss://fstream.binance.com")
+        self.keepalive_interval = float(os.getenv("LISTEN_KEY_KEEPALIVE", "1800"))
+        self.reconnect_delay = float(os.getenv("STREAM_RECONNECT_DELAY", "1.0"))
+        self.subscribe_mark_price = os.getenv("STREAM_MARK_PRICE", "true").lower() == "true"
+
+        self.loop = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.listen_key = None
+        self.websocket = None
+
+    def start(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self._run(),), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.loop is not None and self.websocket is not None:
+            asyncio.run_coroutine_threadsafe(self.websocket.close(), self.loop)
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _stream_path(self) -> str:
+        streams = [self.listen_key]
+        if self.subscribe_mark_price:
+            streams.append("!markPrice@arr@1s")
+        return f"{self.stream_url}/stream?streams={'/'.join(streams)}"
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            await self.loop.run_in_executor(None, self.feature_http_client.keepalive_listen_key)
+
+    async def _run(self):
+        self.loop = asyncio.get_running_loop()
+
+        while not self.stopped.is_set():
+            keepalive_task = None
+            try:
+                response = await self.loop.run_in_executor(None, self.feature_http_client.new_listen_key)
+                self.listen_key = response["listenKey"]
+
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(self._stream_path(), heartbeat=30) as websocket:
+                        self.websocket = websocket
+                        keepalive_task = asyncio.create_task(self._keepalive())
+
+                        # 斷線期間可能漏掉事件, 重新連線後要先對帳
+                        self.position_book.needs_reconcile = True
+                        self.on_update(None, set())
+
+                        async for message in websocket:
+                            if self.stopped.is_set():
+                                break
+                            if message.type != aiohttp.WSMsgType.TEXT:
+                                break
+                            if self._handle_message(json.loads(message.data)) is False:
+                                break
+
+            except Exception as error:
+                logger.error(f"User data stream 发生了错误: {error}")
+
+            finally:
+                if keepalive_task is not None:
+                    keepalive_task.cancel()
+
+            if not self.stopped.is_set():
+                await asyncio.sleep(self.reconnect_delay)
+
+        if self.listen_key is not None:
+            await self.loop.run_in_executor(None, self.feature_http_client.close_listen_key)
+
+    def _handle_message(self, message: dict) -> bool:
+        """ 處理單一則 stream 訊息, 回傳 False 代表需要重新連線 """
+
+        event = message.get("data", message)
+
+        # 全市場 mark price 是 list
+        if isinstance(event, list):
+            changed = self.position_book.apply_mark_price(event)
+            if changed:
+                self.on_update(StreamEventType.MARK_PRICE_UPDATE, changed)
+            return True
+
+        event_type = event.get("e")
+
+        if event_type == StreamEventType.ACCOUNT_UPDATE.value:
+            changed = self.position_book.apply_account_update(event)
+        elif event_type == StreamEventType.MARGIN_CALL.value:
+            changed = self.position_book.apply_margin_call(event)
+        elif event_type == StreamEventType.ACCOUNT_CONFIG_UPDATE.value:
+            changed = self.position_book.apply_account_config_update(event)
+        elif event_type == StreamEventType.MARK_PRICE_UPDATE.value:
+            changed = self.position_book.apply_mark_price([event])
+        elif event_type == StreamEventType.LISTEN_KEY_EXPIRED.value:
+            return False
+        else:
+            return True
+
+        self.on_update(StreamEventType(event_type), changed)
+        return True
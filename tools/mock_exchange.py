@@ -0,0 +1,361 @@
+import sys
+import time
+import random
+import asyncio
+import argparse
+import threading
+
+from decimal import Decimal
+from collections import Counter
+from aiohttp import web
+
+
+class MockExchangeServer:
+    """
+    本機的 Binance REST 替身, 實作 gateway/binance_api.py 用到的 endpoint, 用來做壓力測試與 benchmark.
+    搭配 BINANCE_FUTURES_BASE_URL / BINANCE_SPOT_BASE_URL 指到這個 server, 程式走的是完全相同的路徑.
+    也實作 gateway/bybit_api.py 用到的 Bybit 統一帳戶 endpoint (BYBIT_BASE_URL), 錢包餘額與現貨帳戶共用 spot_balance
+
+    Args:
+        position_count (int): 非零倉位數
+        zero_position_count (int): positionAmt 為 0 的交易對數量, 模擬 account v2 會列出所有交易對
+        latency (float): 每個 request 的平均延遲秒數
+        jitter (float): 延遲的隨機變動秒數
+        error_rate (float): 回傳 5xx 錯誤的機率
+        spot_balance (Decimal): 現貨帳戶 USDT 餘額
+        flexible_balance (Decimal): 活存 USDT 餘額
+        volatility (float): 每次查詢 account 時 mark price 的隨機變動比例
+        clock_skew (float): 伺服器時間比本機快幾秒, 用來模擬容器時鐘漂移, 超出 recvWindow 的 request 回傳 -1021
+        seed (int): 隨機種子
+    """
+
+    def __init__(
+        self,
+        host: str="127.0.0.1",
+        port: int=9800,
+        position_count: int=20,
+        zero_position_count: int=300,
+        latency: float=0.0,
+        jitter: float=0.0,
+        error_rate: float=0.0,
+        spot_balance: Decimal=Decimal("100000"),
+        flexible_balance: Decimal=Decimal("100000"),
+        volatility: float=0.01,
+        clock_skew: float=0.0,
+        seed: int=0,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.volatility = volatility
+        self.clock_skew = clock_skew
+        self.random = random.Random(seed)
+
+        self.spot_balance = spot_balance
+        self.futures_balance = Decimal("0")
+        self.flexible_balance = flexible_balance
+        self.loan_debt = Decimal("1000")
+        self.loan_collateral_value = Decimal("10000")
+        self.positions = self._make_positions(position_count, zero_position_count)
+
+        self.call_counts = Counter()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.runner = None
+        self.ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _make_positions(self, position_count: int, zero_position_count: int) -> list:
+        positions = []
+        for index in range(position_count + zero_position_count):
+            entry_price = Decimal(str(round(self.random.uniform(0.1, 1000), 4)))
+            position_amt = Decimal(str(round(self.random.uniform(-100, 100), 3))) if index < position_count else Decimal("0")
+            leverage = Decimal(self.random.choice([5, 10, 20]))
+            positions.append({
+                "symbol": f"COIN{index}USDT",
+                "positionSide": "BOTH",
+                "isolated": True,
+                "leverage": str(leverage),
+                "positionAmt": position_amt,
+                "entryPrice": entry_price,
+                "markPrice": entry_price,
+                "isolatedWallet": abs(position_amt) * entry_price / leverage,
+            })
+        return positions
+
+    def _render_position(self, position: dict) -> dict:
+        """ 依 mark price 算出 account v2 格式的欄位 """
+
+        position_amt = position["positionAmt"]
+        notional = abs(position_amt) * position["markPrice"]
+        leverage = Decimal(position["leverage"])
+        return {
+            "symbol": position["symbol"],
+            "positionSide": position["positionSide"],
+            "isolated": position["isolated"],
+            "leverage": position["leverage"],
+            "positionAmt": str(position_amt),
+            "entryPrice": str(position["entryPrice"]),
+            "notional": str(notional),
+            "initialMargin": str((notional / leverage).quantize(Decimal("0.00000001"))),
+            "maintMargin": str((notional * Decimal("0.005")).quantize(Decimal("0.00000001"))),
+            "unrealizedProfit": str((position_amt * (position["markPrice"] - position["entryPrice"])).quantize(Decimal("0.00000001"))),
+            "isolatedWallet": str(position["isolatedWallet"].quantize(Decimal("0.00000001"))),
+        }
+
+    def _move_prices(self):
+        for position in self.positions:
+            if position["positionAmt"] != 0:
+                change = Decimal(str(round(self.random.gauss(0, self.volatility), 6)))
+                position["markPrice"] = (position["markPrice"] * (1 + change)).quantize(Decimal("0.0001"))
+
+    # Futures ====================================================================================================================
+
+    def _futures_account(self, params: dict) -> dict:
+        self._move_prices()
+        return {
+            "availableBalance": str(self.futures_balance),
+            "positions": [self._render_position(position) for position in self.positions],
+        }
+
+    def _position_risk(self, params: dict) -> list:
+        """ positionRisk v3 只回傳有持倉的交易對, 未實現損益的欄位名稱為 unRealizedProfit """
+
+        self._move_prices()
+        positions = []
+        for position in self.positions:
+            if position["positionAmt"] == 0 or params.get("symbol", position["symbol"]) != position["symbol"]:
+                continue
+            rendered = self._render_position(position)
+            rendered["unRealizedProfit"] = rendered.pop("unrealizedProfit")
+            rendered["markPrice"] = str(position["markPrice"])
+            positions.append(rendered)
+        return positions
+
+    def _position_margin(self, params: dict) -> dict:
+        amount = Decimal(params["amount"])
+        position = [position for position in self.positions if position["symbol"] == params["symbol"]][0]
+        if params["type"] == "1":
+            self.futures_balance -= amount
+            position["isolatedWallet"] += amount
+        else:
+            self.futures_balance += amount
+            position["isolatedWallet"] -= amount
+        return {"amount": float(amount), "code": 200, "msg": "Successfully modify position margin.", "type": int(params["type"])}
+
+    def _leverage_bracket(self, params: dict) -> list:
+        """ 所有交易對使用相同的分層, 第一層的維持保證金率與 _render_position 的 maintMargin 一致 """
+
+        tiers = ((0, 50000, "0.005", 0), (50000, 250000, "0.01", 250), (250000, 1000000, "0.025", 4000))
+        brackets = [
+            {"bracket": index + 1, "initialLeverage": 50 // (index + 1), "notionalFloor": floor, "notionalCap": cap,
+             "maintMarginRatio": float(ratio), "cum": float(cum)}
+            for index, (floor, cap, ratio, cum) in enumerate(tiers)]
+        return [{"symbol": position["symbol"], "brackets": brackets}
+                for position in self.positions if params.get("symbol", position["symbol"]) == position["symbol"]]
+
+    def _listen_key(self, params: dict) -> dict:
+        return {"listenKey": "mock-listen-key"}
+
+    # Spot =======================================================================================================================
+
+    def _spot_account(self, params: dict) -> dict:
+        return {"balances": [{"asset": "USDT", "free": str(self.spot_balance), "locked": "0"}]}
+
+    def _flexible_position(self, params: dict) -> dict:
+        return {"rows": [{"asset": "USDT", "productId": "USDT001", "totalAmount": str(self.flexible_balance)}], "total": 1}
+
+    def _flexible_redeem(self, params: dict) -> dict:
+        amount = min(Decimal(params.get("amount", self.flexible_balance)), self.flexible_balance)
+        self.flexible_balance -= amount
+        self.spot_balance += amount
+        return {"redeemId": self.call_counts["/sapi/v1/simple-earn/flexible/redeem"], "success": True}
+
+    def _flexible_subscribe(self, params: dict) -> dict:
+        amount = Decimal(params["amount"])
+        self.spot_balance -= amount
+        self.flexible_balance += amount
+        return {"purchaseId": self.call_counts["/sapi/v1/simple-earn/flexible/subscribe"], "success": True}
+
+    def _futures_transfer(self, params: dict) -> dict:
+        amount = Decimal(params["amount"])
+        if params["type"] == "1":
+            self.spot_balance -= amount
+            self.futures_balance += amount
+        else:
+            self.spot_balance += amount
+            self.futures_balance -= amount
+        return {"tranId": self.call_counts["/sapi/v1/futures/transfer"]}
+
+    def _loan_ongoing_orders(self, params: dict) -> dict:
+        return {"rows": [{
+            "loanCoin": "USDT",
+            "totalDebt": str(self.loan_debt),
+            "collateralCoin": "BTC",
+            "collateralAmount": "1",
+            "currentLTV": str((self.loan_debt / self.loan_collateral_value).quantize(Decimal("0.0001"))),
+        }], "total": 1}
+
+    def _loan_borrow(self, params: dict) -> dict:
+        amount = Decimal(params["loanAmount"])
+        self.loan_debt += amount
+        self.spot_balance += amount
+        return {"loanCoin": "USDT", "loanAmount": str(amount), "collateralCoin": "BTC", "status": "Succeeds"}
+
+    # Bybit ======================================================================================================================
+
+    def _bybit_position_list(self, params: dict) -> dict:
+        self._move_prices()
+        positions = [position for position in self.positions if position["positionAmt"] != 0]
+        start, limit = int(params.get("cursor") or 0), int(params.get("limit", 20))
+        rows = []
+        for position in positions[start:start + limit]:
+            rendered = self._render_position(position)
+            rows.append({
+                "symbol": position["symbol"],
+                "side": "Buy" if position["positionAmt"] > 0 else "Sell",
+                "size": str(abs(position["positionAmt"])),
+                "avgPrice": rendered["entryPrice"],
+                "markPrice": str(position["markPrice"]),
+                "positionValue": str(abs(Decimal(rendered["notional"]))),
+                "leverage": str(position["leverage"]),
+                "tradeMode": 1 if position["isolated"] else 0,
+                "positionIdx": 0,
+                "positionIM": rendered["initialMargin"],
+                "positionMM": rendered["maintMargin"],
+                "positionBalance": rendered["isolatedWallet"],
+                "unrealisedPnl": rendered["unrealizedProfit"],
+            })
+        next_cursor = str(start + limit) if start + limit < len(positions) else ""
+        return {"retCode": 0, "retMsg": "OK", "result": {"category": "linear", "list": rows, "nextPageCursor": next_cursor}}
+
+    def _bybit_add_margin(self, params: dict) -> dict:
+        margin = Decimal(params["margin"])
+        position = [position for position in self.positions if position["symbol"] == params["symbol"]][0]
+        self.spot_balance -= margin
+        position["isolatedWallet"] += margin
+        return {"retCode": 0, "retMsg": "OK", "result": {"symbol": params["symbol"], "positionBalance": str(position["isolatedWallet"])}}
+
+    def _bybit_wallet_balance(self, params: dict) -> dict:
+        wallet = {"accountType": "UNIFIED", "totalAvailableBalance": str(self.spot_balance), "coin": []}
+        return {"retCode": 0, "retMsg": "OK", "result": {"list": [wallet]}}
+
+    def _server_time(self, query: dict) -> dict:
+        return {"serverTime": self._now_ms()}
+
+    def _now_ms(self) -> int:
+        return int((time.time() + self.clock_skew) * 1000)
+
+    def _outside_recv_window(self, query: dict) -> bool:
+        """ 與 Binance 相同: timestamp 不能比伺服器時間晚 1 秒以上, 也不能早於 recvWindow """
+        if "timestamp" not in query:
+            return False
+        timestamp, now = int(query["timestamp"]), self._now_ms()
+        return timestamp > now + 1000 or now - timestamp > int(query.get("recvWindow", "5000"))
+
+    # Server =====================================================================================================================
+
+    def _routes(self) -> dict:
+        return {
+            ("GET", "/fapi/v1/time"): self._server_time,
+            ("GET", "/api/v3/time"): self._server_time,
+            ("GET", "/fapi/v2/account"): self._futures_account,
+            ("GET", "/fapi/v3/positionRisk"): self._position_risk,
+            ("POST", "/fapi/v1/positionMargin"): self._position_margin,
+            ("GET", "/fapi/v1/leverageBracket"): self._leverage_bracket,
+            ("POST", "/fapi/v1/listenKey"): self._listen_key,
+            ("PUT", "/fapi/v1/listenKey"): self._listen_key,
+            ("DELETE", "/fapi/v1/listenKey"): self._listen_key,
+            ("GET", "/api/v3/account"): self._spot_account,
+            ("GET", "/sapi/v1/simple-earn/flexible/position"): self._flexible_position,
+            ("POST", "/sapi/v1/simple-earn/flexible/redeem"): self._flexible_redeem,
+            ("POST", "/sapi/v1/simple-earn/flexible/subscribe"): self._flexible_subscribe,
+            ("POST", "/sapi/v1/futures/transfer"): self._futures_transfer,
+            ("GET", "/sapi/v2/loan/flexible/ongoing/orders"): self._loan_ongoing_orders,
+            ("POST", "/sapi/v2/loan/flexible/borrow"): self._loan_borrow,
+            ("GET", "/v5/position/list"): self._bybit_position_list,
+            ("POST", "/v5/position/add-margin"): self._bybit_add_margin,
+            ("GET", "/v5/account/wallet-balance"): self._bybit_wallet_balance,
+        }
+
+    def _make_handler(self, handler):
+        async def _handle(request):
+            path = request.path
+            with self.lock:
+                self.call_counts[path] += 1
+
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if self.random.random() < self.error_rate:
+                return web.json_response(
+                    {"code": -1001, "msg": "Internal error; unable to process your request. Please try again."}, status=503)
+
+            params = dict(request.query)
+            if self._outside_recv_window(params):
+                return web.json_response(
+                    {"code": -1021, "msg": "Timestamp for this request is outside of the recvWindow."}, status=400)
+
+            # Bybit 的 POST 參數放在 JSON body
+            if request.can_read_body and request.content_type == "application/json":
+                params.update(await request.json())
+
+            with self.lock:
+                body = handler(params)
+            return web.json_response(body, headers={"X-MBX-USED-WEIGHT-1M": "1"})
+        return _handle
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        for (method, path), handler in self._routes().items():
+            app.router.add_route(method, path, self._make_handler(handler))
+        return app
+
+    async def _serve(self):
+        self.runner = web.AppRunner(self._build_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.ready.set()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self.loop)
+        self.ready.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def reset_counts(self):
+        with self.lock:
+            self.call_counts = Counter()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Binance REST stand-in")
+    parser.add_argument("--port", type=int, default=9800)
+    parser.add_argument("--positions", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--clock-skew", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockExchangeServer(
+        port=args.port,
+        position_count=args.positions,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        clock_skew=args.clock_skew,
+    )
+    server.start()
+    print(f"Mock exchange listening on {server.base_url}")
+    sys.stdin.read()
@@ -0,0 +1,105 @@
+import sys
+import json
+import uuid
+import asyncio
+import threading
+
+from aiohttp import web
+
+
+class MockUserStreamServer:
+    """
+    本機的 Binance 合約 user data stream 替身, 提供 listenKey REST endpoint 以及 websocket,
+    可以從測試程式呼叫 push() 推送事件, 用來驗證 UserDataStream 與串流模式的 LiquidationShield
+
+    Example:
+        server = MockUserStreamServer(port=9900)
+        server.start()
+        # BINANCE_FUTURES_BASE_URL=http://127.0.0.1:9900
+        # BINANCE_FUTURES_STREAM_URL=ws://127.0.0.1:9900
+        server.push({"e": "MARGIN_CALL", ...})
+    """
+
+    def __init__(self, host: str="127.0.0.1", port: int=9900):
+        self.host = host
+        self.port = port
+        self.listen_key = None
+        self.keepalive_count = 0
+        self.websockets = set()
+
+        self.loop = None
+        self.runner = None
+        self.ready = threading.Event()
+
+    def _build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/fapi/v1/listenKey", self._new_listen_key)
+        app.router.add_put("/fapi/v1/listenKey", self._keepalive_listen_key)
+        app.router.add_delete("/fapi/v1/listenKey", self._close_listen_key)
+        app.router.add_get("/stream", self._stream)
+        app.router.add_get("/ws/{listen_key}", self._stream)
+        return app
+
+    async def _new_listen_key(self, request):
+        if self.listen_key is None:
+            self.listen_key = uuid.uuid4().hex
+        return web.json_response({"listenKey": self.listen_key})
+
+    async def _keepalive_listen_key(self, request):
+        self.keepalive_count += 1
+        return web.json_response({"listenKey": self.listen_key})
+
+    async def _close_listen_key(self, request):
+        self.listen_key = None
+        return web.json_response({})
+
+    async def _stream(self, request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.websockets.add(websocket)
+        try:
+            async for _ in websocket:
+                pass
+        finally:
+            self.websockets.discard(websocket)
+        return websocket
+
+    async def _push(self, event):
+        # 模擬 combined stream 的格式
+        stream = "!markPrice@arr@1s" if isinstance(event, list) else self.listen_key
+        message = json.dumps({"stream": stream, "data": event})
+        for websocket in list(self.websockets):
+            await websocket.send_str(message)
+
+    async def _serve(self):
+        self.runner = web.AppRunner(self._build_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.ready.set()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self.loop)
+        self.ready.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def push(self, event):
+        """ 推送一則事件給所有已連線的 client, event 為 dict 或 mark price 的 list """
+        asyncio.run_coroutine_threadsafe(self._push(event), self.loop).result()
+
+    def connection_count(self) -> int:
+        return len(self.websockets)
+
+
+if __name__ == "__main__":
+    # 從 stdin 逐行讀取 JSON 事件並推送
+    server = MockUserStreamServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 9900)
+    server.start()
+    print(f"Mock user data stream listening on {server.host}:{server.port}")
+    for line in sys.stdin:
+        if line.strip():
+            server.push(json.loads(line))
@@ -0,0 +1,81 @@
+"""
+以 GATEWAY_JOURNAL 錄下的 journal 回放 LiquidationShield 的巡邏, 不連到交易所也不等待, 用於重現事故與以真實流量做 benchmark.
+巡邏會一直進行到 journal 內的 /fapi/v2/account 用完為止
+
+Usage:
+    GATEWAY_JOURNAL=journal.jsonl.gz python main.py          # 錄製
+    python -m tools.replay journal.jsonl.gz --account sub-01  # 回放
+"""
+import os
+import time
+import argparse
+
+from collections import Counter
+
+
+def replay(path: str, account: str=None, max_cycles: int=None) -> dict:
+    """
+    Args:
+        path (str): journal 檔案路徑
+        account (str): 多帳戶錄製時, 要回放的帳戶名稱
+        max_cycles (int): 最多回放幾輪
+
+    Return:
+        cycles (int): 回放的輪數
+        elapsed (float): 總耗時
+        adjustments (Counter): 各 symbol / 方向成功調整的次數
+        errors (int): 調整失敗的次數
+        remaining (int): 沒有被使用到的紀錄數, 策略改變後可能會不為 0
+    """
+    os.environ["GATEWAY_REPLAY"] = path
+    os.environ.pop("GATEWAY_JOURNAL", None)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from gateway.exceptions import ReplayExhaustedError
+    from strategy.account import AccountConfig
+    from strategy.binance_liquidation_shield import LiquidationShield
+    from utils.logger import set_account
+
+    config = AccountConfig(name=account, api_key="replay", secret_key="replay") if account else None
+    shield = LiquidationShield(config)
+    set_account(account)
+
+    cycles, errors = 0, 0
+    adjustments = Counter()
+    start_time = time.perf_counter()
+    while max_cycles is None or cycles < max_cycles:
+        try:
+            shield._start_patrol()
+        except ReplayExhaustedError:
+            break
+        cycles += 1
+        report = shield.last_cycle_report
+        errors += len(report.errors)
+        adjustments.update((result.symbol, result.side) for result in report.results if result.success)
+
+    return {
+        "cycles": cycles,
+        "elapsed": time.perf_counter() - start_time,
+        "adjustments": adjustments,
+        "errors": errors,
+        "remaining": shield.feature_http_client.replay.remaining(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a gateway journal through LiquidationShield")
+    parser.add_argument("path")
+    parser.add_argument("--account", default=None)
+    parser.add_argument("--max-cycles", type=int, default=None)
+    args = parser.parse_args()
+
+    result = replay(args.path, args.account, args.max_cycles)
+    per_cycle = result["elapsed"] / result["cycles"] * 1000 if result["cycles"] else 0.0
+    print(f"cycles: {result['cycles']}  elapsed: {result['elapsed']:.3f} sec.  ({per_cycle:.2f} ms / cycle)")
+    print(f"adjustments: {sum(result['adjustments'].values())}  errors: {result['errors']}  unused entries: {result['remaining']}")
+    for (symbol, side), count in result["adjustments"].most_common(10):
+        print(f"  {symbol:<20} {side:<8} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import json
+
+# orjson 不是必要套件, 有安裝才使用, 可以用 JSON_BACKEND=json 強制使用標準函式庫
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND: str = "orjson" if orjson is not None and os.getenv("JSON_BACKEND", "auto").lower() != "json" else "json"
+
+
+def loads(data: bytes):
+    """
+    解析 response body, 解析失敗時 raise ValueError (orjson.JSONDecodeError 也是 ValueError)
+
+    Args:
+        data (bytes): response 的原始內容
+    """
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
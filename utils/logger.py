@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT_LOGGER_NAME: str = "liquidation_shield"
+LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# 每輪巡邏的 correlation id, 同一輪的 log 可以串在一起
+_cycle_id: contextvars.ContextVar = contextvars.ContextVar("cycle_id", default=None)
+# 多帳戶執行時, 目前巡邏的帳戶名稱
+_account: contextvars.ContextVar = contextvars.ContextVar("account", default=None)
+
+
+def new_cycle_id() -> str:
+    cycle_id = uuid.uuid4().hex[:12]
+    _cycle_id.set(cycle_id)
+    return cycle_id
+
+
+def current_cycle_id() -> str:
+    return _cycle_id.get()
+
+
+def set_account(name: str):
+    _account.set(name)
+
+
+def current_account() -> str:
+    return _account.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """ 一行一筆 JSON, severity 欄位讓 Cloud Logging 可以直接辨識等級 """
+
+    # LogRecord 本身的欄位, 其他透過 extra 傳進來的欄位都會輸出
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "throttle_key"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """ 在 enqueue 之前帶入 cycle_id 與 account, 因為寫出是在背景執行緒, 那時已拿不到呼叫端的 context """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.cycle_id = _cycle_id.get()
+        record.account = _account.get()
+        return True
+
+
+class ThrottleFilter(logging.Filter):
+    """
+    限制重複訊息的頻率: 帶有相同 throttle_key 的 log 在 interval 秒內只輸出一次, 並記錄期間被略過幾次
+
+    Args:
+        interval (float): 同一個 key 最短的輸出間隔
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_emitted = {}  # throttle_key -> (emitted_at, suppressed)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "throttle_key", None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            emitted_at, suppressed = self.last_emitted.get(key, (None, 0))
+            if emitted_at is not None and now - emitted_at < self.interval:
+                self.last_emitted[key] = (emitted_at, suppressed + 1)
+                return False
+            self.last_emitted[key] = (now, 0)
+
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ queue 滿了就丟棄, 巡邏執行緒絕對不會因為 log 被卡住 """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 先把 message 組好, 背景執行緒只負責寫出
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_setup_lock = threading.Lock()
+_listener: QueueListener = None
+
+
+def setup_logging() -> QueueListener:
+    """
+    設定 queue 架構的 logging: 呼叫端只做 enqueue, 由背景執行緒寫到 stdout.
+    等級由 LOG_LEVEL 控制, 格式由 LOG_FORMAT (json / text) 控制, 重複訊息的間隔由 LOG_THROTTLE_INTERVAL 控制
+    """
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if os.getenv("LOG_FORMAT", "json").lower() == "json":
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(cycle_id)s] %(name)s: %(message)s"))
+
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        queue_handler.addFilter(ThrottleFilter(float(os.getenv("LOG_THROTTLE_INTERVAL", "60"))))
+        queue_handler.addFilter(ContextFilter())
+
+        root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+        root_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root_logger.addHandler(queue_handler)
+        root_logger.propagate = False
+
+        _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop) # 結束前把 queue 內剩下的 log 寫完
+        return _listener
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
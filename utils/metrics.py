@@ -0,0 +1,238 @@
+import time
+import bisect
+import threading
+
+# 預設的延遲分桶 (秒), 涵蓋本機 mock 到跨洲的 API 延遲
+DEFAULT_BUCKETS: tuple = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: dict=None) -> str:
+    pairs = list(zip(labelnames, labelvalues)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    """
+    每個執行緒寫入自己的 shard, 記錄時不需要 lock, 只有 /metrics 被抓取時才把所有 shard 加總
+
+    Args:
+        name (str): metric 名稱
+        documentation (str): HELP 說明
+        labelnames (tuple): label 名稱
+    """
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.local = threading.local()
+        self.shards = []
+        self.shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = {}
+            self.local.shard = shard
+            with self.shards_lock: # 每個執行緒只會進來一次
+                self.shards.append(shard)
+        return shard
+
+    def _labelvalues(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _merged(self) -> dict:
+        raise NotImplementedError
+
+    def render(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float=1, **labels):
+        shard = self._shard()
+        key = self._labelvalues(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merged(self) -> dict:
+        merged = {}
+        with self.shards_lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for key, value in list(shard.items()):
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in sorted(self._merged().items())]
+
+
+class Gauge(_Metric):
+    """ 只保留最後一次寫入的值, 所有執行緒共用同一個 dict (單一 key 的賦值在 GIL 下是 atomic) """
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+        self.function = function # 抓取時才計算的 gauge, 回傳 {labelvalues: value}
+
+    def set(self, value: float, **labels):
+        self.values[self._labelvalues(labels)] = value
+
+    def _merged(self) -> dict:
+        if self.function is not None:
+            return self.function()
+        return dict(self.values)
+
+    def render(self) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in sorted(self._merged().items())]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple=(), buckets: tuple=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._labelvalues(labels)
+        state = shard.get(key)
+        if state is None:
+            state = [[0] * (len(self.buckets) + 1), 0.0]
+            shard[key] = state
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def time(self, **labels):
+        """ with METRIC.time(endpoint=...): 量測區塊執行時間 """
+        return _Timer(self, labels)
+
+    def _merged(self) -> dict:
+        merged = {}
+        with self.shards_lock:
+            shards = list(self.shards)
+        for shard in shards:
+            for key, (counts, total) in list(shard.items()):
+                merged_counts, merged_total = merged.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+                merged[key] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+        return merged
+
+    def render(self) -> list:
+        lines = []
+        for key, (counts, total) in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start_time, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """ 收集所有 metric, 並輸出 Prometheus text exposition format """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        # 同名的 metric 只註冊一次, 讓 module 被重複 import 時也安全
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple=(), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple=(), buckets: tuple=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Gateway ========================================================================================================================
+GATEWAY_LATENCY = REGISTRY.histogram(
+    "gateway_request_duration_seconds", "Latency of gateway requests", ("venue", "endpoint"))
+GATEWAY_RESPONSES = REGISTRY.counter(
+    "gateway_responses_total", "Gateway responses by status code, 'error' for transport exceptions", ("venue", "endpoint", "status"))
+GATEWAY_RETRIES = REGISTRY.counter(
+    "gateway_retries_total", "Gateway request attempts beyond the first", ("venue", "endpoint"))
+GATEWAY_CIRCUIT_OPEN = REGISTRY.gauge(
+    "gateway_circuit_open", "1 while the circuit breaker of a host is open", ("host",))
+GATEWAY_RESPONSE_BYTES = REGISTRY.counter(
+    "gateway_response_bytes_total", "Bytes of response bodies received", ("venue", "endpoint"))
+GATEWAY_DECODE_SECONDS = REGISTRY.counter(
+    "gateway_decode_seconds_total", "Time spent decoding response bodies", ("venue", "endpoint"))
+CLOCK_OFFSET = REGISTRY.gauge(
+    "gateway_clock_offset_milliseconds", "Estimated server time minus local time", ("base_url",))
+CLOCK_DRIFT = REGISTRY.gauge(
+    "gateway_clock_drift_milliseconds_per_second", "Estimated drift of the clock offset", ("base_url",))
+
+# Patrol =========================================================================================================================
+PATROL_DURATION = REGISTRY.histogram(
+    "patrol_cycle_duration_seconds", "Duration of one patrol cycle")
+PATROL_FAILURES = REGISTRY.counter(
+    "patrol_cycle_failures_total", "Patrol cycles that raised an exception")
+ADJUSTMENTS = REGISTRY.counter(
+    "margin_adjustments_total", "Isolated margin adjustments", ("symbol", "side", "result"))
+ADJUSTMENT_AMOUNT = REGISTRY.counter(
+    "margin_adjustment_amount_total", "Amount of isolated margin moved", ("symbol", "side", "asset"))
+TRANSFER_CALLS_SAVED = REGISTRY.counter(
+    "transfer_planner_calls_saved_total", "Gateway calls avoided by netting margin moves per cycle", ("asset",))
+POSITION_BOOK_EVENTS = REGISTRY.counter(
+    "position_book_events_total", "Positions added, changed or closed between snapshots", ("event",))
+LIQUIDITY_RESERVE_FLOAT = REGISTRY.gauge(
+    "liquidity_reserve_float", "Free spot balance kept as a pre-staged margin float", ("asset",))
+LIQUIDITY_RESERVE_DRAWS = REGISTRY.counter(
+    "liquidity_reserve_draws_total", "Margin collections served from the float ('hit') or the three defences ('miss')", ("asset", "result"))
+POSITION_MARGIN_RATIO = REGISTRY.gauge(
+    "position_margin_ratio", "Maintenance margin over margin balance from the local margin model, 1 is liquidation", ("symbol",))
+
+_last_success = {} # account -> 上次巡邏成功的時間, 多帳戶時各自計算, 卡住的帳戶不會被其他帳戶蓋過
+
+
+def mark_patrol_success(account: str=None):
+    _last_success[account or ""] = time.time()
+
+
+def _seconds_since_last_success() -> dict:
+    now = time.time()
+    return {(account,): now - last_time for account, last_time in list(_last_success.items())}
+
+
+PATROL_SINCE_SUCCESS = REGISTRY.gauge(
+    "patrol_seconds_since_last_success", "Seconds since the last successful patrol cycle", ("account",),
+    function=_seconds_since_last_success)